@@ -0,0 +1,277 @@
+"""
+Compact profile of the values of a parameter column.
+
+Instead of keeping every column value with its datatype, datetime formats
+and fill value until the second pass, the first pass summarizes a column
+into counters and sets. The profile holds everything infer_values_second_pass
+needs to find the final datatype, datetime format and fill value of the
+column.
+
+Profiles of separate pieces of the same column (chunks of rows, row ranges
+or files read on different machines) are combined with merge(). Merging is
+associative, so pieces can be merged in any grouping. Merge the pieces in
+file order to keep the sample values in file order.
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+# Number of first unique column values kept as sample values
+NUMBER_SAMPLE_VALUES = 5
+
+# Most distinct string values kept for a column. Only need to know if
+# there is a single string value to find an alternate fill value.
+MAX_STRING_VALUES = 100
+
+
+def merge_min(value_1: float | None, value_2: float | None) -> float | None:
+    if value_1 is None:
+        return value_2
+    if value_2 is None:
+        return value_1
+    return min(value_1, value_2)
+
+
+def merge_max(value_1: float | None, value_2: float | None) -> float | None:
+    if value_1 is None:
+        return value_2
+    if value_2 is None:
+        return value_1
+    return max(value_1, value_2)
+
+
+@dataclass
+class ColumnProfile:
+    """
+    Counts and sets describing the values of one parameter column.
+
+    value_type_counts counts the rows of each kind of value. The key is
+    (datatype, datetime formats mask, is fill, value datatype) where the
+    datetime formats mask has a bit set for each datetime format the
+    value matches (see datetime_format_signatures) and is fill is
+    True for a defined possible fill value or a minus 9s value, and value
+    datatype is the numeric or string datatype of a value in a datetime
+    column without a datetime format or fill value (otherwise None).
+
+    datetime_value_features records whether any value has a piece that
+    decides between two datetime formats, like a first number greater
+    than 12 in a d/m/Y or m/d/Y date. See get_datetime_value_features.
+    """
+
+    is_datetime: bool = False
+    row_count: int = 0
+    sample_values: list = field(default_factory=list)
+
+    value_type_counts: Counter = field(default_factory=Counter)
+
+    # OR of the datetime formats masks of all the values
+    formats_mask: int = 0
+
+    # Distinct fill values and the number of rows they're in
+    possible_fill_values: Counter = field(default_factory=Counter)
+    minus_9s: Counter = field(default_factory=Counter)
+
+    # Distinct strings that aren't a fill value (up to MAX_STRING_VALUES)
+    string_values: list = field(default_factory=list)
+    string_count: int = 0
+    has_more_string_values: bool = False
+
+    numeric_count: int = 0
+    numeric_min: float | None = None
+    numeric_max: float | None = None
+    negative_count: int = 0
+    negative_max: float | None = None
+
+    datetime_value_features: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_values(
+        cls,
+        is_datetime: bool,
+        col_vals: list,
+        col_counts: list,
+        stripped_col_vals: pd.Series,
+        datatypes: pd.Series,
+        datetime_formats_masks: np.ndarray,
+        is_possible_fill: pd.Series,
+        is_minus_9s: pd.Series,
+        is_string: pd.Series,
+        numeric_values: pd.Series,
+        value_datatypes: pd.Series,
+        datetime_value_features: dict,
+    ) -> "ColumnProfile":
+        """
+        Make a profile from the classified unique values of a column. All
+        the Series and lists have one entry per unique value and col_counts
+        holds the number of rows each unique value is in.
+
+        Returns:
+            ColumnProfile: column_profile
+        """
+
+        counts = pd.Series(col_counts, index=stripped_col_vals.index, dtype="int64")
+
+        is_fill = is_possible_fill | is_minus_9s
+
+        value_types = pd.DataFrame(
+            {
+                "datatype": datatypes,
+                "formats_mask": datetime_formats_masks,
+                "is_fill": is_fill,
+                "value_datatype": value_datatypes,
+                "count": counts,
+            }
+        )
+
+        value_type_counts = (
+            value_types.groupby(
+                ["datatype", "formats_mask", "is_fill", "value_datatype"],
+                sort=False,
+                dropna=False,
+            )["count"]
+            .sum()
+            .to_dict()
+        )
+
+        # groupby gives NaN for a missing value datatype
+        value_type_counts = Counter(
+            {
+                (
+                    datatype,
+                    int(formats_mask),
+                    bool(value_is_fill),
+                    value_datatype if isinstance(value_datatype, str) else None,
+                ): int(count)
+                for (
+                    datatype,
+                    formats_mask,
+                    value_is_fill,
+                    value_datatype,
+                ), count in value_type_counts.items()
+            }
+        )
+
+        column_profile = cls(
+            is_datetime=is_datetime,
+            row_count=int(counts.sum()),
+            sample_values=list(col_vals[:NUMBER_SAMPLE_VALUES]),
+            value_type_counts=value_type_counts,
+            formats_mask=int(np.bitwise_or.reduce(datetime_formats_masks, initial=0)),
+            possible_fill_values=get_value_counts(
+                stripped_col_vals[is_possible_fill], counts[is_possible_fill]
+            ),
+            minus_9s=get_value_counts(
+                stripped_col_vals[is_minus_9s], counts[is_minus_9s]
+            ),
+            datetime_value_features=dict(datetime_value_features),
+        )
+
+        string_values = list(dict.fromkeys(stripped_col_vals[is_string]))
+        column_profile.string_values = string_values[:MAX_STRING_VALUES]
+        column_profile.has_more_string_values = len(string_values) > MAX_STRING_VALUES
+        column_profile.string_count = int(counts[is_string].sum())
+
+        is_numeric = numeric_values.notna()
+
+        if is_numeric.any():
+            column_profile.numeric_count = int(counts[is_numeric].sum())
+            column_profile.numeric_min = float(numeric_values[is_numeric].min())
+            column_profile.numeric_max = float(numeric_values[is_numeric].max())
+
+            is_negative = is_numeric & (numeric_values < 0)
+
+            if is_negative.any():
+                column_profile.negative_count = int(counts[is_negative].sum())
+                column_profile.negative_max = float(numeric_values[is_negative].max())
+
+        return column_profile
+
+    def merge(self, other: "ColumnProfile") -> "ColumnProfile":
+        """
+        Combine the profile of this piece of a column with the profile of
+        the piece that comes after it.
+
+        Returns:
+            ColumnProfile: merged_profile
+        """
+
+        string_values = list(dict.fromkeys(self.string_values + other.string_values))
+
+        merged_profile = ColumnProfile(
+            is_datetime=self.is_datetime or other.is_datetime,
+            row_count=self.row_count + other.row_count,
+            sample_values=list(
+                dict.fromkeys(self.sample_values + other.sample_values)
+            )[:NUMBER_SAMPLE_VALUES],
+            value_type_counts=self.value_type_counts + other.value_type_counts,
+            formats_mask=self.formats_mask | other.formats_mask,
+            possible_fill_values=self.possible_fill_values + other.possible_fill_values,
+            minus_9s=self.minus_9s + other.minus_9s,
+            string_values=string_values[:MAX_STRING_VALUES],
+            string_count=self.string_count + other.string_count,
+            has_more_string_values=(
+                self.has_more_string_values
+                or other.has_more_string_values
+                or len(string_values) > MAX_STRING_VALUES
+            ),
+            numeric_count=self.numeric_count + other.numeric_count,
+            numeric_min=merge_min(self.numeric_min, other.numeric_min),
+            numeric_max=merge_max(self.numeric_max, other.numeric_max),
+            negative_count=self.negative_count + other.negative_count,
+            negative_max=merge_max(self.negative_max, other.negative_max),
+            datetime_value_features={
+                feature: self.datetime_value_features.get(feature, False)
+                or other.datetime_value_features.get(feature, False)
+                for feature in {
+                    **self.datetime_value_features,
+                    **other.datetime_value_features,
+                }
+            },
+        )
+
+        return merged_profile
+
+
+def get_value_counts(values: pd.Series, counts: pd.Series) -> Counter:
+    """
+    Add up the counts of each distinct value in the order the
+    values first appear
+
+    Returns:
+        Counter: value_counts
+    """
+
+    value_counts = Counter()
+
+    for value, count in zip(values, counts):
+        value_counts[value] += int(count)
+
+    return value_counts
+
+
+def merge_column_profiles(
+    column_profiles: dict | None, other_column_profiles: dict
+) -> dict:
+    """
+    Merge the profiles of the columns of a piece of a file into the
+    profiles of the pieces before it.
+
+    Returns:
+        dict: column_profiles
+    """
+
+    if column_profiles is None:
+        return dict(other_column_profiles)
+
+    merged_profiles = dict(column_profiles)
+
+    for col_name, column_profile in other_column_profiles.items():
+        if col_name in merged_profiles:
+            merged_profiles[col_name] = merged_profiles[col_name].merge(column_profile)
+        else:
+            merged_profiles[col_name] = column_profile
+
+    return merged_profiles
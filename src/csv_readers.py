@@ -0,0 +1,340 @@
+"""
+Read the rows of a CSV or TSV data file in chunks as dataframes of
+strings with one of several readers. CSV files are comma delimited and
+the delimiter of a TSV file is found from its header line (see
+get_file_delimiter).
+
+    - "pandas": pandas.read_csv with the C engine. It reads any file the
+      program can read and is the reader the others are checked against.
+    - "pyarrow": the multithreaded CSV reader of pyarrow, for large files.
+      pyarrow is in requirements.txt. If it isn't installed, large files
+      are read with pandas instead.
+    - "csv": the csv module of the standard library, for small files,
+      where setting up pandas.read_csv takes longer than reading the rows.
+
+Every reader must give the same dataframes as pandas.read_csv with
+dtype=str, keep_default_na=False and skipinitialspace=True, so the
+results don't depend on the reader. The pyarrow and csv readers only
+read the simple files they can read the same way: no quote characters,
+no line breaks of only a carriage return, no byte order mark, column
+names that are unique and not empty once leading spaces are skipped,
+and the same number of fields in every row. They raise
+CsvReaderNotUsable for any other file, which is then read by pandas.
+
+Leading spaces of a field are skipped (skipinitialspace) but not tabs,
+and pandas skips lines with only spaces and tabs as blank lines.
+"""
+
+import csv
+import io
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+except ImportError:
+    pyarrow = None
+
+CSV_READERS = ["pandas", "pyarrow", "csv"]
+
+# Files smaller than this are read with the csv module
+SMALL_FILE_SIZE_BYTES = 64 * 1024
+
+# Files at least this large are read with pyarrow if it's installed
+LARGE_FILE_SIZE_BYTES = 16 * 1024 * 1024
+
+# Bytes at the start of a file read to find its delimiter
+DELIMITER_SNIFF_BYTES = 64 * 1024
+
+# Size of the blocks of a file pyarrow reads at a time
+PYARROW_BLOCK_SIZE_BYTES = 16 * 1024 * 1024
+
+
+class CsvReaderNotUsable(Exception):
+    """A file can't be read by a reader the same way as by pandas"""
+
+
+def get_file_delimiter(filename) -> str:
+    """
+    Get the delimiter of a data file. A CSV file is always comma
+    delimited, as it's always been read. Whether the fields of a TSV
+    file are separated by tabs or commas is found from its first bytes.
+    The header line is used since its fields are names, which are less
+    likely than values to hold the other character. It's tab delimited
+    if it has more tabs than commas.
+
+    Returns:
+        str: delimiter
+    """
+
+    if Path(filename).suffix != ".tsv":
+        return ","
+
+    with open(filename, "rb") as f:
+        first_bytes = f.read(DELIMITER_SNIFF_BYTES)
+
+    header = first_bytes.replace(b"\r", b"\n").split(b"\n", 1)[0]
+
+    if header.count(b"\t") > header.count(b","):
+        return "\t"
+
+    return ","
+
+
+def get_csv_reader(
+    file_size: int, encoding: str, is_simple: bool, csv_reader: str | None = None
+) -> str:
+    """
+    Choose the reader of a file by its size, unless csv_reader is given.
+    Files that aren't simple (quote characters or line breaks of only a
+    carriage return) are always read by pandas, and pyarrow is only used
+    for UTF-8 files.
+
+    Returns:
+        str: csv_reader
+    """
+
+    if not is_simple:
+        return "pandas"
+
+    if csv_reader is not None:
+        if csv_reader == "pyarrow" and pyarrow is None:
+            return "pandas"
+
+        return csv_reader
+
+    if file_size < SMALL_FILE_SIZE_BYTES:
+        return "csv"
+
+    if file_size >= LARGE_FILE_SIZE_BYTES and encoding == "utf-8" and pyarrow:
+        return "pyarrow"
+
+    return "pandas"
+
+
+def get_column_names(header: list) -> list:
+    """
+    Get the column names of a header with leading spaces skipped, the
+    same as pandas, if they are unique and not empty
+
+    Returns:
+        list: column_names
+    """
+
+    column_names = [name.lstrip(" ") for name in header]
+
+    if "" in column_names or len(set(column_names)) < len(column_names):
+        raise CsvReaderNotUsable("column names that pandas renames")
+
+    return column_names
+
+
+def read_pandas_chunks(
+    filename,
+    encoding: str,
+    column_indices: list | None,
+    chunk_size_rows: int,
+    number_rows: int | None,
+    delimiter: str = ",",
+):
+    """
+    Read a file in chunks of rows with pandas.read_csv
+
+    Returns:
+        generator: chunks
+    """
+
+    with pd.read_csv(
+        filename,
+        encoding=encoding,
+        dtype=str,
+        keep_default_na=False,
+        skipinitialspace=True,
+        sep=delimiter,
+        usecols=column_indices,
+        chunksize=chunk_size_rows,
+        nrows=number_rows,
+    ) as reader:
+        yield from reader
+
+
+def read_csv_module_chunks(
+    filename,
+    encoding: str,
+    column_indices: list | None,
+    chunk_size_rows: int,
+    number_rows: int | None,
+    delimiter: str = ",",
+):
+    """
+    Read a small file all at once with the csv module
+
+    Returns:
+        generator: chunks
+    """
+
+    if isinstance(filename, io.IOBase):
+        text = filename.read().decode(encoding)
+    else:
+        with open(filename, "r", encoding=encoding, newline="") as f:
+            text = f.read()
+
+    if '"' in text or "\0" in text or text.startswith("\ufeff"):
+        raise CsvReaderNotUsable("quote characters, null bytes or a byte order mark")
+
+    if "\r" in text.replace("\r\n", ""):
+        raise CsvReaderNotUsable("line breaks of only a carriage return")
+
+    # A line with only spaces and tabs is one field of them, and is
+    # skipped like a blank line
+    rows = [
+        row
+        for row in csv.reader(
+            io.StringIO(text, newline=""), delimiter=delimiter, skipinitialspace=True
+        )
+        if row and not (len(row) == 1 and row[0].strip(" \t") == "")
+    ]
+
+    if not rows:
+        raise CsvReaderNotUsable("no header")
+
+    column_names = get_column_names(rows[0])
+    rows = rows[1:]
+
+    if any(len(row) != len(column_names) for row in rows):
+        raise CsvReaderNotUsable("rows with a different number of fields")
+
+    if number_rows is not None:
+        rows = rows[:number_rows]
+
+    chunk = pd.DataFrame(rows, columns=column_names, dtype=object)
+
+    if column_indices is not None:
+        chunk = chunk.iloc[:, column_indices]
+
+    for start in range(0, len(chunk), chunk_size_rows):
+        yield chunk.iloc[start : start + chunk_size_rows].reset_index(drop=True)
+
+
+def read_pyarrow_chunks(
+    filename,
+    encoding: str,
+    column_indices: list | None,
+    chunk_size_rows: int,
+    number_rows: int | None,
+    delimiter: str = ",",
+):
+    """
+    Read a large file in blocks with the pyarrow CSV reader. Quote
+    characters aren't looked for (the file has none) and leading spaces
+    are skipped after the fields are read.
+
+    Returns:
+        generator: chunks
+    """
+
+    if pyarrow is None or encoding != "utf-8" or number_rows is not None:
+        raise CsvReaderNotUsable("pyarrow isn't installed or the file isn't UTF-8")
+
+    if isinstance(filename, io.IOBase):
+        f = filename
+    else:
+        f = open(filename, "rb")
+
+    try:
+        header_text = f.readline().decode(encoding)
+
+        if header_text.startswith("\ufeff"):
+            raise CsvReaderNotUsable("a byte order mark")
+
+        # A line break of only "\r" isn't the end of a line to readline
+        if "\r" in header_text.rstrip("\r\n"):
+            raise CsvReaderNotUsable("line breaks of only a carriage return")
+
+        header = header_text.rstrip("\r\n").split(delimiter)
+        column_names = get_column_names(header)
+
+        # A line with only spaces is one empty field to pyarrow but a
+        # blank line to pandas, which can't be told apart with one column
+        if len(column_names) < 2:
+            raise CsvReaderNotUsable("one column")
+
+        if column_indices is not None:
+            header = [header[index] for index in column_indices]
+            column_names = [column_names[index] for index in column_indices]
+
+        try:
+            # The header line was read, so the rows are read from the
+            # file with the column names given
+            reader = pyarrow.csv.open_csv(
+                f,
+                read_options=pyarrow.csv.ReadOptions(
+                    use_threads=True,
+                    block_size=PYARROW_BLOCK_SIZE_BYTES,
+                    column_names=header_text.rstrip("\r\n").split(delimiter),
+                    autogenerate_column_names=False,
+                ),
+                parse_options=pyarrow.csv.ParseOptions(
+                    delimiter=delimiter, quote_char=False, ignore_empty_lines=True
+                ),
+                convert_options=pyarrow.csv.ConvertOptions(
+                    column_types={name: pyarrow.string() for name in header},
+                    include_columns=header,
+                    null_values=[],
+                    strings_can_be_null=False,
+                ),
+            )
+
+            for batch in reader:
+                columns = {
+                    column_name: pyarrow.compute.utf8_ltrim(
+                        batch.column(i), characters=" "
+                    ).to_numpy(zero_copy_only=False)
+                    for i, column_name in enumerate(column_names)
+                }
+
+                chunk = pd.DataFrame(columns, dtype=object)
+
+                for start in range(0, len(chunk), chunk_size_rows):
+                    yield chunk.iloc[start : start + chunk_size_rows].reset_index(
+                        drop=True
+                    )
+
+        except pyarrow.ArrowInvalid as e:
+            raise CsvReaderNotUsable(str(e))
+
+    finally:
+        if f is not filename:
+            f.close()
+
+
+def read_csv_chunks(
+    filename,
+    encoding: str,
+    column_indices: list | None,
+    chunk_size_rows: int,
+    number_rows: int | None,
+    csv_reader: str = "pandas",
+    delimiter: str = ",",
+):
+    """
+    Read a file in chunks of rows as dataframes of strings with a reader.
+    filename can also be an open binary file. The fields are separated
+    by delimiter (see get_file_delimiter).
+
+    Returns:
+        generator: chunks
+    """
+
+    read_chunks = {
+        "pandas": read_pandas_chunks,
+        "pyarrow": read_pyarrow_chunks,
+        "csv": read_csv_module_chunks,
+    }[csv_reader]
+
+    return read_chunks(
+        filename, encoding, column_indices, chunk_size_rows, number_rows, delimiter
+    )
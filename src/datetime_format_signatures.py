@@ -0,0 +1,233 @@
+"""
+Index the possible datetime formats by the shape of the values they can match.
+
+Trying every format in possible_datetime_formats.txt with datetime.strptime
+raises an exception for every format that doesn't match, and most of them
+can't match a value just by looking at its shape. A shape signature of a value
+replaces each digit with a "d", each letter with an "a" and each whitespace
+character with a space and keeps any other characters, so "2019-03-04"
+becomes "dddd-dd-dd" and "May 5 2019" becomes "aaa d dddd".
+
+Each datetime format is turned into a regular expression over these
+signatures. The patterns accept at least every value strptime could parse
+with the format (like one or two digits for %m), so only formats whose
+pattern matches the value signature need to be checked with strptime.
+The candidate formats for a signature are found once and then looked up.
+
+The formats a value matches are kept as a bitmask over the distinct
+formats of the file, with one bit for each format in the order of the
+file. The formats of a whole column are the OR of its value masks.
+"""
+
+import re
+
+# Signature patterns of the strptime directives. They follow the
+# regular expressions in the _strptime module but only use the
+# signature characters.
+DIRECTIVE_SIGNATURE_PATTERNS = {
+    "Y": "d{4}",
+    "G": "d{4}",
+    "y": "d{2}",
+    "m": "d{1,2}",
+    "d": "(?:d{1,2}| d)",
+    "H": "d{1,2}",
+    "I": "d{1,2}",
+    "M": "d{1,2}",
+    "S": "d{1,2}",
+    "U": "d{1,2}",
+    "W": "d{1,2}",
+    "V": "d{1,2}",
+    "j": "d{1,3}",
+    "f": "d{1,6}",
+    "u": "d",
+    "w": "d",
+    "a": "a+",
+    "A": "a+",
+    "b": "a+",
+    "B": "a+",
+    "p": "a+",
+    "z": r"(?:[+-]dd:?dd(?::?dd(?:\.d{1,6})?)?|a)",
+    # Time zone names depend on the system, so allow anything
+    "Z": ".+",
+    "%": "%",
+}
+
+# Limit the number of signatures remembered for a set of formats
+# so a column of free text can't grow it without bound
+MAX_CACHED_SIGNATURES = 100000
+
+
+def get_signature_char(char: str) -> str:
+    if char.isdecimal():
+        return "d"
+    elif char.isalpha():
+        return "a"
+    elif char.isspace():
+        return " "
+    else:
+        return char
+
+
+ASCII_SIGNATURE_TABLE = str.maketrans(
+    {chr(code): get_signature_char(chr(code)) for code in range(128)}
+)
+
+
+def get_value_signature(value: str) -> str:
+    """
+    Get the shape signature of a column value, so "2019-03-04"
+    becomes "dddd-dd-dd"
+
+    Returns:
+        str: signature
+    """
+
+    if value.isascii():
+        return value.translate(ASCII_SIGNATURE_TABLE)
+
+    # strptime matches any unicode digit with \d, so check each character
+    return "".join(get_signature_char(char) for char in value)
+
+
+def get_format_signature_pattern(datetime_format: str) -> re.Pattern:
+    """
+    Convert a datetime format into a regular expression matching the
+    signatures of all the values strptime could parse with the format.
+    Any directive without a known pattern matches anything so a format
+    is never left out.
+
+    Returns:
+        re.Pattern: signature_pattern
+    """
+
+    pattern_pieces = []
+
+    i = 0
+    while i < len(datetime_format):
+        char = datetime_format[i]
+
+        if char == "%" and i + 1 < len(datetime_format):
+            directive = datetime_format[i + 1]
+            pattern_pieces.append(DIRECTIVE_SIGNATURE_PATTERNS.get(directive, ".*"))
+            i += 2
+            continue
+
+        signature_char = get_signature_char(char)
+
+        if signature_char == " ":
+            # strptime matches a run of whitespace in a format with \s+
+            if not pattern_pieces or pattern_pieces[-1] != " +":
+                pattern_pieces.append(" +")
+        elif signature_char in ["d", "a"]:
+            pattern_pieces.append(signature_char)
+        else:
+            pattern_pieces.append(re.escape(char))
+
+        i += 1
+
+    return re.compile("".join(pattern_pieces))
+
+
+def build_datetime_formats_index(datetime_formats: list) -> dict:
+    """
+    Build the index of datetime formats by value signature. The
+    signature patterns are made once for each format in the list, and
+    the candidate formats of each signature seen are added as they're
+    looked up.
+
+    Returns:
+        dict: datetime_formats_index
+    """
+
+    # The formats file can list a format more than once,
+    # so only give each distinct format a bit
+    mask_formats = list(dict.fromkeys(datetime_formats))
+
+    datetime_formats_index = {
+        "formats": list(datetime_formats),
+        "signature_patterns": [
+            get_format_signature_pattern(datetime_format)
+            for datetime_format in datetime_formats
+        ],
+        "candidates": {},
+        "mask_formats": mask_formats,
+        "format_bits": {
+            datetime_format: 1 << i for i, datetime_format in enumerate(mask_formats)
+        },
+    }
+
+    return datetime_formats_index
+
+
+def get_candidate_datetime_formats(value: str, datetime_formats_index: dict) -> list:
+    """
+    Get the datetime formats that could match a value from the shape
+    of the value. The formats are in the same order as the formats
+    file, so checking them gives the same matches as checking every
+    format.
+
+    Returns:
+        list: candidate_formats
+    """
+
+    signature = get_value_signature(value)
+
+    candidates = datetime_formats_index["candidates"]
+
+    try:
+        return candidates[signature]
+    except KeyError:
+        pass
+
+    candidate_formats = [
+        datetime_format
+        for datetime_format, signature_pattern in zip(
+            datetime_formats_index["formats"],
+            datetime_formats_index["signature_patterns"],
+        )
+        if signature_pattern.fullmatch(signature)
+    ]
+
+    if len(candidates) >= MAX_CACHED_SIGNATURES:
+        candidates.clear()
+
+    candidates[signature] = candidate_formats
+
+    return candidate_formats
+
+
+def get_datetime_formats_mask(datetime_formats: list, datetime_formats_index: dict) -> int:
+    """
+    Get the bitmask of a list of datetime formats. A None format
+    (no format matched) has no bit.
+
+    Returns:
+        int: formats_mask
+    """
+
+    format_bits = datetime_formats_index["format_bits"]
+
+    formats_mask = 0
+
+    for datetime_format in datetime_formats:
+        if datetime_format is not None:
+            formats_mask |= format_bits[datetime_format]
+
+    return formats_mask
+
+
+def get_mask_datetime_formats(formats_mask: int, datetime_formats_index: dict) -> list:
+    """
+    Get the datetime formats of a bitmask in the order of the formats file
+
+    Returns:
+        list: datetime_formats
+    """
+
+    datetime_formats = []
+
+    for i, datetime_format in enumerate(datetime_formats_index["mask_formats"]):
+        if formats_mask >> i & 1:
+            datetime_formats.append(datetime_format)
+
+    return datetime_formats
@@ -0,0 +1,121 @@
+"""
+Find the data files of the data folder while they are being processed.
+
+Walking a large data folder on a network mount can take minutes, so
+instead of listing every file before the workers start, the folder is
+walked in a thread of the main process that puts each data file it
+finds into a bounded queue. The files are taken from the queue as the
+worker pool needs them, so the first file is processed while the rest
+of the folder is still being walked, and the walk waits if it gets too
+far ahead of the workers.
+
+Data files are the CSV and TSV files directly in a dataURL folder,
+the same files as the glob "**/dataURL/*.csv" and "**/dataURL/*.tsv".
+"""
+
+import os
+import queue
+import threading
+from pathlib import Path
+
+# Name of the folders the data files are in
+DATA_FOLDER_NAME = "dataURL"
+
+# Most files found but not yet taken from the queue
+FILE_QUEUE_SIZE = 1000
+
+
+def get_folder_data_files(folder: Path, file_names: list) -> list:
+    """
+    Get the data files of a dataURL folder. TSV files are read directly,
+    so a CSV file next to a TSV file with the same name, which was
+    converted from it, isn't read as well.
+
+    Returns:
+        list: data_files
+    """
+
+    tsv_names = {name for name in file_names if name.endswith(".tsv")}
+
+    data_files = [
+        folder / name
+        for name in file_names
+        if name in tsv_names
+        or (name.endswith(".csv") and f"{name[:-len('.csv')]}.tsv" not in tsv_names)
+    ]
+
+    return data_files
+
+
+def walk_data_files(data_folder: str):
+    """
+    Walk the data folder with os.scandir and yield each data file as it's
+    found. The entries of a folder are sorted, so the files are found in
+    the same order every run. Like the glob, links to folders aren't
+    followed.
+
+    Returns:
+        generator: data_files
+    """
+
+    folders = [Path(data_folder)]
+
+    while folders:
+        folder = folders.pop()
+
+        try:
+            with os.scandir(folder) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        if folder.name == DATA_FOLDER_NAME:
+            file_names = [entry.name for entry in entries if entry.is_file()]
+
+            yield from get_folder_data_files(folder, file_names)
+
+        subfolders = [
+            Path(entry.path)
+            for entry in entries
+            if entry.is_dir(follow_symlinks=False)
+        ]
+
+        # Walk the subfolders in order
+        folders.extend(reversed(subfolders))
+
+
+class FileDiscovery:
+    """
+    The data files of a data folder, found by a thread that walks the
+    folder while the files are taken from its queue. Iterate over it to
+    get the files in the order they are found.
+    """
+
+    def __init__(self, data_folder: str, queue_size: int = FILE_QUEUE_SIZE):
+        self.data_folder = data_folder
+        self.files = queue.Queue(maxsize=queue_size)
+        self.number_files = 0
+        self.error = None
+
+        self.thread = threading.Thread(target=self.walk, daemon=True)
+        self.thread.start()
+
+    def walk(self):
+        try:
+            for file in walk_data_files(self.data_folder):
+                self.files.put(file)
+                self.number_files += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            # Marks the end of the files
+            self.files.put(None)
+
+    def __iter__(self):
+        while (file := self.files.get()) is not None:
+            yield file
+
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,542 @@
+"""
+Group the data files into tasks for the worker pool.
+
+Files are made into tasks as they are found (see file_discovery), so
+the workers start on the first files while the data folder is still
+being walked. Small files are grouped into batches so each one doesn't
+need its own round trip between the main process and a worker.
+
+Since the files are only known as the walk finds them, the tasks can't
+all be sorted largest first before any are handed out. Instead the
+worker pool hands out the largest of the tasks made so far that are
+waiting, up to a bounded number (see get_task_size and
+supervised_pool). When the walk is ahead of the workers, that's close
+to largest first, so a large file doesn't start after the small files
+and finish long after them. When the workers are ahead of the walk,
+each task starts as soon as it's made.
+
+A file large enough to take much longer than the others is split into
+parts by its columns, so several workers can infer the columns of one
+file at the same time. Each part parses the whole file but only keeps
+its own columns, so no column data is sent between processes. Parsing
+is repeated by every part, so it grows with the number of parts, but
+inferring the columns, which takes most of the time, is split. The
+first part also checks the number of fields of every row, which pandas
+doesn't do when only some columns are kept. The results of the parts
+are put back together in the main process.
+
+A large file without enough columns to split is split into ranges of
+rows instead. The ranges are byte ranges of the file that start and end
+at a line break, and each one is read with the header line of the file
+in front of it. Only UTF-8 files without any quote characters can be
+split into rows, since a quoted value can have a line break in it and a
+line break is then not always the end of a row. The main process only
+checks the start of a file before splitting it, so a large file isn't
+read once more before its parts start. Each part checks its own bytes
+as it reads them (see FileRangeReader), and if any part finds a quote
+character or bytes that aren't UTF-8, the file is read again as a whole
+instead.
+
+A file that only had rows appended since its last run (see
+profile_states) is read from the end of the rows read last time, and
+the appended rows are split into ranges the same way if there are many.
+"""
+
+import codecs
+import hashlib
+import io
+import math
+import multiprocessing
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+# Files smaller than this are grouped together into one task
+SMALL_FILE_SIZE_BYTES = 256 * 1024
+
+# A batch of small files is closed once it has this many bytes
+# or this many files
+BATCH_SIZE_BYTES = 4 * 1024 * 1024
+BATCH_MAX_FILES = 50
+
+# Files at least this large are split into groups of columns or
+# ranges of rows when there is more than one worker process
+SPLIT_FILE_SIZE_BYTES = 100 * 1024 * 1024
+
+# Fewest columns in a group of columns of a split file
+MIN_COLUMNS_PER_GROUP = 4
+
+# Bytes at the start of a file checked before splitting it into rows
+SPLIT_CHECK_BYTES = 1024 * 1024
+
+
+class RowsNotSplittable(Exception):
+    """A range of rows of a file can't be read on its own"""
+
+
+@dataclass
+class FileTask:
+    """
+    A data file or a part of a data file to process. A part of a file
+    only has the columns with the positions in column_indices or only
+    the rows in the (start, end) byte_range. The part and number of
+    parts tell the main process when it has the results of every part
+    of a file. If keep_profile_state is True, the column profiles of
+    the file are kept so its appended rows can be read on their own
+    next time. parameter_official_names are the official names of the
+    parameters of the file's dataset, read in the main process, or None
+    if the worker has to read them.
+    """
+
+    file: Path
+    size: int
+    column_indices: list | None = None
+    part: int = 0
+    number_parts: int = 1
+    byte_range: tuple | None = None
+    keep_profile_state: bool = False
+    parameter_official_names: dict | None = None
+
+
+def get_file_size(file: Path) -> int:
+    try:
+        return os.stat(file).st_size
+    except OSError:
+        # Let the worker report a file that can't be read
+        return 0
+
+
+def get_column_groups(number_columns: int, number_groups: int) -> list:
+    """
+    Split the column positions into groups of consecutive columns of
+    about the same size.
+
+    Returns:
+        list: column_groups
+    """
+
+    columns_per_group = math.ceil(number_columns / number_groups)
+
+    column_groups = [
+        list(range(start, min(start + columns_per_group, number_columns)))
+        for start in range(0, number_columns, columns_per_group)
+    ]
+
+    return column_groups
+
+
+def starts_utf8_without_quotes(file: Path) -> bool:
+    """
+    Check that the first SPLIT_CHECK_BYTES of a file are UTF-8 without
+    quote characters, so a file that can't be split into rows usually
+    isn't. The rest of the file is checked by the parts as they read it.
+
+    Returns:
+        bool: starts_utf8_without_quotes
+    """
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    try:
+        with open(file, "rb") as f:
+            block = f.read(SPLIT_CHECK_BYTES)
+
+        # A character can be cut off at the end of the block
+        decoder.decode(block)
+
+    except (OSError, UnicodeDecodeError):
+        return False
+
+    return b'"' not in block
+
+
+def get_file_row_ranges(file: Path, number_ranges: int) -> list | None:
+    """
+    Split the rows of a file after the header line into byte ranges of
+    about the same size that start and end at a line break. If the file
+    can't be split into rows, return None.
+
+    Returns:
+        list | None: byte_ranges
+    """
+
+    if not starts_utf8_without_quotes(file):
+        return None
+
+    with open(file, "rb") as f:
+        data_start = len(f.readline())
+
+    byte_ranges = split_byte_range(
+        file, data_start, get_file_size(file), number_ranges
+    )
+
+    if len(byte_ranges) < 2:
+        return None
+
+    return byte_ranges
+
+
+def split_byte_range(file: Path, start: int, end: int, number_ranges: int) -> list:
+    """
+    Split the rows of a file from start to end into byte ranges of about
+    the same size. start must be the start of a line.
+
+    Returns:
+        list: byte_ranges
+    """
+
+    boundaries = [start]
+
+    with open(file, "rb") as f:
+        for i in range(1, number_ranges):
+            target = start + (end - start) * i // number_ranges
+
+            # Move to the start of the line after the line break
+            # at or after the target
+            f.seek(max(target - 1, start))
+            f.readline()
+
+            boundary = f.tell()
+
+            if boundaries[-1] < boundary < end:
+                boundaries.append(boundary)
+
+    boundaries.append(end)
+
+    byte_ranges = list(zip(boundaries[:-1], boundaries[1:]))
+
+    return byte_ranges
+
+
+class FileRangeReader(io.RawIOBase):
+    """
+    Read the header line of a file followed by a byte range of the file,
+    so the rows of the range can be read in like a file of their own.
+    The bytes are checked as they are read, and RowsNotSplittable is
+    raised if they have a quote character or aren't UTF-8.
+
+    The bytes of the range are also hashed as they are read, with the
+    header line if the range starts right after it, so the hashes of the
+    ranges of a file follow each other from its start (see
+    get_segments_hash). The last byte is kept to tell if the range ends
+    with a line break.
+    """
+
+    def __init__(self, file: Path, start: int, end: int):
+        self.f = open(file, "rb")
+        self.header = self.f.readline()
+        self.f.seek(start)
+        self.remaining = end - start
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.range_hash = hashlib.sha256()
+        self.last_byte = b""
+
+        if start == len(self.header):
+            self.range_hash.update(self.header)
+
+    def readable(self) -> bool:
+        return True
+
+    def check_bytes(self, data: bytes, final: bool = False):
+        if b'"' in data:
+            raise RowsNotSplittable("a quote character")
+
+        try:
+            self.decoder.decode(data, final)
+        except UnicodeDecodeError:
+            raise RowsNotSplittable("bytes that aren't UTF-8")
+
+    def readinto(self, buffer) -> int:
+        if self.header:
+            size = min(len(buffer), len(self.header))
+            self.check_bytes(self.header[:size])
+            buffer[:size] = self.header[:size]
+            self.header = self.header[size:]
+            return size
+
+        data = self.f.read(min(len(buffer), self.remaining))
+
+        # The range must also end at the end of a character
+        self.check_bytes(data, final=not data)
+
+        self.range_hash.update(data)
+
+        if data:
+            self.last_byte = data[-1:]
+
+        buffer[: len(data)] = data
+        self.remaining -= len(data)
+
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def open_file_range(file: Path, byte_range: tuple) -> io.BufferedReader:
+    """
+    Open a range of rows of a file with the header line in front of it
+
+    Returns:
+        io.BufferedReader: file_range
+    """
+
+    start, end = byte_range
+
+    return io.BufferedReader(FileRangeReader(file, start, end))
+
+
+def get_appended_file_tasks(
+    file: Path, byte_range: tuple, number_processes: int
+) -> list:
+    """
+    Get the tasks to read the rows appended to a file in the byte range
+    from the end of the rows read last time to the end of the file. If
+    there are many appended rows, they are split into ranges of rows.
+
+    Returns:
+        list: file_tasks
+    """
+
+    start, end = byte_range
+
+    if number_processes > 1 and end - start >= SPLIT_FILE_SIZE_BYTES:
+        byte_ranges = split_byte_range(file, start, end, number_processes)
+    else:
+        byte_ranges = [byte_range]
+
+    file_tasks = [
+        FileTask(
+            file,
+            end - start,
+            part=part,
+            number_parts=len(byte_ranges),
+            byte_range=(start, end),
+        )
+        for part, (start, end) in enumerate(byte_ranges)
+    ]
+
+    return file_tasks
+
+
+def get_split_file_tasks(
+    file: Path,
+    size: int,
+    number_columns: int | None,
+    number_processes: int,
+    split_columns: bool = True,
+    split_rows: bool = False,
+) -> list:
+    """
+    Split a large file into one task for each group of its columns if
+    split_columns is True. A file that doesn't have enough columns is
+    split into ranges of rows if split_rows is True, or else stays one
+    task.
+
+    Returns:
+        list: file_tasks
+    """
+
+    if number_columns is None:
+        return [FileTask(file, size)]
+
+    if split_columns:
+        number_groups = min(number_processes, number_columns // MIN_COLUMNS_PER_GROUP)
+    else:
+        number_groups = 1
+
+    if number_groups < 2:
+        byte_ranges = None
+
+        if split_rows:
+            byte_ranges = get_file_row_ranges(file, number_processes)
+
+        if byte_ranges is None:
+            return [FileTask(file, size)]
+
+        file_tasks = [
+            FileTask(
+                file,
+                end - start,
+                part=part,
+                number_parts=len(byte_ranges),
+                byte_range=(start, end),
+            )
+            for part, (start, end) in enumerate(byte_ranges)
+        ]
+
+        return file_tasks
+
+    column_groups = get_column_groups(number_columns, number_groups)
+
+    file_tasks = [
+        FileTask(
+            file,
+            # Estimate the work of a part by its share of the columns
+            size * len(column_indices) // number_columns,
+            column_indices,
+            part,
+            len(column_groups),
+        )
+        for part, column_indices in enumerate(column_groups)
+    ]
+
+    return file_tasks
+
+
+def get_file_parts(
+    file: Path,
+    number_processes: int = 1,
+    get_number_columns=None,
+    split_columns: bool = True,
+    split_rows: bool = False,
+    appended_byte_range: tuple | None = None,
+    keep_profile_states: bool = False,
+) -> list:
+    """
+    Get the FileTasks of a file, more than one if it's split into parts
+    or only the rows in appended_byte_range are read (see
+    get_appended_file_tasks).
+
+    Returns:
+        list: file_parts
+    """
+
+    size = get_file_size(file)
+
+    if appended_byte_range is not None:
+        file_parts = get_appended_file_tasks(
+            file, appended_byte_range, number_processes
+        )
+    elif (
+        get_number_columns is not None
+        and number_processes > 1
+        and size >= SPLIT_FILE_SIZE_BYTES
+    ):
+        file_parts = get_split_file_tasks(
+            file,
+            size,
+            get_number_columns(file),
+            number_processes,
+            split_columns,
+            split_rows,
+        )
+    else:
+        file_parts = [FileTask(file, size)]
+
+    if keep_profile_states:
+        for file_task in file_parts:
+            if file_task.column_indices is None:
+                file_task.keep_profile_state = True
+
+    return file_parts
+
+
+def get_file_tasks(
+    files,
+    number_processes: int = 1,
+    get_number_columns=None,
+    split_columns: bool = True,
+    split_rows: bool = False,
+    appended_byte_ranges: dict | None = None,
+    keep_profile_states: bool = False,
+    get_parameter_names=None,
+):
+    """
+    Get the tasks of the files as they come from the files iterable,
+    which can still be finding them (see file_discovery). A file that
+    isn't small is its own task, or a task for each part if it's split,
+    and small files are grouped into batches. Each task is a list of
+    FileTasks.
+
+    If get_number_columns is given, it is called with a large file to get
+    its number of columns (or None if it can't be read) so the file can
+    be split into groups of columns (if split_columns is True), or into
+    ranges of rows if split_rows is True and it isn't split by columns.
+
+    Files in appended_byte_ranges only have the rows in their byte range
+    read (see get_appended_file_tasks). A file must be in it by the time
+    the file comes from the files iterable. If keep_profile_states is
+    True, the column profiles of the files are kept unless they are
+    split into groups of columns.
+
+    If get_parameter_names is given, it is called with each file to get
+    the parameter official names sent with the tasks of the file.
+
+    Returns:
+        generator: file_tasks
+    """
+
+    if appended_byte_ranges is None:
+        appended_byte_ranges = {}
+
+    batch = []
+    batch_size = 0
+
+    for file in files:
+        file_parts = get_file_parts(
+            file,
+            number_processes,
+            get_number_columns,
+            split_columns,
+            split_rows,
+            appended_byte_ranges.get(file),
+            keep_profile_states,
+        )
+
+        if get_parameter_names is not None:
+            parameter_official_names = get_parameter_names(file)
+
+            for file_task in file_parts:
+                file_task.parameter_official_names = parameter_official_names
+
+        for file_task in file_parts:
+            if file_task.size >= SMALL_FILE_SIZE_BYTES or file_task.number_parts > 1:
+                yield [file_task]
+                continue
+
+            batch.append(file_task)
+            batch_size += file_task.size
+
+            if batch_size >= BATCH_SIZE_BYTES or len(batch) >= BATCH_MAX_FILES:
+                yield batch
+                batch = []
+                batch_size = 0
+
+    if batch:
+        yield batch
+
+
+def get_task_size(file_task_list: list) -> int:
+    """
+    Get the size of a task from get_file_tasks, to hand out the largest
+    waiting task first
+
+    Returns:
+        int: task_size
+    """
+
+    return sum(file_task.size for file_task in file_task_list)
+
+
+def get_number_processes(
+    number_processes: int | None, number_tasks: int | None = None
+) -> int:
+    """
+    Get the number of worker processes. If it isn't given, leave two
+    cores free for the main process and the system, but always use at
+    least one. There's no need for more workers than tasks, if the
+    number of tasks is known.
+
+    Returns:
+        int: number_processes
+    """
+
+    if number_processes is None:
+        number_processes = multiprocessing.cpu_count() - 2
+
+    if number_tasks is not None:
+        number_processes = min(number_processes, number_tasks)
+
+    return max(number_processes, 1)
@@ -80,46 +80,165 @@ import os
 from pathlib import Path
 import re
 import pandas as pd
+import numpy as np
 import json
 import math
 from datetime import datetime
 import time
 import string
-import multiprocessing
 import errno
+import argparse
+import itertools
+import functools
+import shutil
 
 from get_fill_values import *
+from column_profile import ColumnProfile, merge_column_profiles
+from run_logs import (
+    write_log,
+    start_recording_logs,
+    stop_recording_logs,
+    replay_logs,
+    set_log_shard,
+    get_log_filename,
+    record_logs_only,
+    flush_logs,
+    close_logs,
+)
+from result_cache import (
+    ResultCache,
+    MAX_CACHE_SIZE_BYTES,
+    get_segments_hash,
+    get_settings_hash,
+)
+from profile_states import ProfileStore, get_profile_state, get_appended_byte_range
+from run_manifest import RunManifest
+from shards import get_file_shard, get_shard_filename, merge_shards
+from supervised_pool import ItemError, SupervisedPool, report_progress
+from file_discovery import FileDiscovery
+from run_metrics import (
+    enable_metrics,
+    start_recording_metrics,
+    stop_recording_metrics,
+    time_stage,
+    add_count,
+    is_recording_metrics,
+    add_datetime_format_counts,
+    write_metrics,
+    close_metrics,
+    write_metrics_report,
+)
+from worker_profiles import (
+    start_profiling,
+    profile_file,
+    stop_profiling,
+    write_profile_report,
+)
+from csv_readers import (
+    CSV_READERS,
+    CsvReaderNotUsable,
+    get_csv_reader,
+    get_file_delimiter,
+    read_csv_chunks,
+)
+from file_scheduler import (
+    FileTask,
+    RowsNotSplittable,
+    get_file_size,
+    get_file_tasks,
+    get_task_size,
+    get_number_processes,
+    open_file_range,
+)
+from datetime_format_signatures import (
+    build_datetime_formats_index,
+    get_candidate_datetime_formats,
+    get_datetime_formats_mask,
+    get_mask_datetime_formats,
+)
 
 # import chardet
 # from chardet import detect
-# import codecs
+import codecs
+import hashlib
 
 # Set this to True if want to use program with just a subset of rows in files
 TESTING = False
 NUMBER_TESTING_ROWS = 1000
 
+# Files are read in this many rows at a time so the memory used
+# depends on the chunk size and not the file size
+CHUNK_SIZE_ROWS = 100000
+
+# Reader to read every file with (see csv_readers). If None, the
+# reader is chosen by the size of the file.
+CSV_READER = None
+
+# Size of the blocks a file is read in to find its encoding
+ENCODING_BLOCK_SIZE_BYTES = 8 * 1024 * 1024
+
+# Bytes that aren't characters in Windows-1252
+WINDOWS_1252_UNDEFINED_BYTES = [b"\x81", b"\x8d", b"\x8f", b"\x90", b"\x9d"]
+
 # Set names of folders and files used
 top_data_folder = f"../data"
 
 parameters_overview_file = "../logs/parameters_overview.txt"
 parameters_summary_file = "../output/parameters_summary.json"
 
+# Files finished by a program run are recorded here so it can be resumed
+run_manifest_file = "../output/run_manifest.jsonl"
+
 log_encodings_not_utf8_file = "../logs/log_encodings_not_utf8.txt"
 log_no_results_file = "../logs/log_no_results_returned_files.txt"
+log_limit_exceeded_file = "../logs/log_limit_exceeded_files.txt"
+log_failed_file = "../logs/log_failed_files.txt"
 # log_fill_w_neg_param_values_file = "../logs/log_fill_w_neg_param_value.txt"
 
+# Stage times of each file and their report, for runs with --metrics
+run_metrics_file = "../logs/run_metrics.jsonl"
+run_metrics_report_file = "../logs/run_metrics_report.txt"
+
+# cProfile profiles of the worker processes, merged into one profile
+# and a report of the hot functions, for runs with --profile
+worker_profiles_folder = "../logs/worker_profiles"
+worker_profile_file = "../logs/worker_profile.prof"
+worker_profile_report_file = "../logs/worker_profile_report.txt"
+
+# A file is stopped if it takes longer than this or its worker uses
+# more memory than this (0 for no limit)
+FILE_TIME_LIMIT_SECONDS = 2 * 60 * 60
+FILE_MEMORY_LIMIT_MB = 8 * 1024
+
+# Final results of files are cached here between program runs
+cache_folder = "../cache"
+
+# Column profiles of files that can have rows appended are kept here
+profiles_folder = "../cache/profiles"
+
 # Read in possible datetime formats globally so can access in mulitple program sections
 possible_formats_file = "possible_datetime_formats.txt"
 df_formats = pd.read_fwf(possible_formats_file, comment="#")
 datetime_formats_to_match = df_formats["datetime_formats"].tolist()
 
+# Index the formats by the shape of the values they can match so
+# only formats that could match a value are tried with strptime.
+# It's built from the formats file, so a new format is indexed too.
+datetime_formats_index = build_datetime_formats_index(datetime_formats_to_match)
+
 # These are names of parameters to look for
 # that will have a datetime format inferred for
 bcodmo_datetime_parameters_file = "bcodmo_datetime_parameters.txt"
 with open(bcodmo_datetime_parameters_file, "r") as f:
     bcodmo_datetime_parameters = f.read().splitlines()
 
-bcodmo_datetime_parameters = [val.lower() for val in bcodmo_datetime_parameters]
+bcodmo_datetime_parameters = {val.lower() for val in bcodmo_datetime_parameters}
+
+# Official names of the parameters of each dataset by its parameters
+# info file, so the file of a dataset with many data files is only read
+# once per run. The main process fills it as files are found and sends
+# the names of a file to the worker with its task (see get_file_tasks).
+dataset_parameter_official_names = {}
 
 
 def get_dataset_id(csv_file: str) -> str | None:
@@ -133,7 +252,7 @@ def get_dataset_id(csv_file: str) -> str | None:
     Returns:
         str | None: dataset_id
     """
-    match = re.search(r"/(\d+)/dataURL/.*\.csv$", csv_file)
+    match = re.search(r"/(\d+)/dataURL/.*\.(csv|tsv)$", csv_file)
 
     if match:
         dataset_id = match.group(1)
@@ -165,6 +284,22 @@ def get_is_name_in_bcodmo_datetime_vars(
     except:
         parameter_official_name = None
 
+    return get_is_bcodmo_datetime_name(col_name, parameter_official_name)
+
+
+@functools.lru_cache(maxsize=65536)
+def get_is_bcodmo_datetime_name(
+    col_name: str, parameter_official_name: str | None
+) -> bool:
+    """
+    Find if a parameter name or its official name is a BCO-DMO datetime
+    name. The same names are in many chunks and files, so the answer is
+    kept instead of lowercasing the names again for each one.
+
+    Returns:
+        bool: name_in_bcodmo_datetimes
+    """
+
     try:
         if parameter_official_name is None:
             name_in_bcodmo_datetimes = col_name.lower() in bcodmo_datetime_parameters
@@ -217,7 +352,15 @@ def get_official_name(param_name: str, parameter_official_names: dict) -> str |
     return parameter_official_name
 
 
-def save_parameters_overview(csv_file: str, final_results: dict):
+def get_parameters_overview(csv_file: str, final_results: dict) -> str:
+    """
+    Get the overview text of a file with sample values, fill values,
+    datetime formats and datatypes of each parameter.
+
+    Returns:
+        str: overview
+    """
+
     # Get one line of parameter values to see sample values
     values = {}
     fill_values = {}
@@ -237,8 +380,8 @@ def save_parameters_overview(csv_file: str, final_results: dict):
                 "final_datatype"
             ]
 
-            col_values = val["col_values"]
-            values[col_name] = col_values[0]
+            sample_values = val["sample_values"]
+            values[col_name] = sample_values[0]
 
         final_parameters_datetime_formats = {
             key: value
@@ -250,28 +393,33 @@ def save_parameters_overview(csv_file: str, final_results: dict):
 
         alt_fill_values = {key: val for key, val in alt_fill_values.items() if val}
 
-    with open(parameters_overview_file, "a") as f:
-        f.write(f"**********************\n")
-        f.write(f"file: {csv_file}\n")
-        f.write(f"**********************\n")
-        f.write(f"Sample values\n")
-        f.write(json.dumps(values, indent=4))
-        f.write(f"\nFill values\n")
-        f.write(json.dumps(fill_values, indent=4))
-        f.write(f"\nAlternate fill values\n")
-        f.write(json.dumps(alt_fill_values, indent=4))
-        f.write(f"\nFinal datetime formats\n")
-        f.write(json.dumps(final_parameters_datetime_formats, indent=4))
-        f.write(f"\nFinal parameter data types\n")
-        f.write(json.dumps(final_parameters_datatypes, indent=4))
-        f.write(f"\n\n")
-
-
-def write_parameters_final_results(csv_file: str, final_results: dict):
-    """_summary_
+    overview = [
+        f"**********************\n",
+        f"file: {csv_file}\n",
+        f"**********************\n",
+        f"Sample values\n",
+        json.dumps(values, indent=4),
+        f"\nFill values\n",
+        json.dumps(fill_values, indent=4),
+        f"\nAlternate fill values\n",
+        json.dumps(alt_fill_values, indent=4),
+        f"\nFinal datetime formats\n",
+        json.dumps(final_parameters_datetime_formats, indent=4),
+        f"\nFinal parameter data types\n",
+        json.dumps(final_parameters_datatypes, indent=4),
+        f"\n\n",
+    ]
+
+    return "".join(overview)
+
+
+def get_parameters_final_results(csv_file: str, final_results: dict) -> dict:
+    """
+    Get the summary of a file with the datatype, datetime format and
+    fill value of each parameter.
 
     Returns:
-        _type_: _description_
+        dict: summary_obj
     """
 
     filename = Path(csv_file).name
@@ -330,16 +478,62 @@ def write_parameters_final_results(csv_file: str, final_results: dict):
 
     summary_obj["columns"] = columns
 
-    json_object = json.dumps(summary_obj, indent=4)
+    return summary_obj
 
-    final_str = json_object + "\n,"
 
-    with open(parameters_summary_file, "a") as f:
-        f.write(final_str)
+def write_results(
+    file_results,
+    overview_filename: str = parameters_overview_file,
+    summary_filename: str = parameters_summary_file,
+) -> bool:
+    """
+    Write the overview and summary of each processed file as the results
+    come back from the workers. Only the main process writes to the
+    output files. The summary file is streamed as a JSON array of the
+    file summaries, so it never has to be read back in.
+
+    A shard of a run writes to its own overview and summary files.
+
+    Returns:
+        bool: has_results
+    """
+
+    overview_file = None
+    summary_file = None
+
+    try:
+        for file_result in file_results:
+            if file_result is None:
+                continue
+
+            overview, summary_obj = file_result
+
+            if summary_file is None:
+                overview_file = open(overview_filename, "w")
+                summary_file = open(summary_filename, "w")
+                summary_file.write("[")
+            else:
+                summary_file.write(",")
+
+            overview_file.write(overview)
+
+            summary_file.write(json.dumps(summary_obj, indent=4) + "\n")
+
+        if summary_file is not None:
+            summary_file.write("]")
+
+    finally:
+        if overview_file is not None:
+            overview_file.close()
+
+        if summary_file is not None:
+            summary_file.close()
+
+    return summary_file is not None
 
 
 def check_datetime_format_and_datatype(
-    col_vals: list, format: str | None, datatype: str | None
+    value_features: dict, format: str | None, datatype: str | None
 ) -> tuple:
     """
     Look at certain formats and check length of column values based on
@@ -347,6 +541,9 @@ def check_datetime_format_and_datatype(
     If the length doesn't match, it's not a datetime format,
     so determine what type it is.
 
+    The column values are looked at through the value features of the
+    column profile (see get_datetime_value_features).
+
     Returns:
         str | None: out_format
         str: out_datatype
@@ -364,29 +561,21 @@ def check_datetime_format_and_datatype(
         # check that the numeric length is 4 before the decimal point
         # to match format %H%M which implies two char Hour and two char Minutes
 
-        first_piece = []
-        second_piece = []
-
-        for val in col_vals:
-            pieces = val.split(".")
-            try:
-                if len(pieces[0]) != 4:
-                    continue
-                first_piece.append(int(pieces[0]))
-                second_piece.append(int(pieces[1]))
-            except:
-                pass
+        # Whether any value has a 4 digit integer before a decimal point
+        # and whether any of those have an integer after the decimal point
+        first_piece = value_features["hhmm_has_first_piece"]
+        second_piece = value_features["hhmm_has_second_piece"]
 
-        if len(first_piece) and not len(second_piece):
+        if first_piece and not second_piece:
             out_format = "%H%M"
             out_datatype = "time"
-        elif len(first_piece) and len(second_piece):
+        elif first_piece and second_piece:
             out_format = "%H%M.%f"
             out_datatype = "time"
-        elif not len(first_piece) and not len(second_piece):
+        elif not first_piece and not second_piece:
             out_format = None
             out_datatype = "integer"
-        elif not len(first_piece) and len(second_piece):
+        elif not first_piece and second_piece:
             out_format = None
             out_datatype = "float"
 
@@ -506,49 +695,133 @@ def get_datatypes_from_formats(unique_formats: list) -> list:
     return unique_datatypes
 
 
-def fine_tune_datetime_formats(col_vals: list, unique_formats: list) -> list:
+def get_datetime_value_features(col_vals: list) -> dict:
+    """
+    Find whether any column value has a piece that decides between two
+    datetime formats. These are the checks fine_tune_datetime_formats and
+    check_datetime_format_and_datatype make on the column values. Each
+    check only looks for any value that passes it, so the features of
+    pieces of a column can be combined with or.
+
+    Returns:
+        dict: value_features
+    """
+
+    value_features = {
+        "slash_first_piece_is_day": False,
+        "slash_second_piece_is_day": False,
+        "dash_first_piece_is_day": False,
+        "dash_second_piece_is_day": False,
+        "ddmm_first_piece_is_day": False,
+        "ddmm_second_piece_is_day": False,
+        "yyyy_first_piece_is_year": False,
+        "yyyy_second_piece_is_year": False,
+        "has_microseconds_after_seconds": False,
+        "has_decimal_point": False,
+        "hhmm_has_first_piece": False,
+        "hhmm_has_second_piece": False,
+    }
+
+    for val in col_vals:
+        # Check two digit positions to see if they are definitely a day value (>12)
+        for separator, feature_name in [("/", "slash"), ("-", "dash")]:
+            pieces = val.split(separator)
+            try:
+                if int(pieces[0]) > 12:
+                    value_features[f"{feature_name}_first_piece_is_day"] = True
+                if int(pieces[1]) > 12:
+                    value_features[f"{feature_name}_second_piece_is_day"] = True
+            except:
+                pass
+
+        # Here assume 0 padding
+        if len(val) == 8:
+            try:
+                if int(val[0:2]) > 12:
+                    value_features["ddmm_first_piece_is_day"] = True
+                if int(val[2:4]) > 12:
+                    value_features["ddmm_second_piece_is_day"] = True
+            except:
+                pass
+
+            # check if bigger than 1231 which is either month > 12 or day > 31
+            # then it's definitely a year
+            try:
+                if int(val[0:4]) > 1231:
+                    value_features["yyyy_first_piece_is_year"] = True
+                if int(val[4:]) > 1231:
+                    value_features["yyyy_second_piece_is_year"] = True
+            except:
+                pass
+
+        # check if seconds piece length > 2. then need %f piece of format
+        pieces = val.split(":")
+        if len(pieces) > 2 and len(pieces[2]) > 2:
+            value_features["has_microseconds_after_seconds"] = True
+
+        if "." in val:
+            value_features["has_decimal_point"] = True
+
+        # check that the numeric length is 4 before the decimal point
+        # to match format %H%M which implies two char Hour and two char Minutes
+        pieces = val.split(".")
+        if len(pieces[0]) == 4:
+            try:
+                int(pieces[0])
+                value_features["hhmm_has_first_piece"] = True
+                int(pieces[1])
+                value_features["hhmm_has_second_piece"] = True
+            except:
+                pass
+
+    return value_features
+
+
+def is_datetime_formats_pair(formats_mask: int, format_1: str, format_2: str) -> bool:
+    """
+    Check if the formats of a formats mask are exactly the two formats
+
+    Returns:
+        bool: is_formats_pair
+    """
+
+    format_bits = datetime_formats_index["format_bits"]
+
+    if format_1 not in format_bits or format_2 not in format_bits:
+        return False
+
+    return formats_mask == get_datetime_formats_mask(
+        [format_1, format_2], datetime_formats_index
+    )
+
+
+def fine_tune_datetime_formats(value_features: dict, unique_formats_mask: int) -> list:
     """
-    Take a list of inferred parameter formats and determine which one best
+    Take the mask of inferred parameter formats and determine which one best
     describes the parameter column values. If one can't be determined,
     return all the incoming formats.
 
+    The column values are looked at through the value features of the
+    column profile (see get_datetime_value_features).
+
     Returns:
         list: out_formats
     """
 
+    unique_formats = get_mask_datetime_formats(
+        unique_formats_mask, datetime_formats_index
+    )
+
     out_formats = unique_formats
 
     # Check alternate date forms
     # Check two digit positions to see if they are definitely a day value (>12)
-    if (
-        "%d/%m/%Y" in unique_formats
-        and "%m/%d/%Y" in unique_formats
-        and len(unique_formats) == 2
-    ):
-        first_piece = []
-        second_piece = []
-
-        for val in col_vals:
-            pieces = val.split("/")
-            try:
-                first_piece.append(int(pieces[0]))
-                second_piece.append(int(pieces[1]))
-            except:
-                pass
-
+    if is_datetime_formats_pair(unique_formats_mask, "%d/%m/%Y", "%m/%d/%Y"):
         # check if first_piece > 12. Then it's definitely a day
-        vals = [val for val in first_piece if val > 12]
-        if len(vals):
-            is_day_first_piece = True
-        else:
-            is_day_first_piece = False
+        is_day_first_piece = value_features["slash_first_piece_is_day"]
 
         # check if second_piece > 12. Then it's definitely a day
-        vals = [val for val in second_piece if val > 12]
-        if len(vals):
-            is_day_second_piece = True
-        else:
-            is_day_second_piece = False
+        is_day_second_piece = value_features["slash_second_piece_is_day"]
 
         if is_day_first_piece:
             out_format = "%d/%m/%Y"
@@ -565,35 +838,12 @@ def fine_tune_datetime_formats(col_vals: list, unique_formats: list) -> list:
             out_formats = [out_format]
 
     # Check alternate date forms
-    if (
-        "%d-%m-%Y" in unique_formats
-        and "%m-%d-%Y" in unique_formats
-        and len(unique_formats) == 2
-    ):
-        first_piece = []
-        second_piece = []
-
-        for val in col_vals:
-            pieces = val.split("-")
-            try:
-                first_piece.append(int(pieces[0]))
-                second_piece.append(int(pieces[1]))
-            except:
-                pass
-
+    if is_datetime_formats_pair(unique_formats_mask, "%d-%m-%Y", "%m-%d-%Y"):
         # check if first_piece > 12. Then it's definitely a day
-        vals = [val for val in first_piece if val > 12]
-        if len(vals):
-            is_day_first_piece = True
-        else:
-            is_day_first_piece = False
+        is_day_first_piece = value_features["dash_first_piece_is_day"]
 
         # check if second_piece > 12. Then it's definitely a day
-        vals = [val for val in second_piece if val > 12]
-        if len(vals):
-            is_day_second_piece = True
-        else:
-            is_day_second_piece = False
+        is_day_second_piece = value_features["dash_second_piece_is_day"]
 
         if is_day_first_piece:
             out_format = "%d/%m/%Y"
@@ -611,35 +861,12 @@ def fine_tune_datetime_formats(col_vals: list, unique_formats: list) -> list:
 
     # Check various date forms
     # Here assume 0 padding
-    if (
-        "%d%m%Y" in unique_formats
-        and "%m%d%Y" in unique_formats
-        and len(unique_formats) == 2
-    ):
-        first_piece = []
-        second_piece = []
-
-        for val in col_vals:
-            if len(val) == 8:
-                try:
-                    first_piece.append(int(val[0:2]))
-                    second_piece.append(int(val[2:4]))
-                except:
-                    pass
-
+    if is_datetime_formats_pair(unique_formats_mask, "%d%m%Y", "%m%d%Y"):
         # check if first_piece > 12. Then it's definitely a day
-        vals = [val for val in first_piece if val > 12]
-        if len(vals):
-            is_day_first_piece = True
-        else:
-            is_day_first_piece = False
+        is_day_first_piece = value_features["ddmm_first_piece_is_day"]
 
         # check if second_piece > 12. Then it's definitely a day
-        vals = [val for val in second_piece if val > 12]
-        if len(vals):
-            is_day_second_piece = True
-        else:
-            is_day_second_piece = False
+        is_day_second_piece = value_features["ddmm_second_piece_is_day"]
 
         if is_day_first_piece:
             out_format = "%d%m%Y"
@@ -657,40 +884,14 @@ def fine_tune_datetime_formats(col_vals: list, unique_formats: list) -> list:
 
     # Check various date forms
     # Assume 0 padding
-    if (
-        "%Y%m%d" in unique_formats
-        and "%m%d%Y" in unique_formats
-        and len(unique_formats) == 2
-    ):
-        # 1st 4 chars to possibly be a year
-        col_pos_03 = []
-
-        # last 4 chars to possibly be a year
-        col_pos_47 = []
-
-        for val in col_vals:
-            if len(val) == 8:
-                try:
-                    col_pos_03.append(int(val[0:4]))
-                    col_pos_47.append(int(val[4:]))
-                except:
-                    pass
-
-        # check if col_pos_03 is bigger than 1231 which is either month > 12 or day > 31
+    if is_datetime_formats_pair(unique_formats_mask, "%Y%m%d", "%m%d%Y"):
+        # check if 1st 4 chars are bigger than 1231 which is either month > 12 or day > 31
         # then it's definitely a year
-        vals = [val for val in col_pos_03 if val > 1231]
-        if len(vals):
-            is_year_col_pos_03 = True
-        else:
-            is_year_col_pos_03 = False
+        is_year_col_pos_03 = value_features["yyyy_first_piece_is_year"]
 
-        # check if col_pos_47 is bigger than 1231, which is either month > 12 or day > 31
+        # check if last 4 chars are bigger than 1231, which is either month > 12 or day > 31
         # then it's definitely a year
-        vals = [val for val in col_pos_47 if val > 1231]
-        if len(vals):
-            is_year_col_pos_47 = True
-        else:
-            is_year_col_pos_47 = False
+        is_year_col_pos_47 = value_features["yyyy_second_piece_is_year"]
 
         if is_year_col_pos_03:
             out_format = "%Y%m%d"
@@ -707,35 +908,12 @@ def fine_tune_datetime_formats(col_vals: list, unique_formats: list) -> list:
             out_formats = [out_format]
 
     # Check alternate date forms
-    if (
-        "%d/%m/%y" in unique_formats
-        and "%m/%d/%y" in unique_formats
-        and len(unique_formats) == 2
-    ):
-        first_piece = []
-        second_piece = []
-
-        for val in col_vals:
-            pieces = val.split("/")
-            try:
-                first_piece.append(int(pieces[0]))
-                second_piece.append(int(pieces[1]))
-            except:
-                pass
-
+    if is_datetime_formats_pair(unique_formats_mask, "%d/%m/%y", "%m/%d/%y"):
         # check if first_piece > 12. Then it's definitely a day
-        vals = [val for val in first_piece if val > 12]
-        if len(vals):
-            is_day_first_piece = True
-        else:
-            is_day_first_piece = False
+        is_day_first_piece = value_features["slash_first_piece_is_day"]
 
         # check if second_piece > 12. Then it's definitely a day
-        vals = [val for val in second_piece if val > 12]
-        if len(vals):
-            is_day_second_piece = True
-        else:
-            is_day_second_piece = False
+        is_day_second_piece = value_features["slash_second_piece_is_day"]
 
         if is_day_first_piece:
             out_format = "%d/%m/%y"
@@ -753,28 +931,9 @@ def fine_tune_datetime_formats(col_vals: list, unique_formats: list) -> list:
 
     # Check various time forms
     #  "%H:%M:%S" and "%H:%M:%S%f"
-    if (
-        "%H:%M:%S" in unique_formats
-        and "%H:%M:%S%f" in unique_formats
-        and len(unique_formats) == 2
-    ):
-        seconds_pieces = []
-
-        for val in col_vals:
-            pieces = val.split(":")
-
-            try:
-                seconds_pieces.append(pieces[2])
-            except:
-                pass
-
+    if is_datetime_formats_pair(unique_formats_mask, "%H:%M:%S", "%H:%M:%S%f"):
         # check if seconds piece length > 2. then need %f piece of format
-        vals = [val for val in seconds_pieces if len(val) > 2]
-
-        if len(vals):
-            has_microseconds = True
-        else:
-            has_microseconds = False
+        has_microseconds = value_features["has_microseconds_after_seconds"]
 
         if has_microseconds:
             out_format = "%H:%M:%S%f"
@@ -785,18 +944,9 @@ def fine_tune_datetime_formats(col_vals: list, unique_formats: list) -> list:
 
     # Check various time formats
     # "%H%M" and "%H%M.%f"
-    if (
-        "%H%M" in unique_formats
-        and "%H%M.%f" in unique_formats
-        and len(unique_formats) == 2
-    ):
+    if is_datetime_formats_pair(unique_formats_mask, "%H%M", "%H%M.%f"):
         # Check if there is a decimal point
-        vals = [val for val in col_vals if "." in val]
-
-        if len(vals):
-            has_microseconds = True
-        else:
-            has_microseconds = False
+        has_microseconds = value_features["has_decimal_point"]
 
         if has_microseconds:
             out_format = "%H%M.%f"
@@ -808,42 +958,23 @@ def fine_tune_datetime_formats(col_vals: list, unique_formats: list) -> list:
     # In case where have a %B and %b format match, most likely
     # means May was in a date and it matches both cases,
     # so pick the abbreviation %b choice
-    if (
-        "%d-%B-%y" in unique_formats
-        and "%d-%b-%y" in unique_formats
-        and len(unique_formats) == 2
-    ):
+    if is_datetime_formats_pair(unique_formats_mask, "%d-%B-%y", "%d-%b-%y"):
         out_formats = ["%d-%b-%y"]
 
     return out_formats
 
 
-def get_parameter_unique_datatypes(
-    col_name: str,
-    col_values: list,
-    results: dict,
-    parameter_official_names: dict,
-) -> list:
+def get_format_letters(datetime_format: str) -> tuple:
     """
-    Fine tune whether a datetime type is date, time, or datetime
-    Need to know what the format looks like,
-    If it has H,M, or S in it, and no other letters, it's a time
-    If it has no H,M,S, it's a date
+    Find the letters of a datetime format (or of several formats joined
+    by spaces) that are time letters and the letters that are date letters.
+    Used to decide if a datetime value is a date, time, or datetime.
 
     Returns:
-        list: unique_datatypes
+        list: common_time_letters
+        list: common_date_letters
     """
 
-    datatypes = results[col_name]["col_datatypes"]
-    formats = results[col_name]["col_formats"]
-    fills_obj = results[col_name]["fills_obj"]
-
-    fills = fills_obj["all_possible_and_minus9s_fills"]
-
-    name_in_bcodmo_datetimes = get_is_name_in_bcodmo_datetime_vars(
-        col_name, parameter_official_names
-    )
-
     # Don't include Z format
     time_format_letters = ["H", "M", "S", "f"]
 
@@ -853,32 +984,71 @@ def get_parameter_unique_datatypes(
 
     date_format_letters = list(date_format_letters)
 
-    new_datatypes = []
+    datatype_letters = re.split(r"[^a-zA-Z]*", datetime_format)
 
-    for i in range(len(datatypes)):
-        elem_datatype = datatypes[i]
+    common_time_letters = list(set(time_format_letters) & set(datatype_letters))
 
-        elem_formats = formats[i]
+    common_date_letters = list(set(date_format_letters) & set(datatype_letters))
 
-        if len(elem_formats) == 1:
-            elem_format = elem_formats[0]
-        else:
-            elem_format = " ".join(elem_formats)
+    return common_time_letters, common_date_letters
 
-        elem_fill = fills[i]
 
-        col_val = col_values[i]
+def get_format_letter_types(datetime_format: str) -> set:
+    """
+    Get whether a datetime format has time letters, date letters or both.
 
-        if (
-            elem_format is not None
-            and elem_fill is None
-            and elem_datatype == "datetime"
-        ):
-            datatype_letters = re.split(r"[^a-zA-Z]*", elem_format)
+    Returns:
+        set: letter_types
+    """
+
+    common_time_letters, common_date_letters = get_format_letters(datetime_format)
+
+    letter_types = set()
+
+    if common_time_letters:
+        letter_types.add("time")
+
+    if common_date_letters:
+        letter_types.add("date")
+
+    return letter_types
+
+
+def get_parameter_unique_datatypes(
+    col_name: str,
+    column_profile: ColumnProfile,
+    parameter_official_names: dict,
+) -> list:
+    """
+    Fine tune whether a datetime type is date, time, or datetime
+    Need to know what the format looks like,
+    If it has H,M, or S in it, and no other letters, it's a time
+    If it has no H,M,S, it's a date
+
+    Each kind of value counted in the column profile is looked at once.
+
+    Returns:
+        list: unique_datatypes
+    """
+
+    name_in_bcodmo_datetimes = get_is_name_in_bcodmo_datetime_vars(
+        col_name, parameter_official_names
+    )
+
+    new_datatypes = []
 
-            common_time_letters = list(set(time_format_letters) & set(datatype_letters))
+    for (
+        elem_datatype,
+        elem_formats_mask,
+        elem_is_fill,
+        elem_value_datatype,
+    ) in column_profile.value_type_counts:
+        if elem_formats_mask and not elem_is_fill and elem_datatype == "datetime":
+            elem_format = " ".join(
+                get_mask_datetime_formats(elem_formats_mask, datetime_formats_index)
+            )
 
-            common_date_letters = list(set(date_format_letters) & set(datatype_letters))
+            common_time_letters, common_date_letters = get_format_letters(elem_format)
 
             if (
                 common_time_letters
@@ -899,30 +1069,14 @@ def get_parameter_unique_datatypes(
 
             new_datatypes.append(elem_datatype)
 
-        elif elem_format is None and elem_fill is None and elem_datatype == "datetime":
+        elif not elem_formats_mask and not elem_is_fill and elem_datatype == "datetime":
             # keep datatype datetime and if format = None,
-            # go through list of options to find the datatype
-            # Would need the col value to do this
-
-            # elem datatatype is not datetime or fill, is it string, float or int or None?
-
-            # possible_fill_values = get_possible_fill_values()
+            # use the string, float or int or None datatype of the
+            # col value found in the first pass
+            # (see get_datetime_column_value_datatypes)
+            new_datatypes.append(elem_value_datatype)
 
-            try:
-                val_float = float(col_val)
-
-                if math.isnan(val_float):
-                    datatype = None
-                elif "." not in col_val:
-                    datatype = "integer"
-                else:
-                    datatype = "float"
-            except:
-                datatype = "string"
-
-            new_datatypes.append(datatype)
-
-        elif elem_fill is not None:
+        elif elem_is_fill:
             datatype = "isfill"
             new_datatypes.append(datatype)
 
@@ -945,30 +1099,31 @@ def get_parameter_unique_datatypes(
 
 
 def infer_values_second_pass(
-    csv_file: str, results: dict, parameter_official_names: dict
+    csv_file: str, column_profiles: dict, parameter_official_names: dict
 ) -> dict:
-    """_summary_
+    """
+    Find the final datatype, datetime format and fill value of each
+    column from the column profiles of the first pass.
 
     Returns:
-        _type_: _description_
+        dict: final_results
     """
 
-    column_names = list(results.keys())
+    column_names = list(column_profiles.keys())
 
     final_results = {}
 
     for col_name in column_names:
-        col_values = results[col_name]["col_values"]
-        formats = results[col_name]["col_formats"]
+        column_profile = column_profiles[col_name]
 
         final_results[col_name] = {}
-        final_results[col_name]["col_values"] = col_values
+        final_results[col_name]["sample_values"] = column_profile.sample_values
 
         # Get unique fill value
         # a string datatype does not have a fill value because can't distinguish
         # a fill value from a comment in a string column
         fills_obj, dateime_has_multiple_fill_types = get_unique_parameter_fill_value(
-            csv_file, col_name, results
+            csv_file, col_name, column_profile
         )
 
         # Find unique datatypes from looking at each parameter datatype and format
@@ -980,35 +1135,27 @@ def infer_values_second_pass(
 
         unique_datatypes = get_parameter_unique_datatypes(
             col_name,
-            col_values,
-            results,
+            column_profile,
             parameter_official_names,
         )
 
-        # Get unique parameter formats
-        # simplify list of lists
-        parameter_datetime_formats = [item for sublist in formats for item in sublist]
-
-        if len(parameter_datetime_formats):
-            unique_formats = list(set(parameter_datetime_formats))
+        # Get unique parameter formats from the OR of the value formats masks.
+        # Values without a format, that could occur if a column value
+        # can't fit a dateformat or if their is a fill, have no bits set.
+        # Since it could be from a fill value, infer if it's a datetime
+        # later.  It could still be a datetime if None values from fill
+        # values but could be a non datetime datatype if not a fill value
+        # meaning the dateformat couldn't be matched
+        unique_formats_mask = column_profile.formats_mask
 
-            # Remove any None formats that could occur if a column value
-            # can't fit a dateformat or if their is a fill. Since it could
-            # be from a fill value, infer if it's a datetime later.  It could
-            # still be a datetime if None values from fill values but could
-            # be a non datetime datatype if not a fill value meaning the
-            # dateformat couldn't be matched
-            unique_formats = [val for val in unique_formats if val]
-
-            if not unique_formats:
-                unique_formats = None
+        # If more than one format, see if can fine-tune to one best format
+        if unique_formats_mask:
+            unique_formats = fine_tune_datetime_formats(
+                column_profile.datetime_value_features, unique_formats_mask
+            )
         else:
             unique_formats = None
 
-        # If more than one format, see if can fine-tune to one best format
-        if unique_formats is not None:
-            unique_formats = fine_tune_datetime_formats(col_values, unique_formats)
-
         # If there are still more than one unique_format even after fine tuning,
         # set the unique_format to None and change the datatype to an
         # integer, float, or string
@@ -1038,7 +1185,7 @@ def infer_values_second_pass(
         # Check if a datetime datatype has an expected length and if not
         # return a new format and datatype
         final_format, final_datatype = check_datetime_format_and_datatype(
-            col_values, final_format, final_datatype
+            column_profile.datetime_value_features, final_format, final_datatype
         )
 
         final_results[col_name]["fill_value"] = fills_obj["fill_value"]
@@ -1049,7 +1196,7 @@ def infer_values_second_pass(
         # have strings or numbers that are not fills in the column and it's
         # no longer a datetime datatype.
 
-        is_datetime = results[col_name]["is_datetime"]
+        is_datetime = column_profile.is_datetime
 
         if is_datetime and dateime_has_multiple_fill_types:
             final_format = None
@@ -1069,7 +1216,9 @@ def infer_values_second_pass(
 
 
 def get_col_val_datetime_formats(
-    col_val: str, is_name_in_bcodmo_datetime_vars: bool
+    col_val: str,
+    is_name_in_bcodmo_datetime_vars: bool,
+    column_formats: dict | None = None,
 ) -> list:
     # Infer datetime formats for a column value, and if not a datetime column,
     # return None
@@ -1078,17 +1227,65 @@ def get_col_val_datetime_formats(
     # If parameter is a datetime and its format is None, write to a log file
     # because most likely that format is not in the list of datetime formats to match to
 
+    # If column_formats is given, the formats are narrowed using the formats
+    # already matched by other values in the column. See
+    # get_col_values_datetime_formats for how this is done.
+
     parsed_timestamps = {"col_val": col_val, "matches": []}
 
     if is_name_in_bcodmo_datetime_vars:
-        for f in datetime_formats_to_match:
+        # Only try the formats that fit the shape of the value
+        candidate_formats = get_candidate_datetime_formats(
+            col_val, datetime_formats_index
+        )
+
+        if column_formats is None:
+            seen_formats = set()
+            format_attempts = None
+        else:
+            seen_formats = column_formats["seen_formats"]
+
+            # Only counted when metrics are recorded
+            format_attempts = column_formats.get("format_attempts")
+            format_matches = column_formats.get("format_matches")
+
+        # Formats not matched in the column yet are always tried first
+        new_formats = [f for f in candidate_formats if f not in seen_formats]
+        seen_candidate_formats = [f for f in candidate_formats if f in seen_formats]
+
+        matched_letter_types = set()
+
+        for f in new_formats + seen_candidate_formats:
+            if matched_letter_types and f in seen_formats:
+                # Already in the column formats, so only matters if it
+                # would change whether the value is a date, time or datetime
+                letter_types = get_column_format_letter_types(f, column_formats)
+
+                if letter_types <= matched_letter_types:
+                    continue
+
+            if format_attempts is not None:
+                format_attempts[f] = format_attempts.get(f, 0) + 1
+
             try:
                 d = datetime.strptime(col_val, f)
             except:
                 continue
 
+            if format_attempts is not None:
+                format_matches[f] = format_matches.get(f, 0) + 1
+
             parsed_timestamps["matches"].append({"datetime": d, "format": f})
 
+            matched_letter_types.update(
+                get_column_format_letter_types(f, column_formats)
+            )
+
+        if column_formats is not None:
+            seen_formats.update(
+                match["format"] for match in parsed_timestamps["matches"]
+            )
+
     matches = parsed_timestamps["matches"]
 
     datetime_formats = []
@@ -1102,6 +1299,27 @@ def get_col_val_datetime_formats(
     return datetime_formats
 
 
+def get_column_format_letter_types(datetime_format: str, column_formats: dict) -> set:
+    """
+    Get the letter types of a format and remember them for the column
+
+    Returns:
+        set: letter_types
+    """
+
+    if column_formats is None:
+        return get_format_letter_types(datetime_format)
+
+    format_letter_types = column_formats["letter_types"]
+
+    if datetime_format not in format_letter_types:
+        format_letter_types[datetime_format] = get_format_letter_types(
+            datetime_format
+        )
+
+    return format_letter_types[datetime_format]
+
+
 def get_col_value_datatype(
     col_val: str, possible_fill_values: list, is_datetime: bool
 ) -> str:
@@ -1137,121 +1355,301 @@ def get_col_value_datatype(
     return datatype
 
 
-# Testing option included in function to limit number of rows to process
-def infer_values_first_pass(df: pd.DataFrame, parameter_official_names: dict) -> dict:
+def get_col_values_datatypes(
+    col_vals: pd.Series, possible_fill_values: list, is_datetime: bool
+) -> pd.Series:
     """
-    First pass of classifying each column value before finding final
-    values of a datatype, datetime format and fill value for the whole column.
+    Get the datatype of every value in a column at once. Same
+    classification as get_col_value_datatype, but plain integer and
+    decimal values are found with a vectorized regular expression match.
+    Any other value (like 1e-12, inf or 1_000) falls back to
+    get_col_value_datatype once for each unique value so the result is
+    the same as calling float() on it.
 
     Returns:
-        dict: results
+        pd.Series: datatypes
     """
 
-    column_names = df.columns
+    is_fill = col_vals.isin(possible_fill_values)
 
-    if TESTING:
-        # process limited number of rows to infer datatypes and datetime formats
-        df_new = df.iloc[0:NUMBER_TESTING_ROWS]
-    else:
-        df_new = df.copy()
+    if is_datetime:
+        datatypes = np.where(is_fill, "isfill", "datetime")
+        return pd.Series(datatypes, index=col_vals.index, dtype=object)
 
-    results = {}
+    is_integer = ~is_fill & col_vals.str.fullmatch(INTEGER_PATTERN)
+    is_float = ~is_fill & ~is_integer & col_vals.str.fullmatch(FLOAT_PATTERN)
 
-    for col_name in column_names:
-        is_name_in_bcodmo_datetime_vars = get_is_name_in_bcodmo_datetime_vars(
-            col_name, parameter_official_names
-        )
+    datatypes = pd.Series(None, index=col_vals.index, dtype=object)
+    datatypes[is_fill] = "isfill"
+    datatypes[is_integer] = "integer"
+    datatypes[is_float] = "float"
 
-        if is_name_in_bcodmo_datetime_vars:
-            is_datetime = True
+    is_other = ~(is_fill | is_integer | is_float)
 
-        else:
-            is_datetime = False
+    if is_other.any():
+        other_vals = col_vals[is_other]
 
-        # Get the defined possible fill values that
-        # BCO-DMO datasets use
-        possible_fill_values = get_possible_fill_values()
+        other_datatypes = {
+            col_val: get_col_value_datatype(col_val, possible_fill_values, False)
+            for col_val in other_vals.unique()
+        }
+
+        datatypes[is_other] = other_vals.map(other_datatypes)
+
+    return datatypes
+
+
+def get_col_values_datetime_formats(
+    col_vals: pd.Series,
+    is_name_in_bcodmo_datetime_vars: bool,
+    col_name: str | None = None,
+) -> np.ndarray:
+    """
+    Get the possible datetime formats of every value in a column as a
+    bitmask of the formats (0 if no format matches).
+    Only parameters with a BCO-DMO datetime name are matched against
+    the datetime formats, every other column value has no format.
+
+    The candidate formats are narrowed as values are seen. A value is
+    always checked against the candidate formats no other value in the
+    column has matched, so the set of column formats is the same as
+    checking every format. Formats already matched are only checked
+    until the value has a match and then only if they could change
+    whether the value is a date, time, or datetime, which is all the
+    value formats are used for later. Values that don't fit any format
+    shape, like fill values or strings, have no candidates to check.
+
+    When metrics are recorded, the strptime attempts and matches of each
+    format are counted for the column col_name (see run_metrics).
+
+    Returns:
+        np.ndarray: datetime_formats_masks
+    """
+
+    # The masks can have more bits than a fixed width integer,
+    # so keep them as python ints
+    datetime_formats_masks = np.zeros(len(col_vals), dtype=object)
+
+    if not is_name_in_bcodmo_datetime_vars:
+        return datetime_formats_masks
+
+    column_formats = {"seen_formats": set(), "letter_types": {}}
+
+    if is_recording_metrics():
+        column_formats["format_attempts"] = {}
+        column_formats["format_matches"] = {}
+
+    for i, col_val in enumerate(col_vals):
+        datetime_formats = get_col_val_datetime_formats(
+            col_val, is_name_in_bcodmo_datetime_vars, column_formats
+        )
+
+        datetime_formats_masks[i] = get_datetime_formats_mask(
+            datetime_formats, datetime_formats_index
+        )
+
+    if is_recording_metrics():
+        add_datetime_format_counts(
+            col_name,
+            column_formats["format_attempts"],
+            column_formats["format_matches"],
+        )
+
+    return datetime_formats_masks
+
+
+def get_column_unique_values(column: pd.Series) -> tuple:
+    """
+    Get the unique values of a column in the order they first appear
+    along with how many times each one occurs in the column.
+
+    Returns:
+        list: unique_values
+        list: counts
+    """
+
+    codes, unique_values = pd.factorize(column, use_na_sentinel=False)
+
+    counts = np.bincount(codes, minlength=len(unique_values))
+
+    return list(unique_values), counts.tolist()
+
+
+def get_datetime_column_value_datatypes(
+    col_vals: pd.Series, is_string: pd.Series
+) -> pd.Series:
+    """
+    Find if a value in a datetime column that has no datetime format and
+    isn't a fill value is a string, float, integer or None (NaN text).
+    Every other value has no value datatype.
+
+    Returns:
+        pd.Series: value_datatypes
+    """
+
+    value_datatypes = pd.Series(None, index=col_vals.index, dtype=object)
+
+    for i, col_val in col_vals[is_string].items():
+        try:
+            val_float = float(col_val)
+
+            if math.isnan(val_float):
+                datatype = None
+            elif "." not in col_val:
+                datatype = "integer"
+            else:
+                datatype = "float"
+        except:
+            datatype = "string"
+
+        value_datatypes[i] = datatype
+
+    return value_datatypes
 
-        parameter_datatypes = []
-        param_datetime_formats = []
 
-        results[col_name] = {}
+def infer_values_first_pass(
+    chunk: pd.DataFrame, parameter_official_names: dict
+) -> dict:
+    """
+    First pass of classifying each column value before finding final
+    values of a datatype, datetime format and fill value for the whole column.
+
+    Each unique column value of a chunk of rows is classified once and the
+    column is summarized into a ColumnProfile. Profiles of the chunks of a
+    file are combined with merge_column_profiles.
+
+    Returns:
+        dict: column_profiles
+    """
 
-        string_values = []
-        numeric_values = []
+    column_names = list(chunk.columns)
 
-        datetime_string_values = []
+    column_profiles = {}
+
+    # Get the defined possible fill values that
+    # BCO-DMO datasets use
+    possible_fill_values = get_possible_fill_values()
+
+    for col_name in column_names:
+        is_name_in_bcodmo_datetime_vars = get_is_name_in_bcodmo_datetime_vars(
+            col_name, parameter_official_names
+        )
+
+        if is_name_in_bcodmo_datetime_vars:
+            is_datetime = True
 
-        fills_obj = {}
+        else:
+            is_datetime = False
 
-        fills_obj["found_possible_fill_values"] = []
-        fills_obj["all_fill_values"] = []
-        fills_obj["all_possible_and_minus9s_fills"] = []
-        fills_obj["minus_9s"] = []
+        # Column values repeat a lot (cruise ids, station numbers, dates,
+        # fill values), so each unique value is classified once and the
+        # number of times it occurs is kept with it. Unique values keep
+        # the order they first appear in the column.
+        col_vals, col_counts = get_column_unique_values(chunk[col_name])
 
-        column = df_new[col_name].copy()
-        col_vals = list(column.values)
+        # Remove any spaces that column values might have
+        stripped_column = pd.Series(col_vals, dtype=object).str.strip()
 
-        for i in range(len(col_vals)):
-            col_val = col_vals[i]
+        # Get the datatype of each column value.
+        with time_stage("datatypes", col_name):
+            parameter_datatypes = get_col_values_datatypes(
+                stripped_column, possible_fill_values, is_datetime
+            )
 
-            # Remove any spaces that a column value might have
-            col_val = col_val.strip()
+        # One value can have more than one datetime format that fits it
+        # Get possible datetime formats for each column value.
+        # Later on will fine tune a column datetime format
+        # from a unique set of the column value formats.
+        with time_stage("datetime_formats", col_name):
+            param_datetime_formats_masks = get_col_values_datetime_formats(
+                stripped_column, is_name_in_bcodmo_datetime_vars, col_name
+            )
 
-            # Get the datatype of each column value.
-            datatype = get_col_value_datatype(
-                col_val, possible_fill_values, is_datetime
+        # Find fill values
+        if is_datetime:
+            # Only looking for defined possible fill values or minus 9s values
+            # TODO
+            # Why not look for string values to determine if there is an alternate fill value?
+            # Don't need collect numeric values
+            (
+                is_possible_fill,
+                is_minus_9s,
+                is_string,
+            ) = find_datetime_fill_values(
+                stripped_column, param_datetime_formats_masks
             )
 
-            parameter_datatypes.append(datatype)
+            numeric_values = pd.Series(np.nan, index=stripped_column.index)
 
-            # One value can have more than one datetime format that fits it
-            # Get possible datetime formats for each column value.
-            # Later on will fine tune a column datetime format
-            # from a unique set of the column value formats.
-            datetime_formats = get_col_val_datetime_formats(
-                col_val, is_name_in_bcodmo_datetime_vars
+            value_datatypes = get_datetime_column_value_datatypes(
+                pd.Series(col_vals, dtype=object), is_string
             )
 
-            param_datetime_formats.append(datetime_formats)
-
-            # Find fill value
-            # if datatype is None or datatype == "isnan":
-            if datatype is None:
-                fills_obj["all_fill_values"].append(None)
-                fills_obj["all_possible_and_minus9s_fills"].append(None)
-
-            elif datatype == "datetime":
-                # Only looking for defined possible fill values or minus 9s values
-                # TODO
-                # Why not look for string values to determine if there is an alternate fill value?
-                # Don't need collect numeric values
-                (datetime_string_values, fills_obj) = find_datetime_fill_values(
-                    col_val, datetime_formats, datetime_string_values, fills_obj
-                )
+            # The datetime format checks use the values before they're stripped
+            datetime_value_features = get_datetime_value_features(col_vals)
 
-            else:
-                (
-                    string_values,
-                    numeric_values,
-                    fills_obj,
-                ) = find_non_datetime_fill_values(
-                    col_val, datatype, string_values, numeric_values, fills_obj
-                )
+        else:
+            (
+                is_possible_fill,
+                is_minus_9s,
+                is_string,
+            ) = find_non_datetime_fill_values(stripped_column, parameter_datatypes)
+
+            numeric_values = get_numeric_values(stripped_column, parameter_datatypes)
+
+            value_datatypes = pd.Series(None, index=stripped_column.index, dtype=object)
+
+            datetime_value_features = {}
+
+        column_profiles[col_name] = ColumnProfile.from_values(
+            is_datetime,
+            col_vals,
+            col_counts,
+            stripped_column,
+            parameter_datatypes,
+            param_datetime_formats_masks,
+            is_possible_fill,
+            is_minus_9s,
+            is_string,
+            numeric_values,
+            value_datatypes,
+            datetime_value_features,
+        )
+
+    return column_profiles
+
+
+def read_parameters_official_names(parameters_info_filename: str) -> dict:
+    """
+    Read in the parameters info file of a dataset to get the official
+    name of each supplied parameter name
+
+    Returns:
+        dict: parameter_official_names
+    """
+
+    with open(parameters_info_filename, "r") as f:
+        parameters_info = json.load(f)
+
+    parameter_official_names = {}
+
+    for parameter in parameters_info:
+        try:
+            supplied_name = parameter["supplied_name"]
+        except KeyError:
+            supplied_name = None
+
+        try:
+            official_name = parameter["parameter_official_name"]
+        except KeyError:
+            official_name = None
 
-        results[col_name]["col_values"] = col_vals
-        results[col_name]["col_datatypes"] = parameter_datatypes
-        results[col_name]["col_formats"] = param_datetime_formats
-        results[col_name]["is_datetime"] = is_datetime
-        results[col_name]["fills_obj"] = fills_obj
-        results[col_name]["numeric_values"] = numeric_values
-        results[col_name]["string_values"] = string_values
-        results[col_name]["datetime_string_values"] = datetime_string_values
+        parameter_official_names[supplied_name] = official_name
 
-    return results
+    return parameter_official_names
 
 
-def get_parameters_official_names(csv_file: str, parameter_col_names: list) -> dict:
+def get_parameters_official_names(csv_file: str) -> dict:
     """
     Read in the parameters info file to get the corresponding official name
     of supplied parameter names. Will use this later to determine which
@@ -1260,6 +1658,10 @@ def get_parameters_official_names(csv_file: str, parameter_col_names: list) -> d
     Supplied parameter names from the parameter file mapped to BCO-DMO
     official names which are stored in the parameters info file
 
+    Each parameters info file is only read once (see
+    dataset_parameter_official_names), so the dict returned is shared
+    by the files of a dataset and must not be changed.
+
     Returns:
         dict: parameter_official_names
     """
@@ -1270,29 +1672,33 @@ def get_parameters_official_names(csv_file: str, parameter_col_names: list) -> d
         print("No parameters info file")
 
         # Supplied parameter names translated to BCO-DMO official names,
-        # but there are none to available to map to
-        parameter_official_names = {name: None for name in parameter_col_names}
+        # but there are none to available to map to, so every parameter
+        # name looks up an official name of None
+        return {}
 
-    else:
-        with open(parameters_info_filename, "r") as f:
-            parameters_info = json.load(f)
+    if parameters_info_filename not in dataset_parameter_official_names:
+        dataset_parameter_official_names[parameters_info_filename] = (
+            read_parameters_official_names(parameters_info_filename)
+        )
 
-        parameter_official_names = {}
+    return dataset_parameter_official_names[parameters_info_filename]
 
-        for parameter in parameters_info:
-            try:
-                supplied_name = parameter["supplied_name"]
-            except KeyError:
-                supplied_name = None
 
-            try:
-                official_name = parameter["parameter_official_name"]
-            except KeyError:
-                official_name = None
+def get_file_parameter_official_names(file: Path) -> dict | None:
+    """
+    Get the parameter official names of a file in the main process to
+    send to the worker with its task. If the parameters info file can't
+    be read, return None so the worker reads it and fails on the file
+    as before, instead of stopping the run.
 
-            parameter_official_names[supplied_name] = official_name
+    Returns:
+        dict | None: parameter_official_names
+    """
 
-    return parameter_official_names
+    try:
+        return get_parameters_official_names(file.as_posix())
+    except Exception:
+        return None
 
 
 # def get_file_encoding(file: str) -> typing.Union[str, None]:
@@ -1307,15 +1713,246 @@ def get_parameters_official_names(csv_file: str, parameter_col_names: list) -> d
 #     return encoding
 
 
-def read_file(filename: str) -> pd.DataFrame:
+def get_file_encoding(filename: str, file_scan: dict | None = None) -> tuple:
+    """
+    Find the encoding to read a file with by decoding its bytes once.
+    Use UTF-8 if the whole file is valid UTF-8, otherwise Windows-1252
+    if every byte is a Windows-1252 character, and otherwise Latin1,
+    which can decode any byte. These are the encodings the file would
+    have been read with without a UnicodeDecodeError, in that order.
+
+    While the bytes are read, also check if the file is simple enough
+    for the faster CSV readers (see csv_readers): no quote characters
+    and no line breaks of only a carriage return.
+
+    If file_scan is given, the bytes are also hashed, and the number of
+    bytes read and their hash are added to it as one segment (see
+    get_segments_hash), so the file doesn't have to be read again to
+    cache its results or save its profile state. Whether the file is
+    UTF-8 without quote characters and ends with a line break, so its
+    appended rows can be read on their own (see profile_states), is
+    added to it too.
+
+    Returns:
+        tuple: encoding, is_simple
+    """
+
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")()
+    is_utf8 = True
+    is_windows_1252 = True
+    is_simple = True
+
+    file_hash = hashlib.sha256()
+    number_bytes = 0
+    has_quotes = False
+    last_byte = b""
+
+    with open(filename, "rb") as f:
+        while block := f.read(ENCODING_BLOCK_SIZE_BYTES):
+            if file_scan is not None:
+                file_hash.update(block)
+                number_bytes += len(block)
+                last_byte = block[-1:]
+
+                if is_utf8 and not has_quotes:
+                    has_quotes = b'"' in block
+
+                # The encoding is Latin1, the rest is only hashed
+                if not is_utf8 and not is_windows_1252:
+                    continue
+
+            # A "\r\n" split between two blocks counts as a lone "\r",
+            # which only means the file is read by pandas
+            if is_simple and (b'"' in block or b"\r" in block.replace(b"\r\n", b"")):
+                is_simple = False
+
+            if is_utf8:
+                try:
+                    utf8_decoder.decode(block)
+                except UnicodeDecodeError:
+                    is_utf8 = False
+
+            # Every block is checked, even if it's UTF-8, since a later
+            # block can be the one that isn't. Windows-1252 has one byte
+            # per character, so each block can be checked on its own.
+            if is_windows_1252 and any(
+                undefined_byte in block
+                for undefined_byte in WINDOWS_1252_UNDEFINED_BYTES
+            ):
+                is_windows_1252 = False
+
+            if not is_utf8 and not is_windows_1252 and file_scan is None:
+                break
+
+    if is_utf8:
+        try:
+            utf8_decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            is_utf8 = False
+
+    # Latin1 files are always read by pandas
+    if not is_utf8 and not is_windows_1252:
+        is_simple = False
+
+    if file_scan is not None:
+        file_scan["segments"] = [[number_bytes, file_hash.hexdigest()]]
+        file_scan["is_utf8_without_quotes"] = is_utf8 and not has_quotes
+        file_scan["ends_with_line_break"] = last_byte == b"\n"
+
+    if is_utf8:
+        return "utf-8", is_simple
+
+    if is_windows_1252:
+        return "windows-1252", is_simple
+
+    return "latin1", is_simple
+
+
+def read_file_chunks(
+    filename,
+    encoding: str,
+    parameter_official_names: dict,
+    column_indices: list | None = None,
+    csv_reader: str = "pandas",
+    delimiter: str = ",",
+    check_field_counts: bool = False,
+) -> dict | None:
+    """
+    Read in a file in chunks of CHUNK_SIZE_ROWS rows with one encoding and
+    merge the first pass profile of each chunk into the column profiles
+    of the file. Only one chunk of the file is in memory at a time.
+
+    If column_indices is given, only the columns at those positions
+    are read. filename can also be an open binary file, and its fields
+    are separated by delimiter. The chunks are read with csv_reader
+    (see csv_readers), which raises CsvReaderNotUsable if it can't read
+    the file the same way as pandas.
+
+    Pandas doesn't check the number of fields in each row when only
+    some columns are read, so a row with more fields than the header
+    doesn't raise a parse error. If check_field_counts is True, every
+    column is read and the columns in column_indices are taken from
+    each chunk, so the rows are checked the same as when the whole
+    file is read.
+
+    Returns:
+        dict | None: column_profiles
+    """
+
+    column_profiles = None
+    number_rows = 0
+
+    if TESTING:
+        # process limited number of rows to infer datatypes and datetime formats
+        number_rows_to_read = NUMBER_TESTING_ROWS
+    else:
+        number_rows_to_read = None
+
+    if check_field_counts:
+        read_column_indices = None
+    else:
+        read_column_indices = column_indices
+
+    for chunk in read_csv_chunks(
+        filename,
+        encoding,
+        read_column_indices,
+        CHUNK_SIZE_ROWS,
+        number_rows_to_read,
+        csv_reader,
+        delimiter,
+    ):
+        if column_indices is not None and read_column_indices is None:
+            chunk = chunk.iloc[:, column_indices]
+
+        with time_stage("first_pass"):
+            chunk_profiles = infer_values_first_pass(chunk, parameter_official_names)
+
+        column_profiles = merge_column_profiles(column_profiles, chunk_profiles)
+        number_rows += len(chunk)
+
+        report_progress(number_rows)
+
+    add_count("rows", number_rows)
+
+    if not number_rows:
+        column_profiles = None
+    else:
+        add_count("columns", len(column_profiles))
+
+    return column_profiles
+
+
+def read_file_with_reader(
+    filename: str,
+    encoding: str,
+    parameter_official_names: dict,
+    column_indices: list | None,
+    csv_reader: str,
+    delimiter: str,
+    check_field_counts: bool,
+) -> dict | None:
+    """
+    Read in a file to column profiles with csv_reader (see
+    read_file_chunks), or with pandas if csv_reader can't read the file
+    the same way as pandas
+
+    Returns:
+        dict | None: column_profiles
+    """
+
+    try:
+        column_profiles = read_file_chunks(
+            filename,
+            encoding,
+            parameter_official_names,
+            column_indices,
+            csv_reader,
+            delimiter,
+            check_field_counts,
+        )
+    except CsvReaderNotUsable:
+        column_profiles = read_file_chunks(
+            filename,
+            encoding,
+            parameter_official_names,
+            column_indices,
+            delimiter=delimiter,
+            check_field_counts=check_field_counts,
+        )
+
+    return column_profiles
+
+
+def read_file(
+    filename: str,
+    parameter_official_names: dict,
+    column_indices: list | None = None,
+    write_logs: bool = True,
+    check_field_counts: bool = False,
+    file_scan: dict | None = None,
+) -> dict | None:
     """
-    Read in file to a pandas dataframe and keep values as strings
-    so that integers aren't coerced to float or string depending on a fill value
+    Read in file to column profiles and keep values as strings so that
+    integers aren't coerced to float or string depending on a fill value.
     And keep NaN text, so set keep_default_na to False.
 
-    Try opening files with different encodings in case there is a UnicodeDecodeError
-    when opening the file to read it. Try the UTF-8, Windows-1252,
-    and Latin1 encodings
+    The file is streamed in chunks of rows and the first pass profile of
+    each chunk is merged into the column profiles, so the whole file is
+    never held in memory.
+
+    The encoding of the file is found from its bytes first (see
+    get_file_encoding), so the file is only parsed once. It is UTF-8,
+    Windows-1252 or Latin1. If the file still can't be decoded with its
+    encoding, for example if it changed after its encoding was found,
+    it's read with Latin1. If file_scan is given, the hash of the bytes
+    is added to it while they're read to find the encoding.
+
+    The file is read with the CSV reader chosen by its size (see
+    get_csv_reader), or with CSV_READER if it's set. If that reader
+    can't read the file the same way as pandas, it's read with pandas.
+    TSV files are read directly, with the delimiter found from the
+    header line (see get_file_delimiter).
 
     If the number of headers and data columns don't match, Pandas throws a parse error.
     These files aren't processed because they don't match a parameter name with
@@ -1325,101 +1962,170 @@ def read_file(filename: str) -> pd.DataFrame:
     20 columns are expected, but 21 are found. And the problem can also come
     from bad converstion from tsv to csv.
 
+    When a file is split into parts by its columns, only the first part
+    writes to the log files (write_logs) so a file is only logged once.
+    Only the first part checks the number of fields in each row
+    (check_field_counts, see read_file_chunks), so a file with a row
+    with too many fields has no results, the same as when it isn't
+    split.
+
     Returns:
-        pd.DataFrame: df
+        dict | None: column_profiles
     """
 
+    with time_stage("encoding"):
+        encoding, is_simple = get_file_encoding(filename, file_scan)
+
+    if encoding != "utf-8":
+        print(f"Encoding of {filename} is {encoding}")
+
+    delimiter = get_file_delimiter(filename)
+
+    csv_reader = get_csv_reader(
+        os.path.getsize(filename), encoding, is_simple, CSV_READER
+    )
+
     try:
         try:
-            df = pd.read_csv(
+            column_profiles = read_file_with_reader(
                 filename,
-                encoding="utf-8",
-                dtype=str,
-                keep_default_na=False,
-                skipinitialspace=True,
-                sep=",",
+                encoding,
+                parameter_official_names,
+                column_indices,
+                csv_reader,
+                delimiter,
+                check_field_counts,
             )
-        except pd.errors.ParserError as e:
-            df = pd.DataFrame()
-            print(f"Could not open {filename} with pandas to read it in with utf-8 \n")
-            print("Pandas parse error")
-            print(e)
-    except UnicodeDecodeError as e:
-        print(f"UnicodeDecodeError for {filename} opening with utf-8")
-        try:
-            try:
-                df = pd.read_csv(
-                    filename,
-                    encoding="windows-1252",
-                    dtype=str,
-                    keep_default_na=False,
-                    skipinitialspace=True,
-                    sep=",",
-                )
-                with open(log_encodings_not_utf8_file, "a") as f:
-                    f.write(f"{filename} encoding is windows-1252\n")
+        except UnicodeDecodeError:
+            # Latin1 can decode any byte, so the file can always be
+            # read with it, the same as before its encoding was found
+            # from its bytes
+            print(f"UnicodeDecodeError for {filename} opening with {encoding}")
 
-            except pd.errors.ParserError as e:
-                df = pd.DataFrame()
-                print(
-                    f"Could not open {filename} with pandas to read it in with windows-1252\n"
-                )
-                print("Pandas parse error")
-                print(e)
-        except UnicodeDecodeError as e:
-            print(f"UnicodeDecodeError for {filename} opening with windows-1252")
-            try:
-                try:
-                    df = pd.read_csv(
-                        filename,
-                        encoding="latin1",
-                        dtype=str,
-                        keep_default_na=False,
-                        skipinitialspace=True,
-                        sep=",",
-                    )
+            encoding = "latin1"
 
-                    with open(log_encodings_not_utf8_file, "a") as f:
-                        f.write(f"{filename} encoding is latin1\n")
+            column_profiles = read_file_chunks(
+                filename,
+                encoding,
+                parameter_official_names,
+                column_indices,
+                delimiter=delimiter,
+                check_field_counts=check_field_counts,
+            )
+    except pd.errors.ParserError as e:
+        column_profiles = None
+        print(f"Could not open {filename} with pandas to read it in with {encoding}\n")
+        print("Pandas parse error")
+        print(e)
+    else:
+        if encoding != "utf-8" and write_logs:
+            write_log(log_encodings_not_utf8_file, f"{filename} encoding is {encoding}")
 
-                except pd.errors.ParserError as e:
-                    df = pd.DataFrame()
-                    print(
-                        f"Could not open {filename} with pandas to read it in with ;latin1\n"
-                    )
-                    print("Pandas parse error")
-                    print(e)
-            except UnicodeDecodeError as e:
-                print(
-                    f"UnicodeDecodeError: {filename} not opened as utf-8, windows-1252 or latin1"
-                )
-                with open(log_encodings_not_utf8_file, "a") as f:
-                    f.write(f"{filename} encoding unknown and not opened\n")
-                df = pd.DataFrame()
+    return column_profiles
+
+
+def read_file_range(
+    filename: str,
+    byte_range: tuple,
+    parameter_official_names: dict,
+    file_scan: dict | None = None,
+) -> dict | None:
+    """
+    Read in the rows of a byte range of a file (see get_file_row_ranges)
+    to column profiles. Files are only split into rows if they are UTF-8,
+    so the range is read as UTF-8. A range without any rows has empty
+    column profiles. The bytes of the range are checked as they are
+    read, and RowsNotSplittable is raised if they have a quote character
+    or aren't UTF-8 (see FileRangeReader).
+
+    Ranges aren't checked for line breaks of only a carriage return the
+    way whole files are (see get_file_encoding), so they are always read
+    with pandas.
 
-    return df
+    If file_scan is given and the whole range was read, the end of the
+    range and the hash of its bytes are added to it as one segment, and
+    whether the range ends with a line break.
+
+    Returns:
+        dict | None: column_profiles (None if the rows can't be parsed)
+    """
 
+    delimiter = get_file_delimiter(filename)
 
-def get_params_datatypes_formats_fill(csv_file: str) -> dict | None:
-    # Read in file to a pandas dataframe (all string values)
-    df = read_file(csv_file)
+    try:
+        with open_file_range(Path(filename), byte_range) as f:
+            column_profiles = read_file_chunks(
+                f, "utf-8", parameter_official_names, delimiter=delimiter
+            )
 
-    # Get parameter column names as listed in the csv file
-    column_names = list(df.columns)
+            if file_scan is not None and f.raw.remaining == 0:
+                file_scan["segments"] = [[byte_range[1], f.raw.range_hash.hexdigest()]]
+                file_scan["ends_with_line_break"] = f.raw.last_byte == b"\n"
+    except pd.errors.ParserError as e:
+        print(f"Could not open {filename} with pandas to read it in with utf-8 \n")
+        print("Pandas parse error")
+        print(e)
+        return None
+
+    if column_profiles is None:
+        column_profiles = {}
+
+    return column_profiles
+
+
+def get_params_datatypes_formats_fill(
+    csv_file: str,
+    column_indices: list | None = None,
+    write_logs: bool = True,
+    parameter_official_names: dict | None = None,
+    check_field_counts: bool = False,
+    file_scan: dict | None = None,
+) -> dict | None:
+    # If column_indices is given, only the parameters in those
+    # column positions are inferred (see get_file_tasks). The first
+    # part of a file checks the field counts of its rows for all the
+    # parts (see read_file_chunks) and hashes the file (file_scan).
 
     # Get associated official names for each parameter in the csv file
     # This will be used to determine if a parameter is classified as a
-    # datetime (time, date, datetime)
-    parameter_official_names = get_parameters_official_names(csv_file, column_names)
+    # datetime (time, date, datetime). They are usually sent with the task.
+    if parameter_official_names is None:
+        parameter_official_names = get_parameters_official_names(csv_file)
+
+    # Read in file in chunks and do a first pass of inferring the format,
+    # datatype and fill value for each value in a column. Each chunk is
+    # summarized into a profile of each column (all string values).
+    with time_stage("read_file"):
+        results = read_file(
+            csv_file,
+            parameter_official_names,
+            column_indices,
+            write_logs,
+            check_field_counts,
+            file_scan,
+        )
 
-    # Do a first pass of inferring to get the format, datatype and
-    # fill value for each value in a column.
-    # And include the column values into a results dict.
-    if not df.empty:
-        results = infer_values_first_pass(df, parameter_official_names)
+    final_results = get_final_results(
+        csv_file, results, parameter_official_names, write_logs
+    )
 
-    else:
-        results = None
+    return final_results
+
+
+def get_final_results(
+    csv_file: str,
+    results: dict | None,
+    parameter_official_names: dict,
+    write_logs: bool = True,
+) -> dict | None:
+    """
+    Find the final datatype, format and fill value of each column from
+    the column profiles of the first pass. The profiles can be those of
+    a whole file or the merged profiles of the row ranges of a file.
+
+    Returns:
+        dict | None: final_results
+    """
 
     # Get a list of fill values that are either one of the
     # defined possible fill values or a minus 9s fill. And
@@ -1439,93 +2145,1227 @@ def get_params_datatypes_formats_fill(csv_file: str) -> dict | None:
     # otherwise determine if have an integer or float column.
     if results is not None:
         try:
-            final_results = infer_values_second_pass(
-                csv_file, results, parameter_official_names
-            )
+            with time_stage("second_pass"):
+                final_results = infer_values_second_pass(
+                    csv_file, results, parameter_official_names
+                )
         except:
             final_results = None
     else:
         final_results = None
 
         print(f"{csv_file} has no results")
-        with open(log_no_results_file, "a") as f:
-            f.write(f"{csv_file}\n")
+        if write_logs:
+            write_log(log_no_results_file, csv_file)
 
     return final_results
 
 
-def process_file(file: Path):
-    csv_file = file.as_posix()
+def get_file_result(csv_file: str, final_results: dict | None) -> tuple | None:
+    """
+    Get the overview and summary of a file from its final results
 
-    file_size = os.stat(csv_file)
-    kb_size = round(file_size.st_size / 1024, 3)
+    Returns:
+        tuple | None: overview, summary_obj
+    """
 
-    print(f"\n******************\n")
-    print(f"File being processed is {csv_file} size: {kb_size} KB\n")
+    if final_results is None:
+        return None
 
-    final_results = get_params_datatypes_formats_fill(csv_file)
+    # If multiple formats for param, write info to a log file for referencing
+    # later to see if will add to current set of possible fill values
+    # and not the final file
+    overview = get_parameters_overview(csv_file, final_results)
 
-    if final_results is not None:
-        # If multiple formats for param, write info to a log file for referencing
-        # later to see if will add to current set of possible fill values
-        # and not the final file
-        save_parameters_overview(csv_file, final_results)
+    summary_obj = get_parameters_final_results(csv_file, final_results)
 
-        write_parameters_final_results(csv_file, final_results)
+    return overview, summary_obj
 
 
-def main():
-    # TODO
-    # Create Test files
+def get_task_parameter_official_names(file_task: FileTask) -> dict:
+    """
+    Get the parameter official names sent with a task, or read them if
+    the main process couldn't
 
-    parameters_overview_path = Path(parameters_overview_file)
-    parameters_overview_path.unlink(missing_ok=True)
+    Returns:
+        dict: parameter_official_names
+    """
 
-    log_encodings_not_utf8_path = Path(log_encodings_not_utf8_file)
-    log_encodings_not_utf8_path.unlink(missing_ok=True)
+    if file_task.parameter_official_names is not None:
+        return file_task.parameter_official_names
 
-    log_no_results_file_path = Path(log_no_results_file)
-    log_no_results_file_path.unlink(missing_ok=True)
+    return get_parameters_official_names(file_task.file.as_posix())
 
-    # Remove summary file since want to start fresh for each
-    # program run as the output is appended
-    os.makedirs("../output", exist_ok=True)
-    try:
-        os.remove(parameters_summary_file)
-    except OSError as e:
-        if e.errno != errno.ENOENT:  # errno.ENOENT = no such file or directory
-            raise  # re-raise exception if a different error occurred
 
-    files = Path(top_data_folder).glob("**/dataURL/*.csv")
+def process_file(file_task: FileTask) -> tuple:
+    """
+    Find the parameter datatypes, formats and fill values of a file,
+    or of the columns of a part of a file. Runs in a worker process,
+    so the results are returned for the main process to write.
+
+    For a range of rows of a file, only the first pass is done and the
+    column profiles are returned to be merged with the other ranges.
+    The file_scan of a range tells the main process if its bytes were
+    UTF-8 without quote characters. If they weren't, the range has no
+    column profiles and the file has to be read as a whole.
+
+    The file_scan also has the size and modification time of the file
+    before it was read and the hash of the bytes read, so the main
+    process can cache the results without reading the file (see
+    result_cache). Only the first part of a file split by its columns
+    hashes the file.
+
+    If the task keeps the profile state of the file, the column profiles
+    of the whole file are returned with the offset they were read up to
+    (see profile_states).
+
+    Returns:
+        tuple: final_results (or column_profiles of a row range),
+            profile_state, file_scan
+    """
 
-    file_list = list(files)
+    csv_file = file_task.file.as_posix()
 
-    num_files = len(file_list)
-    print(f"Number of files to process is {num_files}")
+    file_size = os.stat(csv_file)
+    kb_size = round(file_size.st_size / 1024, 3)
 
-    num_cores = multiprocessing.cpu_count()
+    file_scan = {"size": file_size.st_size, "mtime_ns": file_size.st_mtime_ns}
 
-    start_time = time.time()
+    print(f"\n******************\n")
+    print(f"File being processed is {csv_file} size: {kb_size} KB\n")
 
-    PROCESSES = num_cores - 2
+    if file_task.byte_range is not None:
+        print(
+            f"Part {file_task.part + 1} of {file_task.number_parts} with bytes {file_task.byte_range}\n"
+        )
 
-    with multiprocessing.Pool(PROCESSES) as pool:
-        pool.map(process_file, file_list)
+        parameter_official_names = get_task_parameter_official_names(file_task)
 
-    try:
-        # Add [] to summary file of dicts of datatypes and formats
-        with open(parameters_summary_file, "r") as f:
-            summary = f.read()
+        try:
+            with time_stage("read_file"):
+                column_profiles = read_file_range(
+                    csv_file,
+                    file_task.byte_range,
+                    parameter_official_names,
+                    file_scan,
+                )
+        except RowsNotSplittable as e:
+            print(f"Rows of {csv_file} can't be read in ranges, it has {e}\n")
+            return None, None, {"is_utf8_without_quotes": False}
 
-        # strip last ','
-        summary = summary[:-1]
+        file_scan["is_utf8_without_quotes"] = True
 
-        final_str = f"[{summary}]"
+        return column_profiles, None, file_scan
 
-        with open(parameters_summary_file, "w") as f:
-            f.write(final_str)
-    except FileNotFoundError:
-        print("Summary file not created")
+    if file_task.number_parts > 1:
+        print(
+            f"Part {file_task.part + 1} of {file_task.number_parts} with {len(file_task.column_indices)} columns\n"
+        )
+
+    if file_task.part > 0:
+        file_scan = None
+
+    if not file_task.keep_profile_state:
+        final_results = get_params_datatypes_formats_fill(
+            csv_file,
+            file_task.column_indices,
+            write_logs=file_task.part == 0,
+            parameter_official_names=file_task.parameter_official_names,
+            check_field_counts=file_task.part == 0,
+            file_scan=file_scan,
+        )
+
+        return final_results, None, file_scan
+
+    parameter_official_names = get_task_parameter_official_names(file_task)
+
+    with time_stage("read_file"):
+        column_profiles = read_file(
+            csv_file, parameter_official_names, file_scan=file_scan
+        )
+
+    final_results = get_final_results(
+        csv_file, column_profiles, parameter_official_names
+    )
+
+    # The state is made from the bytes hashed while the file was read
+    profile_state = get_profile_state(csv_file, file_scan, column_profiles)
+
+    return final_results, profile_state, file_scan
+
+
+def process_file_task(file_task: FileTask) -> tuple:
+    """
+    Process a file of a task from get_file_tasks. The log lines written
+    for the file are returned with its results so they can be cached
+    with them, and its metrics if they are enabled (see run_metrics).
+    The file is profiled if profiling is started (see worker_profiles).
+
+    Returns:
+        tuple: final_results, log_lines, profile_state, file_scan, metrics
+    """
+
+    start_recording_logs()
+    start_recording_metrics()
+
+    with profile_file(), time_stage("process"):
+        final_results, profile_state, file_scan = process_file(file_task)
+
+    log_lines = stop_recording_logs()
+
+    metrics = stop_recording_metrics()
+
+    return final_results, log_lines, profile_state, file_scan, metrics
+
+
+def get_task_results(
+    supervised_results,
+    cache_keys: dict,
+    stopped_files: set,
+    metrics_filename: str | None = None,
+):
+    """
+    Get the results of each file task from the worker pool and write
+    the log lines the worker recorded for it. A file that was stopped
+    for going past the time or memory limit has no results and is
+    written to the log of stopped files with how far it got. A file
+    that raised an exception (see ItemError) has no results either, its
+    traceback is printed and it's written to the log of failed files
+    with the exception. Either way, it's removed from cache_keys so its
+    results aren't cached and added to stopped_files so it isn't
+    recorded as finished in the run manifest, and it's tried again on
+    the next run.
+
+    If metrics_filename is given, the metrics of each file task are
+    written to it.
+
+    Returns:
+        generator: (file_task, final_results, log_lines, profile_state,
+            file_scan)
+    """
+
+    for file_task, result, limit_info in supervised_results:
+        if limit_info is None and not isinstance(result, ItemError):
+            final_results, log_lines, profile_state, file_scan, metrics = result
+
+            # Workers only record their log lines
+            replay_logs(log_lines)
+
+            if metrics_filename is not None and metrics is not None:
+                write_metrics(
+                    metrics_filename,
+                    {
+                        "file": file_task.file.as_posix(),
+                        "part": file_task.part,
+                        "number_parts": file_task.number_parts,
+                        "bytes": file_task.size,
+                        **metrics,
+                    },
+                )
+
+            yield file_task, final_results, log_lines, profile_state, file_scan
+            continue
+
+        csv_file = file_task.file.as_posix()
+
+        cache_keys.pop(csv_file, None)
+        stopped_files.add(csv_file)
+
+        if file_task.number_parts > 1:
+            part = f" (part {file_task.part + 1} of {file_task.number_parts})"
+        else:
+            part = ""
+
+        start_recording_logs()
+
+        if limit_info is None:
+            print(f"{csv_file}{part} failed with an error")
+            print(result.traceback)
+
+            # One line per file, since the logs of shards are merged by line
+            error = result.traceback.strip().splitlines()[-1]
+
+            write_log(log_failed_file, f"{csv_file}{part} failed with {error}")
+
+            yield file_task, None, stop_recording_logs(), None, None
+            continue
+
+        if limit_info["rss_bytes"] is None:
+            memory = "unknown"
+        else:
+            memory = f"{round(limit_info['rss_bytes'] / (1024 * 1024))} MB"
+
+        print(f"{csv_file}{part} stopped by the {limit_info['limit']}")
+
+        write_log(
+            log_limit_exceeded_file,
+            f"{csv_file}{part} stopped by the {limit_info['limit']} after "
+            f"{limit_info['seconds']:.1f} seconds with {memory} of memory "
+            f"and {limit_info['rows_read']} rows read",
+        )
+
+        yield file_task, None, stop_recording_logs(), None, None
+
+
+def get_read_file_scan(file_scans: list, segments: list | None = None) -> dict | None:
+    """
+    Put the file scans of the parts of a file that read its bytes
+    together into the size and modification time of the file before it
+    was read, the hashes of the segments the parts read and the hash of
+    its contents (see get_segments_hash), and whether it's UTF-8 without
+    quote characters and ends with a line break (see get_profile_state).
+    The parts read the file in order, and there is only one unless the
+    file was split into ranges of rows. segments are the hashes of the
+    bytes before the first part, if it doesn't start at the start of the
+    file. They are the rows of a profile state, so they are UTF-8
+    without quote characters. If the parts didn't hash every byte of
+    the file as it was before it was read, return None.
+
+    Returns:
+        dict | None: file_scan
+    """
+
+    if segments is None:
+        segments = []
+    else:
+        segments = list(segments)
+
+    for file_scan in file_scans:
+        if (
+            file_scan is None
+            or "segments" not in file_scan
+            or file_scan["size"] != file_scans[0]["size"]
+            or file_scan["mtime_ns"] != file_scans[0]["mtime_ns"]
+        ):
+            return None
+
+        segments.extend(file_scan["segments"])
+
+    if segments[-1][0] != file_scans[0]["size"]:
+        return None
+
+    file_scan = {
+        "size": file_scans[0]["size"],
+        "mtime_ns": file_scans[0]["mtime_ns"],
+        "segments": segments,
+        "hash": get_segments_hash(segments),
+        "is_utf8_without_quotes": all(
+            file_scan["is_utf8_without_quotes"] for file_scan in file_scans
+        ),
+        "ends_with_line_break": file_scans[-1]["ends_with_line_break"],
+    }
+
+    return file_scan
+
+
+def collect_file_results(task_results, add_task, appended_files: dict | None = None):
+    """
+    Put the results of the parts of split files back together and yield
+    the final results of each file once all its parts are done.
+    Columns are put back in their file order.
+
+    If a range of rows of a file turns out not to be UTF-8 without quote
+    characters, the file is read as a whole instead, by a task given to
+    add_task (see SupervisedPool.add_task), and the results of its other
+    ranges are dropped.
+
+    The rows appended to a file in appended_files (see
+    get_appended_byte_range) are merged into its saved column profiles.
+
+    The file scans of the parts are put together into the file scan of
+    the file (see get_read_file_scan), and the profile state of a file
+    read in ranges of rows is made from it (see get_profile_state).
+
+    Returns:
+        generator: (csv_file, final_results, log_lines, profile_state,
+            file_scan)
+    """
+
+    if appended_files is None:
+        appended_files = {}
+
+    split_file_results = {}
+
+    # Files read as a whole after a range of rows couldn't be read
+    unsplit_files = set()
+
+    for file_task, final_results, log_lines, profile_state, file_scan in task_results:
+        csv_file = file_task.file.as_posix()
+
+        if file_task.number_parts == 1 and file_task.byte_range is None:
+            file_scan = get_read_file_scan([file_scan])
+
+            yield csv_file, final_results, log_lines, profile_state, file_scan
+            continue
+
+        if csv_file in unsplit_files:
+            continue
+
+        if (
+            file_task.byte_range is not None
+            and file_scan is not None
+            and not file_scan["is_utf8_without_quotes"]
+        ):
+            print(f"Reading {csv_file} as a whole")
+
+            split_file_results.pop(csv_file, None)
+            unsplit_files.add(csv_file)
+
+            add_task(
+                [
+                    FileTask(
+                        file_task.file,
+                        get_file_size(file_task.file),
+                        keep_profile_state=file_task.keep_profile_state,
+                        parameter_official_names=file_task.parameter_official_names,
+                    )
+                ]
+            )
+            continue
+
+        parts, parts_log_lines, parts_file_scans = split_file_results.setdefault(
+            csv_file, ({}, {}, {})
+        )
+        parts[file_task.part] = final_results
+        parts_log_lines[file_task.part] = log_lines
+        parts_file_scans[file_task.part] = file_scan
+
+        if len(parts) < file_task.number_parts:
+            continue
+
+        del split_file_results[csv_file]
+
+        log_lines = []
+        for part in range(file_task.number_parts):
+            log_lines.extend(parts_log_lines[part])
+
+        if file_task.byte_range is not None:
+            appended = appended_files.get(csv_file)
+
+            start_recording_logs()
+
+            if appended is None:
+                final_results, column_profiles = merge_row_range_results(
+                    csv_file, parts
+                )
+            else:
+                print(f"Merged the appended rows of {csv_file}")
+
+                final_results, column_profiles = merge_row_range_results(
+                    csv_file, parts, appended["column_profiles"]
+                )
+
+            log_lines.extend(stop_recording_logs())
+
+            file_scans = [
+                parts_file_scans[part] for part in range(file_task.number_parts)
+            ]
+
+            if appended is None:
+                file_scan = get_read_file_scan(file_scans)
+            else:
+                file_scan = get_read_file_scan(file_scans, appended["prefix_segments"])
+
+            profile_state = None
+
+            if file_task.keep_profile_state:
+                profile_state = get_profile_state(csv_file, file_scan, column_profiles)
+
+            yield csv_file, final_results, log_lines, profile_state, file_scan
+            continue
+
+        # Only the first part of a file split by its columns hashes it
+        file_scan = get_read_file_scan([parts_file_scans[0]])
+
+        # The parts read the same rows, so if one part couldn't be
+        # read or inferred, the file has no results
+        if any(parts[part] is None for part in range(file_task.number_parts)):
+            yield csv_file, None, log_lines, None, file_scan
+            continue
+
+        final_results = {}
+
+        for part in range(file_task.number_parts):
+            final_results.update(parts[part])
+
+        yield csv_file, final_results, log_lines, None, file_scan
+
+
+def get_file_results(
+    collected_results,
+    result_cache: ResultCache | None,
+    cache_keys: dict,
+    profile_store: ProfileStore | None = None,
+    parameters_info_filenames: dict | None = None,
+    run_manifest: RunManifest | None = None,
+    metrics_filename: str | None = None,
+    stopped_files: set | None = None,
+):
+    """
+    Save the final results of each processed file in the cache, and its
+    profile state if there is a profile store, record it as finished in
+    the run manifest and yield the overview and summary of the file.
+    parameters_info_filenames has the parameters info file of each
+    processed file if there is a result cache. Files in stopped_files
+    were stopped by a limit or failed with an error and aren't recorded
+    as finished.
+
+    The cache key of a file is made from the hash of its contents in
+    its file_scan, found by the worker that read it, since a new or
+    changed file has no key before it's read (see select_uncached_files).
+
+    If metrics_filename is given, the time the main process takes to
+    save and write the results of each file is written to it.
+
+    Returns:
+        generator: file_results
+    """
+
+    if stopped_files is None:
+        stopped_files = set()
+
+    for (
+        csv_file,
+        final_results,
+        log_lines,
+        profile_state,
+        file_scan,
+    ) in collected_results:
+        start_recording_metrics()
+
+        with time_stage("output"):
+            # Files stopped by a limit aren't in cache_keys
+            if result_cache is not None and csv_file in cache_keys:
+                key = cache_keys[csv_file]
+
+                if file_scan is not None:
+                    result_cache.put_data_file_hash(
+                        csv_file,
+                        file_scan["size"],
+                        file_scan["mtime_ns"],
+                        file_scan["hash"],
+                    )
+
+                    # Made again since the file may have changed since
+                    # it was found, and then it's not cached
+                    key = result_cache.get_key(
+                        csv_file, parameters_info_filenames[csv_file]
+                    )
+
+                if key is not None:
+                    result_cache.put(key, final_results, log_lines)
+
+            if profile_store is not None:
+                profile_store.put(
+                    csv_file, parameters_info_filenames[csv_file], profile_state
+                )
+
+            if run_manifest is not None and csv_file not in stopped_files:
+                run_manifest.add(csv_file, final_results, log_lines)
+
+                # Keep the log files in step with the finished files
+                flush_logs()
+
+            file_result = get_file_result(csv_file, final_results)
+
+        metrics = stop_recording_metrics()
+
+        if metrics_filename is not None and metrics is not None:
+            write_metrics(metrics_filename, {"file": csv_file, **metrics})
+
+        yield file_result
+
+
+def get_cached_file_results(
+    cached_results: dict, run_manifest: RunManifest | None = None
+):
+    """
+    Write the log lines of files with cached results again, record them
+    as finished in the run manifest and yield the overview and summary
+    of each file
+
+    Returns:
+        generator: file_results
+    """
+
+    for csv_file, cached_result in cached_results.items():
+        print(f"Using cached results of {csv_file}")
+
+        replay_logs(cached_result["log_lines"])
+
+        if run_manifest is not None:
+            run_manifest.add(
+                csv_file, cached_result["final_results"], cached_result["log_lines"]
+            )
+
+            flush_logs()
+
+        yield get_file_result(csv_file, cached_result["final_results"])
+
+
+def get_resumed_file_results(resumed_results: dict):
+    """
+    Write the log lines of files finished before the run was resumed
+    again and yield the overview and summary of each file. They are
+    already in the run manifest.
+
+    Returns:
+        generator: file_results
+    """
+
+    for csv_file, entry in resumed_results.items():
+        print(f"Using results of {csv_file} from the interrupted run")
+
+        replay_logs(entry["log_lines"])
+
+        yield get_file_result(csv_file, entry["final_results"])
+
+
+def get_result_cache(args: argparse.Namespace) -> ResultCache | None:
+    """
+    Open the cache of final results. The cached results depend on the
+    reference files, the defined fill values, the testing settings and
+    the program source, so a change to any of these makes new keys.
+
+    Returns:
+        ResultCache | None: result_cache
+    """
+
+    if args.no_cache:
+        return None
+
+    settings = {
+        "possible_fill_values": get_possible_fill_values(),
+        "testing": TESTING,
+        "number_testing_rows": NUMBER_TESTING_ROWS,
+    }
+
+    program_files = sorted(Path(__file__).parent.glob("*.py"))
+
+    settings_hash = get_settings_hash(
+        settings,
+        [possible_formats_file, bcodmo_datetime_parameters_file]
+        + [program_file.as_posix() for program_file in program_files],
+    )
+
+    # Each shard of a run has its own cache, so shards running at the
+    # same time don't write the same cache index
+    result_cache = ResultCache(
+        get_shard_filename(cache_folder, args.shard_index, args.shard_count),
+        settings_hash,
+        args.cache_size_mb * 1024 * 1024,
+    )
+
+    if args.rebuild_cache:
+        result_cache.clear()
+
+    return result_cache
+
+
+def get_profile_store(
+    args: argparse.Namespace, result_cache: ResultCache | None
+) -> ProfileStore | None:
+    """
+    Open the saved column profiles of files that can have rows appended.
+    They depend on the same settings as the cached results. When testing,
+    only the first rows of a file are read, so no profiles are saved.
+
+    Returns:
+        ProfileStore | None: profile_store
+    """
+
+    if result_cache is None or args.no_incremental or TESTING:
+        return None
+
+    profile_store = ProfileStore(
+        get_shard_filename(profiles_folder, args.shard_index, args.shard_count),
+        result_cache.settings_hash,
+    )
+
+    if args.rebuild_cache:
+        profile_store.clear()
+
+    return profile_store
+
+
+def merge_row_range_results(
+    csv_file: str, parts: dict, column_profiles: dict | None = None
+) -> tuple:
+    """
+    Merge the column profiles of the row ranges of a file in file order
+    and do the second pass on them, the same as if the whole file had
+    been read at once. If a range couldn't be parsed, the whole file
+    couldn't have been, so it has no results.
+
+    If column_profiles is given, they are the profiles of the rows
+    before the ranges and the ranges are merged into them.
+
+    Returns:
+        tuple: final_results, column_profiles
+    """
+
+    for part in range(len(parts)):
+        if parts[part] is None:
+            column_profiles = None
+            break
+
+        column_profiles = merge_column_profiles(column_profiles, parts[part])
+
+    # No rows in any of the ranges
+    if not column_profiles:
+        column_profiles = None
+
+    parameter_official_names = get_parameters_official_names(csv_file)
+
+    final_results = get_final_results(
+        csv_file, column_profiles, parameter_official_names
+    )
+
+    return final_results, column_profiles
+
+
+def select_shard_files(files, shard_index: int, shard_count: int):
+    """
+    Select the files of this shard of the run as they are found
+
+    Returns:
+        generator: shard_files
+    """
+
+    number_files = 0
+
+    for file in files:
+        if (
+            shard_count > 1
+            and get_file_shard(file.as_posix(), shard_count) != shard_index
+        ):
+            continue
+
+        number_files += 1
+
+        yield file
+
+    print(f"Number of files to process is {number_files}")
+
+
+def select_unfinished_files(files, run_manifest: RunManifest, resumed_results: dict):
+    """
+    Select the files the interrupted run didn't finish. The manifest
+    entries of the finished files are added to resumed_results.
+
+    Returns:
+        generator: unfinished_files
+    """
+
+    for file in files:
+        csv_file = file.as_posix()
+
+        entry = run_manifest.get(csv_file)
+
+        if entry is None:
+            yield file
+        else:
+            resumed_results[csv_file] = entry
+
+    print(f"Number of files finished before resuming is {len(resumed_results)}")
+
+
+def select_uncached_files(
+    files,
+    result_cache: ResultCache,
+    cached_results: dict,
+    cache_keys: dict,
+    parameters_info_filenames: dict,
+):
+    """
+    Select the files without cached results. The cached results of the
+    other files are added to cached_results, and the cache key and
+    parameters info file of the selected files to cache_keys and
+    parameters_info_filenames.
+
+    The files aren't read here. A new file, or one whose size or
+    modification time changed since it was last read, has no cache key
+    (None) and is selected. Its key is made once the worker that reads
+    it has hashed it (see get_file_results).
+
+    Returns:
+        generator: uncached_files
+    """
+
+    for file in files:
+        csv_file = file.as_posix()
+
+        parameters_info_filename = get_parameters_info_filename(csv_file)
+
+        key = result_cache.get_key(csv_file, parameters_info_filename)
+
+        if key is None:
+            cached_result = None
+        else:
+            cached_result = result_cache.get(key)
+
+        if cached_result is None:
+            cache_keys[csv_file] = key
+            parameters_info_filenames[csv_file] = parameters_info_filename
+
+            yield file
+        else:
+            cached_results[csv_file] = cached_result
+
+    print(f"Number of files with cached results is {len(cached_results)}")
+
+
+def find_appended_files(
+    files,
+    profile_store: ProfileStore,
+    parameters_info_filenames: dict,
+    appended_files: dict,
+    appended_byte_ranges: dict,
+):
+    """
+    Find the files that only had rows appended since their column
+    profiles were saved, so only the appended rows are read. They are
+    added to appended_files and appended_byte_ranges before they are
+    yielded with the other files.
+
+    Returns:
+        generator: files
+    """
+
+    for file in files:
+        csv_file = file.as_posix()
+
+        profile_state = profile_store.get(csv_file, parameters_info_filenames[csv_file])
+
+        if profile_state is not None:
+            appended = get_appended_byte_range(csv_file, profile_state)
+
+            if appended is not None:
+                appended_files[csv_file] = appended
+                appended_byte_ranges[file] = appended["byte_range"]
+
+        yield file
+
+    print(f"Number of files with appended rows is {len(appended_files)}")
+
+
+def get_file_number_columns(file: Path) -> int | None:
+    """
+    Get the number of columns in the header of a file to split it into
+    groups of columns. If the header can't be read or has a column name
+    more than once (pandas renames repeated names when all the columns
+    are read), the file isn't split.
+
+    Returns:
+        int | None: number_columns
+    """
+
+    for encoding in ["utf-8", "windows-1252", "latin1"]:
+        try:
+            header = pd.read_csv(
+                file,
+                encoding=encoding,
+                header=None,
+                nrows=1,
+                dtype=str,
+                keep_default_na=False,
+                skipinitialspace=True,
+                sep=get_file_delimiter(file),
+            )
+        except UnicodeDecodeError:
+            continue
+        except (pd.errors.ParserError, pd.errors.EmptyDataError):
+            return None
+
+        column_names = header.iloc[0].tolist()
+
+        if len(set(column_names)) < len(column_names):
+            return None
+
+        return len(column_names)
+
+    return None
+
+
+def init_worker(
+    shard_index: int,
+    shard_count: int,
+    csv_reader: str | None,
+    metrics: bool,
+    profiles_folder: str | None = None,
+):
+    """
+    Set the log shard and CSV reader of a worker process, whether it
+    records metrics and the folder its profile is written to if it's
+    profiled. Its log lines are written by the main process.
+    """
+
+    global CSV_READER
+
+    CSV_READER = csv_reader
+
+    set_log_shard(shard_index, shard_count)
+    record_logs_only()
+
+    if metrics:
+        enable_metrics()
+
+    if profiles_folder is not None:
+        start_profiling(profiles_folder)
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Infer the datatype, datetime format, and fill value of parameters in BCO-DMO data files"
+    )
+
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of cores - 2, at least 1)",
+    )
+
+    parser.add_argument(
+        "--no-split-columns",
+        action="store_true",
+        help="don't split large files into groups of columns across the workers",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="don't use or save cached results of files",
+    )
+
+    parser.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="remove all cached results and process every file again",
+    )
+
+    parser.add_argument(
+        "--cache-size-mb",
+        type=int,
+        default=MAX_CACHE_SIZE_BYTES // (1024 * 1024),
+        help="size limit of the cached results in MB",
+    )
+
+    parser.add_argument(
+        "--no-split-rows",
+        action="store_true",
+        help="don't split large files with few columns into ranges of rows across the workers",
+    )
+
+    parser.add_argument(
+        "--no-incremental",
+        action="store_true",
+        help="read files that had rows appended in full instead of only the appended rows",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="resume an interrupted run, only processing the files it didn't finish",
+    )
+
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=0,
+        help="shard of the files to process when the run is split into shards (from 0)",
+    )
+
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        default=1,
+        help="number of shards the run is split into, each run separately",
+    )
+
+    parser.add_argument(
+        "--merge-shards",
+        action="store_true",
+        help="merge the outputs of the shards of a run with --shard-count shards and exit",
+    )
+
+    parser.add_argument(
+        "--csv-reader",
+        choices=CSV_READERS,
+        default=None,
+        help="reader to read every file with (default: chosen by the size of the file)",
+    )
+
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="write the time of each stage of processing each file to a metrics file and report",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the worker processes with cProfile and write a report of the functions they spend the most time in",
+    )
+
+    parser.add_argument(
+        "--file-time-limit",
+        type=float,
+        default=FILE_TIME_LIMIT_SECONDS,
+        help="seconds a file can take before its worker is stopped (0 for no limit)",
+    )
+
+    parser.add_argument(
+        "--file-memory-limit-mb",
+        type=int,
+        default=FILE_MEMORY_LIMIT_MB,
+        help="MB of memory a worker can use for a file before it's stopped (0 for no limit)",
+    )
+
+    args = parser.parse_args()
+
+    if args.shard_count < 1 or not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be from 0 to --shard-count - 1")
+
+    return args
+
+
+def main():
+    # TODO
+    # Create Test files
+
+    args = get_args()
+
+    if args.merge_shards:
+        has_results = merge_shards(
+            args.shard_count,
+            parameters_summary_file,
+            parameters_overview_file,
+            [
+                log_encodings_not_utf8_file,
+                log_no_results_file,
+                log_limit_exceeded_file,
+                log_failed_file,
+                log_fill_w_neg_param_values_file,
+            ],
+        )
+
+        if not has_results:
+            print("Summary file not created")
+
+        return
+
+    # Each shard of a run writes its own output and log files
+    set_log_shard(args.shard_index, args.shard_count)
+
+    shard_overview_file = get_shard_filename(
+        parameters_overview_file, args.shard_index, args.shard_count
+    )
+    shard_summary_file = get_shard_filename(
+        parameters_summary_file, args.shard_index, args.shard_count
+    )
+
+    parameters_overview_path = Path(shard_overview_file)
+    parameters_overview_path.unlink(missing_ok=True)
+
+    log_encodings_not_utf8_path = Path(get_log_filename(log_encodings_not_utf8_file))
+    log_encodings_not_utf8_path.unlink(missing_ok=True)
+
+    log_no_results_file_path = Path(get_log_filename(log_no_results_file))
+    log_no_results_file_path.unlink(missing_ok=True)
+
+    log_limit_exceeded_path = Path(get_log_filename(log_limit_exceeded_file))
+    log_limit_exceeded_path.unlink(missing_ok=True)
+
+    log_failed_path = Path(get_log_filename(log_failed_file))
+    log_failed_path.unlink(missing_ok=True)
+
+    # The log lines of files finished before a resumed run and of cached
+    # files are written again, so every log starts empty
+    log_fill_w_neg_param_values_path = Path(
+        get_log_filename(log_fill_w_neg_param_values_file)
+    )
+    log_fill_w_neg_param_values_path.unlink(missing_ok=True)
+
+    # Stage times of the files are only recorded when asked for
+    if args.metrics:
+        metrics_filename = get_log_filename(run_metrics_file)
+        metrics_report_filename = get_log_filename(run_metrics_report_file)
+
+        Path(metrics_filename).unlink(missing_ok=True)
+
+        enable_metrics()
+    else:
+        metrics_filename = None
+
+    # Each worker writes its own profile, so the profiles of an earlier
+    # run are removed first
+    if args.profile:
+        profiles_folder = get_log_filename(worker_profiles_folder)
+
+        shutil.rmtree(profiles_folder, ignore_errors=True)
+        os.makedirs(profiles_folder)
+    else:
+        profiles_folder = None
+
+    # Remove summary file since want to start fresh for each
+    # program run and it's only written if there are results
+    os.makedirs("../output", exist_ok=True)
+    try:
+        os.remove(shard_summary_file)
+    except OSError as e:
+        if e.errno != errno.ENOENT:  # errno.ENOENT = no such file or directory
+            raise  # re-raise exception if a different error occurred
+
+    if args.shard_count > 1:
+        print(f"Shard {args.shard_index} of {args.shard_count}")
+
+    start_time = time.time()
+
+    # When resuming, files finished by the interrupted run aren't read
+    # again. Their results and log lines are written again from the run
+    # manifest since the output files of the interrupted run can stop
+    # partway through a file.
+    run_manifest = RunManifest(
+        get_shard_filename(run_manifest_file, args.shard_index, args.shard_count),
+        args.resume,
+    )
+
+    result_cache = get_result_cache(args)
+    profile_store = get_profile_store(args, result_cache)
+
+    # The data folder is walked while the files found are processed.
+    # Each file goes through these steps as soon as it's found, and the
+    # number of files of each step is printed once the walk is done.
+    resumed_results = {}
+    cached_results = {}
+    cache_keys = {}
+    stopped_files = set()
+    parameters_info_filenames = {}
+    appended_files = {}
+    appended_byte_ranges = {}
+
+    files = select_shard_files(
+        FileDiscovery(top_data_folder), args.shard_index, args.shard_count
+    )
+
+    if args.resume:
+        files = select_unfinished_files(files, run_manifest, resumed_results)
+
+    if result_cache is not None:
+        files = select_uncached_files(
+            files, result_cache, cached_results, cache_keys, parameters_info_filenames
+        )
+
+    if profile_store is not None:
+        files = find_appended_files(
+            files,
+            profile_store,
+            parameters_info_filenames,
+            appended_files,
+            appended_byte_ranges,
+        )
+
+    # The number of files isn't known until the walk is done
+    PROCESSES = get_number_processes(args.processes)
+
+    # Files in the order they are found and small files in batches,
+    # made in a thread of the worker pool, which hands out the largest
+    # waiting task first. Large files are split by columns, or by rows
+    # if they have few columns, so more than one worker can work on
+    # them. When testing, only the first rows of a file are read, so
+    # files aren't split into rows.
+    split_columns = not args.no_split_columns
+    split_rows = not args.no_split_rows and not TESTING
+
+    if not split_columns and not split_rows:
+        get_number_columns = None
+    else:
+        get_number_columns = get_file_number_columns
+
+    file_tasks = get_file_tasks(
+        files,
+        PROCESSES,
+        get_number_columns,
+        split_columns,
+        split_rows,
+        appended_byte_ranges,
+        keep_profile_states=profile_store is not None,
+        get_parameter_names=get_file_parameter_official_names,
+    )
+
+    try:
+        # A file that goes past the time or memory limit is stopped
+        # and its worker is started again
+        with SupervisedPool(
+            process_file_task,
+            PROCESSES,
+            time_limit_seconds=args.file_time_limit or None,
+            memory_limit_bytes=args.file_memory_limit_mb * 1024 * 1024 or None,
+            initializer=init_worker,
+            initargs=(
+                args.shard_index,
+                args.shard_count,
+                args.csv_reader,
+                args.metrics,
+                profiles_folder,
+            ),
+            finalizer=stop_profiling,
+        ) as pool:
+            # Write the results of each file as soon as a worker finishes it
+            task_results = get_task_results(
+                pool.imap_unordered(file_tasks, get_task_size),
+                cache_keys,
+                stopped_files,
+                metrics_filename,
+            )
+
+            # Files finished before resuming and files with cached
+            # results are only known once the walk is done, so they
+            # are written after the processed files
+            file_results = itertools.chain(
+                get_file_results(
+                    collect_file_results(task_results, pool.add_task, appended_files),
+                    result_cache,
+                    cache_keys,
+                    profile_store,
+                    parameters_info_filenames,
+                    run_manifest,
+                    metrics_filename,
+                    stopped_files,
+                ),
+                get_resumed_file_results(resumed_results),
+                get_cached_file_results(cached_results, run_manifest),
+            )
+
+            has_results = write_results(
+                file_results, shard_overview_file, shard_summary_file
+            )
+    finally:
+        # Keep the results of the files finished so far
+        if result_cache is not None:
+            result_cache.save()
+
+        close_logs()
+        close_metrics()
+
+    if not has_results:
+        print("Summary file not created")
+
+    if metrics_filename is not None:
+        report = write_metrics_report(metrics_filename, metrics_report_filename)
+
+        if report is not None:
+            print(report)
+
+    if profiles_folder is not None:
+        number_profiles = write_profile_report(
+            profiles_folder,
+            get_log_filename(worker_profile_report_file),
+            get_log_filename(worker_profile_file),
+        )
+
+        print(f"Number of worker profiles merged is {number_profiles}")
 
     end_time = time.time()
 
@@ -1,5 +1,9 @@
 import math
 import numpy as np
+import pandas as pd
+
+from column_profile import ColumnProfile
+from run_logs import write_log
 
 # TODO
 # search for fill values that are postitive 9s fill in a negative numeric
@@ -8,6 +12,13 @@ import numpy as np
 
 log_fill_w_neg_param_values_file = "../logs/log_fill_w_neg_param_value.txt"
 
+# Column values that match these patterns can be converted with int() or
+# float() without raising an error, so they don't need to be checked one
+# at a time. Any other value falls back to the single value checks.
+INTEGER_PATTERN = r"[+-]?[0-9]+"
+FLOAT_PATTERN = r"[+-]?(?:[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?"
+MINUS_9S_CHARS_PATTERN = r"[-9.0]+"
+
 
 def get_possible_fill_values() -> list:
     """
@@ -42,16 +53,20 @@ def get_possible_fill_values() -> list:
 
 
 def get_unique_parameter_fill_value(
-    csv_file: str, col_name: str, results: dict
+    csv_file: str, col_name: str, column_profile: ColumnProfile
 ) -> tuple:
-    is_datetime = results[col_name]["is_datetime"]
-    numeric_values = results[col_name]["numeric_values"]
-    string_values = results[col_name]["string_values"]
-    datetime_string_values = results[col_name]["datetime_string_values"]
+    is_datetime = column_profile.is_datetime
+
+    # The profile keeps the distinct fill and string values of the column.
+    # In a datetime column, the string values are the values without a
+    # datetime format that aren't a fill value.
+    string_values = column_profile.string_values
+    datetime_string_values = column_profile.string_values
+
+    found_possible_fill_values = list(column_profile.possible_fill_values)
+    minus_9s = list(column_profile.minus_9s)
 
-    fills_obj = results[col_name]["fills_obj"]
-    found_possible_fill_values = fills_obj["found_possible_fill_values"]
-    minus_9s = fills_obj["minus_9s"]
+    fills_obj = {}
 
     dateime_has_multiple_fill_types = False
 
@@ -132,7 +147,7 @@ def get_unique_parameter_fill_value(
             and not len(string_values)
         ):
             fill_value = check_numeric_minus_9s_fill_value(
-                csv_file, col_name, minus_9s, numeric_values
+                csv_file, col_name, minus_9s, column_profile
             )
             alt_fill_value = None
         elif (
@@ -192,13 +207,17 @@ def check_datetime_minus_9s_fill_value(
 
 
 def check_numeric_minus_9s_fill_value(
-    csv_file: str, col_name: str, minus_9s: list, numeric_values: list
+    csv_file: str, col_name: str, minus_9s: list, column_profile: ColumnProfile
 ) -> int | float | None:
     """
     Check if a fill of minus 9s sequence is acceptable. It's
     acceptable if there is only one possiblity in a column
     and that the numeric values are all positive.
 
+    The negative values close to the fill value form a range, so all the
+    negative values in the column are the fill value if the smallest and
+    largest negative values are.
+
     Returns:
         str | None: fill_value
     """
@@ -214,24 +233,23 @@ def check_numeric_minus_9s_fill_value(
         found_fill = None
 
     if found_fill is not None:
-        negative_numeric_values = [
-            val
-            for val in numeric_values
-            if val < 0 and not math.isclose(val, float(found_fill))
-        ]
+        has_other_negative_values = column_profile.negative_count > 0 and not (
+            math.isclose(column_profile.numeric_min, float(found_fill))
+            and math.isclose(column_profile.negative_max, float(found_fill))
+        )
 
         # If there are negative numbers in a column besides the fill value, don't save a minus 9s fill
-        if len(negative_numeric_values):
+        if has_other_negative_values:
             fill_value = None
 
             # TODO
             # Save to a log file that a fill value was found
             # in the csv_file
             # but there were negative values besides the fill value
-            with open(log_fill_w_neg_param_values_file, "a") as f:
-                f.write(
-                    f"file: {csv_file} param {col_name} has minus 9s fills {found_9s_fill} with neg param values\n"
-                )
+            write_log(
+                log_fill_w_neg_param_values_file,
+                f"file: {csv_file} param {col_name} has minus 9s fills {found_9s_fill} with neg param values",
+            )
 
         else:
             fill_value = found_fill
@@ -347,114 +365,99 @@ def find_non_datetime_cell_value(col_value: str, datatype: str) -> tuple:
     return possible_fill_value, string_value, minus_9s_value, numeric_value
 
 
-def find_non_datetime_fill_values(
-    value: str,
-    datatype: str,
-    string_values: list,
-    numeric_values: list,
-    fills_obj: dict,
-) -> tuple:
-    # If the column is not a datetime column, gather
-    # numeric values in a column to check if they are
-    # all positive or not since checking a minus 9s fill
-    # only for columns with all positive values. For a
-    # mixed value column or negative column, a minus 9s fill
-    # value may actually be a data point. Also
-    # look at strings to find alternate string fill values
-    (
-        possible_fill_value,
-        string_value,
-        minus_9s_value,
-        numeric_value,
-    ) = find_non_datetime_cell_value(value, datatype)
-
-    found_possible_fill_values = fills_obj["found_possible_fill_values"]
-    all_fill_values = fills_obj["all_fill_values"]
-    all_possible_and_minus9s_fills = fills_obj["all_possible_and_minus9s_fills"]
-    minus_9s = fills_obj["minus_9s"]
+def check_are_minus_9s(values: pd.Series) -> pd.Series:
+    """
+    Column version of check_is_minus_9s. Only values made up of the
+    characters -, 9, . and 0 can be a minus 9s value, so those are found
+    for the whole column at once and check_is_minus_9s is only run on
+    each unique candidate.
 
-    if possible_fill_value is not None:
-        found_possible_fill_values.append(possible_fill_value)
-        all_fill_values.append(possible_fill_value)
-        all_possible_and_minus9s_fills.append(possible_fill_value)
+    Returns:
+        pd.Series: is_minus_9s
+    """
 
-    if minus_9s_value is not None:
-        minus_9s.append(minus_9s_value)
-        all_fill_values.append(minus_9s_value)
-        all_possible_and_minus9s_fills.append(minus_9s_value)
+    is_minus_9s = pd.Series(False, index=values.index)
 
-    if string_value is not None:
-        string_values.append(string_value)
-        all_fill_values.append(string_value)
-        all_possible_and_minus9s_fills.append(None)
+    is_candidate = values.str.fullmatch(MINUS_9S_CHARS_PATTERN)
 
-    if numeric_value is not None:
-        numeric_values.append(numeric_value)
+    if is_candidate.any():
+        candidate_values = values[is_candidate]
 
-    if possible_fill_value is None and string_value is None and minus_9s_value is None:
-        all_fill_values.append(None)
-        all_possible_and_minus9s_fills.append(None)
+        checked_values = {
+            value: check_is_minus_9s(value) for value in candidate_values.unique()
+        }
 
-    fills_obj["found_possible_fill_values"] = found_possible_fill_values
-    fills_obj["all_fill_values"] = all_fill_values
-    fills_obj["all_possible_and_minus9s_fills"] = all_possible_and_minus9s_fills
-    fills_obj["minus_9s"] = minus_9s
+        is_minus_9s[is_candidate] = candidate_values.map(checked_values)
 
-    return string_values, numeric_values, fills_obj
+    return is_minus_9s
 
 
-def find_datetime_cell_value(col_value: str, has_datetime_format: bool) -> tuple:
+def get_numeric_values(values: pd.Series, datatypes: pd.Series) -> pd.Series:
     """
-    Check whether a column value is a fill value. A fill value can
-    be one of the possible fill values defined in the function
-    get_possible_fill_values, a minus 9s value, or a string which will
-    be determined later if it is unique in a datetime column.
+    Get the numeric values of the integer and float column values.
+    Plain integers and decimals are converted all at once. Other values
+    with a numeric datatype (like 1e-12 or inf) are converted one unique
+    value at a time with find_non_datetime_cell_value so an integer
+    datatype value that int() can't read is left out like before.
 
     Returns:
-        str | None: possible_fill_value
-        str | None: string_value
-        str | None: minus_9s_value
+        pd.Series: numeric_values (NaN for a value without a numeric value)
     """
 
-    value = col_value.strip()
+    is_integer = datatypes == "integer"
+    is_float = datatypes == "float"
 
-    found_possible_fill_value = None
-    minus_9s_value = None
-    string_value = None
-    is_possible_fill_value = None
+    is_plain_number = (is_integer & values.str.fullmatch(INTEGER_PATTERN)) | (
+        is_float & values.str.fullmatch(FLOAT_PATTERN)
+    )
 
-    possible_fill_values = get_possible_fill_values()
+    is_other_number = (is_integer | is_float) & ~is_plain_number
 
-    if value in possible_fill_values:
-        is_possible_fill_value = True
+    numeric_values = pd.Series(np.nan, index=values.index)
+    numeric_values[is_plain_number] = values[is_plain_number].astype(float)
 
-    # Check if value has a datetime format, if it doesn't, it could
-    # be a string or a minus 9s value
+    if is_other_number.any():
+        other_values = values[is_other_number]
+        other_datatypes = datatypes[is_other_number]
 
-    if is_possible_fill_value:
-        # find which fill value it is
-        possible_fill_values = get_possible_fill_values()
-        found_possible_fill_value = list(set([value]) & set(possible_fill_values))
+        converted_values = {}
+        for value, datatype in set(zip(other_values, other_datatypes)):
+            numeric_value = find_non_datetime_cell_value(value, datatype)[3]
 
-        if not found_possible_fill_value:
-            found_possible_fill_value = None
-        elif len(found_possible_fill_value) == 1:
-            found_possible_fill_value = found_possible_fill_value[0]
+            if numeric_value is None:
+                numeric_value = np.nan
 
-    else:
-        # check if it is negative and then all 9's
-        if check_is_minus_9s(value):
-            minus_9s_value = value
-        elif not has_datetime_format:
-            # Not a defined possible fill value and not a minus 9s value
-            # and does not have a datetime format
-            string_value = value
+            converted_values[(value, datatype)] = numeric_value
+
+        numeric_values[is_other_number] = [
+            converted_values[key] for key in zip(other_values, other_datatypes)
+        ]
 
-    return found_possible_fill_value, minus_9s_value, string_value
+    return numeric_values
+
+
+def find_non_datetime_fill_values(values: pd.Series, datatypes: pd.Series) -> tuple:
+    # If the column is not a datetime column, gather
+    # numeric values in a column to check if they are
+    # all positive or not since checking a minus 9s fill
+    # only for columns with all positive values. For a
+    # mixed value column or negative column, a minus 9s fill
+    # value may actually be a data point. Also
+    # look at strings to find alternate string fill values
+
+    # Returns masks of the column values that are a possible fill value,
+    # a minus 9s value, or a string value.
+    is_possible_fill = datatypes == "isfill"
+    is_string = datatypes == "string"
+
+    is_numeric = (datatypes == "integer") | (datatypes == "float")
+    is_minus_9s = is_numeric & check_are_minus_9s(values)
+
+    return is_possible_fill, is_minus_9s, is_string
 
 
 def find_datetime_fill_values(
-    value: str, datetime_formats: list, string_values: list, fills_obj: dict
+    values: pd.Series, datetime_formats_masks: np.ndarray
 ) -> tuple:
     # datatype = "datetime" was determined for whole column
     # by paramter official name. Here find fills in a
@@ -467,45 +470,23 @@ def find_datetime_fill_values(
     # that are one of the defined possible fill values
     # and any minus9s fills.
 
-    # Remove any None values
-    formats = [format for format in datetime_formats if format is not None]
-
-    has_datetime_format = False
-
-    if len(formats):
-        has_datetime_format = True
-
-    (possible_fill_value, minus_9s_value, string_value) = find_datetime_cell_value(
-        value, has_datetime_format
+    # A fill value can be one of the possible fill values defined in the
+    # function get_possible_fill_values, a minus 9s value, or a string
+    # which will be determined later if it is unique in a datetime column.
+    # Returns masks of the column values that are each kind of fill.
+    # A value with a datetime format has a bit set in its formats mask
+    has_datetime_format = pd.Series(
+        datetime_formats_masks != 0, index=values.index, dtype=bool
     )
 
-    found_possible_fill_values = fills_obj["found_possible_fill_values"]
-    all_fill_values = fills_obj["all_fill_values"]
-    all_possible_and_minus9s_fills = fills_obj["all_possible_and_minus9s_fills"]
-    minus_9s = fills_obj["minus_9s"]
-
-    if possible_fill_value is not None:
-        found_possible_fill_values.append(possible_fill_value)
-        all_fill_values.append(possible_fill_value)
-        all_possible_and_minus9s_fills.append(possible_fill_value)
-
-    if minus_9s_value is not None:
-        minus_9s.append(minus_9s_value)
-        all_fill_values.append(minus_9s_value)
-        all_possible_and_minus9s_fills.append(minus_9s_value)
+    is_possible_fill = values.isin(get_possible_fill_values())
 
-    if string_value is not None:
-        string_values.append(string_value)
-        all_fill_values.append(string_value)
-        all_possible_and_minus9s_fills.append(None)
-
-    if possible_fill_value is None and string_value is None and minus_9s_value is None:
-        all_fill_values.append(None)
-        all_possible_and_minus9s_fills.append(None)
+    # Check if value has a datetime format, if it doesn't, it could
+    # be a string or a minus 9s value
+    is_minus_9s = ~is_possible_fill & check_are_minus_9s(values)
 
-    fills_obj["found_possible_fill_values"] = found_possible_fill_values
-    fills_obj["all_fill_values"] = all_fill_values
-    fills_obj["all_possible_and_minus9s_fills"] = all_possible_and_minus9s_fills
-    fills_obj["minus_9s"] = minus_9s
+    # Not a defined possible fill value and not a minus 9s value
+    # and does not have a datetime format
+    is_string = ~is_possible_fill & ~is_minus_9s & ~has_datetime_format
 
-    return string_values, fills_obj
+    return is_possible_fill, is_minus_9s, is_string
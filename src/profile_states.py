@@ -0,0 +1,234 @@
+"""
+Keep the column profiles of data files that grow by appended rows.
+
+Some data files (mooring and underway feeds for example) only change by
+having rows added to the end. The first pass column profiles of a file
+can be merged with the profiles of more rows, so the profiles of such a
+file are saved with the byte offset they were read up to and the hashes
+of the bytes before that offset. The hashes are made by the workers as
+they read the file, one for a whole file and one for each range of rows
+of a split file (see get_segments_hash), so the file isn't read again to
+save its state. On a later run, the main process reads the bytes before
+the offset once to check the hashes, and if they haven't changed, only
+the rows after it are read and their profiles are merged into the saved
+profiles before the second pass.
+
+Like the rows of a split file (see file_scheduler), only UTF-8 files
+without any quote characters are read from an offset. The appended rows
+are checked by the workers as they read them, and if they can't be read
+on their own, the whole file is read again. The profiles are only saved
+when the file ends with a line break, so the offset is always the start
+of a row.
+"""
+
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+from result_cache import get_file_hash
+
+# Files smaller than this are quick enough to read again in full,
+# so their profiles aren't saved
+MIN_FILE_SIZE_BYTES = 1024 * 1024
+
+# Size of the blocks a file is read in to check its hashes
+SCAN_BLOCK_SIZE_BYTES = 8 * 1024 * 1024
+
+
+def check_segments(file: str, segments: list) -> str | None:
+    """
+    Read a file up to the end of its last segment once to check the
+    hashes of the segments (see get_profile_state), and get the hash of
+    all those bytes.
+
+    Returns:
+        str | None: prefix_hash (None if a segment changed)
+    """
+
+    prefix_hash = hashlib.sha256()
+
+    position = 0
+
+    with open(file, "rb") as f:
+        for end, segment_hash in segments:
+            file_hash = hashlib.sha256()
+
+            while position < end:
+                block = f.read(min(SCAN_BLOCK_SIZE_BYTES, end - position))
+
+                if not block:
+                    return None
+
+                file_hash.update(block)
+
+                # The hash of a single segment is already the hash of
+                # all the bytes
+                if len(segments) > 1:
+                    prefix_hash.update(block)
+
+                position += len(block)
+
+            if file_hash.hexdigest() != segment_hash:
+                return None
+
+    if len(segments) == 1:
+        return segments[0][1]
+
+    return prefix_hash.hexdigest()
+
+
+def get_profile_state(
+    file: str, file_scan: dict | None, column_profiles: dict | None
+) -> dict | None:
+    """
+    Get the state to save for the column profiles of a file from the
+    file scan of the bytes they were read from (see get_read_file_scan).
+    The bytes must be the whole file as it was before it was read, and
+    the file must not have grown since. If the profiles can't be
+    continued from the end of the bytes, return None.
+
+    Returns:
+        dict | None: profile_state
+    """
+
+    if not column_profiles or file_scan is None:
+        return None
+
+    end = file_scan["segments"][-1][0]
+
+    if end < MIN_FILE_SIZE_BYTES or end != file_scan["size"]:
+        return None
+
+    if not file_scan["is_utf8_without_quotes"] or not file_scan["ends_with_line_break"]:
+        return None
+
+    try:
+        if os.stat(file).st_size != end:
+            return None
+    except OSError:
+        return None
+
+    profile_state = {
+        "offset": end,
+        "segments": file_scan["segments"],
+        "column_profiles": column_profiles,
+    }
+
+    return profile_state
+
+
+def get_appended_byte_range(file: str, profile_state: dict) -> dict | None:
+    """
+    Check if a file has only had rows appended since its profile state
+    was saved. If it has, get the byte range of the appended rows and
+    the hash of the bytes before them as one segment, for the next
+    state. Only the bytes before the appended rows are read.
+
+    Returns:
+        dict | None: appended (None if the whole file must be read)
+    """
+
+    offset = profile_state["offset"]
+
+    try:
+        end = os.stat(file).st_size
+
+        if end <= offset:
+            return None
+
+        prefix_hash = check_segments(file, profile_state["segments"])
+    except OSError:
+        return None
+
+    if prefix_hash is None:
+        return None
+
+    appended = {
+        "byte_range": (offset, end),
+        "column_profiles": profile_state["column_profiles"],
+        "prefix_segments": [[offset, prefix_hash]],
+    }
+
+    return appended
+
+
+class ProfileStore:
+    """
+    Profile states of data files saved in a folder, one file for each
+    data file. A state is only used with the same program settings and
+    parameters info file it was saved with.
+    """
+
+    def __init__(self, profiles_folder: str, settings_hash: str):
+        self.profiles_folder = Path(profiles_folder)
+        self.settings_hash = settings_hash
+
+        self.profiles_folder.mkdir(parents=True, exist_ok=True)
+
+    def get_state_file(self, csv_file: str) -> Path:
+        name = hashlib.sha256(csv_file.encode()).hexdigest()
+
+        return self.profiles_folder / f"{name}.pickle"
+
+    def clear(self):
+        """Remove all profile states"""
+
+        for state_file in self.profiles_folder.glob("*.pickle"):
+            state_file.unlink()
+
+    def get(self, csv_file: str, parameters_info_filename: str | None) -> dict | None:
+        """
+        Get the saved profile state of a data file
+
+        Returns:
+            dict | None: profile_state (None if there isn't a usable one)
+        """
+
+        try:
+            with open(self.get_state_file(csv_file), "rb") as f:
+                saved_state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+
+        if (
+            saved_state["csv_file"] != csv_file
+            or saved_state["settings_hash"] != self.settings_hash
+            or saved_state["parameters_hash"] != get_file_hash(parameters_info_filename)
+        ):
+            return None
+
+        return saved_state["profile_state"]
+
+    def put(
+        self,
+        csv_file: str,
+        parameters_info_filename: str | None,
+        profile_state: dict | None,
+    ):
+        """
+        Save the profile state of a data file, or remove its saved state
+        if it doesn't have one
+        """
+
+        state_file = self.get_state_file(csv_file)
+
+        if profile_state is None:
+            state_file.unlink(missing_ok=True)
+            return
+
+        saved_state = {
+            "csv_file": csv_file,
+            "settings_hash": self.settings_hash,
+            "parameters_hash": get_file_hash(parameters_info_filename),
+            "profile_state": profile_state,
+        }
+
+        # Write to a temporary file first so an interrupted run
+        # doesn't leave a partial state
+        temporary_state_file = state_file.with_suffix(".tmp")
+
+        with open(temporary_state_file, "wb") as f:
+            pickle.dump(saved_state, f)
+
+        os.replace(temporary_state_file, state_file)
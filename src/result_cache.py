@@ -0,0 +1,280 @@
+"""
+Cache the final results of data files between program runs.
+
+Most data files don't change between runs, so the final results of each
+file are saved in a cache folder and used again if nothing the results
+depend on has changed. The key of a cached result is made from
+
+    - the path of the data file (it's in the output of the file)
+    - a hash of the contents of the data file
+    - a hash of the contents of the parameters info file of the data file
+    - a hash of the program settings (see get_settings_hash)
+
+The hash of a data file's contents is kept with the size and modification
+time the file had when it was read, so a file that hasn't been touched
+isn't read again to hash it. A new file, or one whose size or modification
+time changed, isn't hashed before it's processed. It's processed again,
+and the worker that reads it hashes its bytes as it goes, so the file is
+only read once. A file that was touched without changing its contents is
+then processed again instead of being found in the cache.
+
+Each cached result is a JSON file. When the cache folder grows larger than
+its size limit, the least recently used results are removed, and data
+files that no longer exist are removed from the index.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+# Size of the blocks a file is read in to hash it
+HASH_BLOCK_SIZE_BYTES = 8 * 1024 * 1024
+
+# Default size limit of the cached results
+MAX_CACHE_SIZE_BYTES = 512 * 1024 * 1024
+
+
+def get_file_hash(filename: str | None) -> str | None:
+    """
+    Get the sha256 hash of the contents of a file
+
+    Returns:
+        str | None: file_hash (None if there is no file)
+    """
+
+    if filename is None:
+        return None
+
+    file_hash = hashlib.sha256()
+
+    with open(filename, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE_BYTES):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def get_segments_hash(segments: list) -> str:
+    """
+    Get the hash of the contents of a file from the hashes of segments
+    of the file that follow each other from its start, as [end, hash]
+    of each segment. The hash of a single segment is the hash of the
+    file's contents.
+
+    Returns:
+        str: file_hash
+    """
+
+    if len(segments) == 1:
+        return segments[0][1]
+
+    return hashlib.sha256(json.dumps(segments).encode()).hexdigest()
+
+
+def get_settings_hash(settings: dict, files: list) -> str:
+    """
+    Get a hash of the settings and the contents of the files
+    (reference files and program source) that results depend on.
+
+    Returns:
+        str: settings_hash
+    """
+
+    settings_hash = hashlib.sha256()
+
+    settings_hash.update(json.dumps(settings, sort_keys=True).encode())
+
+    for filename in files:
+        settings_hash.update(filename.encode())
+        settings_hash.update(get_file_hash(filename).encode())
+
+    return settings_hash.hexdigest()
+
+
+class ResultCache:
+    """
+    Final results of data files saved in a cache folder. The index file
+    keeps the size, modification time and hash of each data file and
+    the size and last use time of each cached result.
+    """
+
+    def __init__(
+        self,
+        cache_folder: str,
+        settings_hash: str,
+        max_size_bytes: int = MAX_CACHE_SIZE_BYTES,
+    ):
+        self.cache_folder = Path(cache_folder)
+        self.results_folder = self.cache_folder / "results"
+        self.index_file = self.cache_folder / "cache_index.json"
+
+        self.settings_hash = settings_hash
+        self.max_size_bytes = max_size_bytes
+
+        self.results_folder.mkdir(parents=True, exist_ok=True)
+
+        try:
+            with open(self.index_file, "r") as f:
+                self.index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.index = {"files": {}, "results": {}}
+
+    def clear(self):
+        """Remove all cached results to force them to be rebuilt"""
+
+        for result_file in self.results_folder.glob("*.json"):
+            result_file.unlink()
+
+        self.index = {"files": {}, "results": {}}
+
+    def get_data_file_hash(self, csv_file: str) -> str | None:
+        """
+        Get the hash of a data file's contents kept from when it was last
+        read, if its size and modification time haven't changed since.
+        The file itself isn't read.
+
+        Returns:
+            str | None: file_hash (None if it isn't known)
+        """
+
+        try:
+            file_stat = os.stat(csv_file)
+        except OSError:
+            return None
+
+        file_info = self.index["files"].get(csv_file)
+
+        if (
+            file_info is not None
+            and file_info["size"] == file_stat.st_size
+            and file_info["mtime_ns"] == file_stat.st_mtime_ns
+        ):
+            return file_info["hash"]
+
+        return None
+
+    def put_data_file_hash(
+        self, csv_file: str, size: int, mtime_ns: int, file_hash: str
+    ):
+        """
+        Keep the hash of a data file's contents, found by the worker that
+        read it, with the size and modification time the file had before
+        it was read
+        """
+
+        self.index["files"][csv_file] = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "hash": file_hash,
+        }
+
+    def get_key(
+        self, csv_file: str, parameters_info_filename: str | None
+    ) -> str | None:
+        """
+        Get the key of the cached result of a data file. A file whose
+        contents aren't known since it's new or changed has no key
+        until it's read (see put_data_file_hash).
+
+        Returns:
+            str | None: key
+        """
+
+        data_file_hash = self.get_data_file_hash(csv_file)
+
+        if data_file_hash is None:
+            return None
+
+        key = hashlib.sha256()
+
+        for part in [
+            csv_file,
+            data_file_hash,
+            get_file_hash(parameters_info_filename) or "",
+            self.settings_hash,
+        ]:
+            key.update(part.encode())
+            key.update(b"\0")
+
+        return key.hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """
+        Get a cached result
+
+        Returns:
+            dict | None: cached_result (None if not in the cache)
+        """
+
+        if key not in self.index["results"]:
+            return None
+
+        try:
+            with open(self.results_folder / f"{key}.json", "r") as f:
+                cached_result = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            del self.index["results"][key]
+            return None
+
+        self.index["results"][key]["last_used"] = time.time()
+
+        return cached_result
+
+    def put(self, key: str, final_results: dict | None, log_lines: list):
+        """
+        Save the final results of a data file and the log lines written
+        while it was processed
+        """
+
+        result_file = self.results_folder / f"{key}.json"
+
+        with open(result_file, "w") as f:
+            json.dump({"final_results": final_results, "log_lines": log_lines}, f)
+
+        self.index["results"][key] = {
+            "size": result_file.stat().st_size,
+            "last_used": time.time(),
+        }
+
+    def evict(self):
+        """
+        Remove the least recently used results until the cache is
+        within its size limit, and the data files that were deleted or
+        renamed from the index
+        """
+
+        files = self.index["files"]
+
+        for csv_file in list(files):
+            if not os.path.exists(csv_file):
+                del files[csv_file]
+
+        results = self.index["results"]
+
+        cache_size = sum(result["size"] for result in results.values())
+
+        for key in sorted(results, key=lambda key: results[key]["last_used"]):
+            if cache_size <= self.max_size_bytes:
+                break
+
+            cache_size -= results[key]["size"]
+
+            (self.results_folder / f"{key}.json").unlink(missing_ok=True)
+
+            del results[key]
+
+    def save(self):
+        """Evict old results and write the cache index"""
+
+        self.evict()
+
+        # Write to a temporary file first so an interrupted run
+        # doesn't leave a partial index
+        temporary_index_file = self.index_file.with_suffix(".tmp")
+
+        with open(temporary_index_file, "w") as f:
+            json.dump(self.index, f)
+
+        os.replace(temporary_index_file, self.index_file)
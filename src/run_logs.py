@@ -0,0 +1,135 @@
+"""
+Write lines to the log files of a program run.
+
+The lines written while a file is processed can be recorded so they
+can be saved with the cached results of the file and written again
+when the cached results are used on a later run.
+
+When a run is split into shards, each shard writes to its own copy of
+each log file (see set_log_shard). Lines are recorded with the log file
+they were written to without the shard, so they can be written again
+by any shard.
+
+Only the main process writes to the log files. Worker processes only
+record their lines (see record_logs_only), which are sent back to the
+main process with the results of each file and written there (see
+replay_logs). The main process keeps each log file open for the whole
+run and writes its lines in batches, instead of every worker opening
+and appending to the files for each line. Lines are written out when
+the buffer of a file fills, by flush_logs, which the main process calls
+once each file is recorded in the run manifest, and by close_logs.
+"""
+
+from shards import get_shard_filename
+
+# Size of the write buffer of each open log file
+LOG_BUFFER_SIZE_BYTES = 64 * 1024
+
+# Lines written since start_recording_logs as (log file, line)
+recorded_log_lines = None
+
+# Whether write_log writes lines to the log files or only records them
+log_files_written = True
+
+# Log files opened by write_log by their filename
+open_log_files = {}
+
+# Shard of the run the log files are written for
+log_shard_index = 0
+log_shard_count = 1
+
+
+def set_log_shard(shard_index: int, shard_count: int):
+    global log_shard_index, log_shard_count
+
+    log_shard_index = shard_index
+    log_shard_count = shard_count
+
+
+def get_log_filename(log_file: str) -> str:
+    """
+    Get the name of a log file for the shard of the run
+
+    Returns:
+        str: log_filename
+    """
+
+    return get_shard_filename(log_file, log_shard_index, log_shard_count)
+
+
+def record_logs_only():
+    """
+    Only record the lines written in this process, for worker processes
+    whose lines are written by the main process
+    """
+
+    global log_files_written
+
+    log_files_written = False
+
+
+def write_log(log_file: str, line: str):
+    global recorded_log_lines
+
+    if log_files_written:
+        log_filename = get_log_filename(log_file)
+
+        f = open_log_files.get(log_filename)
+
+        if f is None:
+            f = open(log_filename, "a", buffering=LOG_BUFFER_SIZE_BYTES)
+            open_log_files[log_filename] = f
+
+        f.write(f"{line}\n")
+
+    if recorded_log_lines is not None:
+        recorded_log_lines.append((log_file, line))
+
+
+def flush_logs():
+    """Write out the buffered lines of the open log files"""
+
+    for f in open_log_files.values():
+        f.flush()
+
+
+def close_logs():
+    """Write out the buffered lines and close the log files"""
+
+    for f in open_log_files.values():
+        f.close()
+
+    open_log_files.clear()
+
+
+def start_recording_logs():
+    global recorded_log_lines
+
+    recorded_log_lines = []
+
+
+def stop_recording_logs() -> list:
+    """
+    Stop recording log lines and get the lines written since
+    start_recording_logs
+
+    Returns:
+        list: log_lines
+    """
+
+    global recorded_log_lines
+
+    log_lines = recorded_log_lines or []
+
+    recorded_log_lines = None
+
+    return log_lines
+
+
+def replay_logs(log_lines: list):
+    """
+    Write recorded log lines again
+    """
+
+    for log_file, line in log_lines:
+        write_log(log_file, line)
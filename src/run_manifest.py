@@ -0,0 +1,135 @@
+"""
+Record the files a program run has finished so an interrupted run can
+be resumed.
+
+Each finished file is added to the run manifest as one JSON line with
+its final results and the log lines written while it was processed. A
+line is written with a single write and flushed to disk, so if the run
+is killed, only the line being written can be partial and it is skipped
+when the manifest is read.
+
+A resumed run writes the results and log lines of the finished files
+again without reading the files, and only processes the rest. A file
+that changed size or modification time since it was finished is
+processed again.
+"""
+
+import json
+import os
+from pathlib import Path
+
+
+class RunManifest:
+    """
+    The files finished by the current program run, and by the
+    interrupted run before it if the run is resumed
+    """
+
+    def __init__(self, manifest_file: str, resume: bool = False):
+        self.manifest_file = Path(manifest_file)
+
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+
+        if resume:
+            self.finished_files = self.load()
+
+            # Drop a line cut off when the run was interrupted, so the
+            # lines added by this run start on a line of their own
+            self.rewrite()
+        else:
+            self.finished_files = {}
+            self.manifest_file.unlink(missing_ok=True)
+
+    def load(self) -> dict:
+        """
+        Read the finished files of the manifest. If a file was finished
+        more than once, its last entry is used.
+
+        Returns:
+            dict: finished_files
+        """
+
+        finished_files = {}
+
+        try:
+            with open(self.manifest_file, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut off when the run was interrupted
+                        continue
+
+                    finished_files[entry["csv_file"]] = entry
+        except FileNotFoundError:
+            pass
+
+        return finished_files
+
+    def rewrite(self):
+        """Write the manifest again with only the finished files read in"""
+
+        # Write to a temporary file first so an interrupted run
+        # doesn't leave a partial manifest
+        temporary_manifest_file = self.manifest_file.with_suffix(".tmp")
+
+        with open(temporary_manifest_file, "w") as f:
+            for entry in self.finished_files.values():
+                f.write(json.dumps(entry) + "\n")
+
+        os.replace(temporary_manifest_file, self.manifest_file)
+
+    def get(self, csv_file: str) -> dict | None:
+        """
+        Get the manifest entry of a file finished before the run was
+        resumed, if the file hasn't changed since
+
+        Returns:
+            dict | None: entry
+        """
+
+        entry = self.finished_files.get(csv_file)
+
+        if entry is None:
+            return None
+
+        try:
+            file_stat = os.stat(csv_file)
+        except OSError:
+            return None
+
+        if (
+            entry["size"] != file_stat.st_size
+            or entry["mtime_ns"] != file_stat.st_mtime_ns
+        ):
+            return None
+
+        return entry
+
+    def add(self, csv_file: str, final_results: dict | None, log_lines: list):
+        """
+        Record that a file is finished with its final results and the
+        log lines written while it was processed
+        """
+
+        try:
+            file_stat = os.stat(csv_file)
+            size, mtime_ns = file_stat.st_size, file_stat.st_mtime_ns
+        except OSError:
+            # Never matches, so the file is processed again on resume
+            size, mtime_ns = None, None
+
+        entry = {
+            "csv_file": csv_file,
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "final_results": final_results,
+            "log_lines": log_lines,
+        }
+
+        line = json.dumps(entry) + "\n"
+
+        with open(self.manifest_file, "a") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
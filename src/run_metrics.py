@@ -0,0 +1,297 @@
+"""
+Time the stages of processing each data file, for runs with --metrics.
+
+While a file is processed, the time of each stage (reading the file,
+the first pass, finding datetime formats, the second pass, ...) is
+added up with time_stage, along with counts like the number of rows
+read (see add_count). Stages that work on one column at a time are also
+added up for each column. Like log lines (see run_logs), the metrics of
+a file are recorded in the worker process and sent back with the
+results of the file, and only the main process writes them, one JSON
+line for each file or part of a file, to the metrics file.
+
+The datetime format matching of a column also counts its strptime
+attempts and matches for each format (see add_datetime_format_counts).
+An attempt that doesn't match raises an exception, so the exceptions
+are the attempts minus the matches. The counts are kept for each
+column, each file and each format of a file.
+
+At the end of the run, a report of the metrics file is written with the
+median, 95th percentile and largest time of each stage, the slowest
+files and the strptime attempts and matches of each datetime format
+over the run (see write_metrics_report), so formats that are tried
+often but never match can be found.
+
+When metrics aren't enabled, time_stage and add_count do nothing.
+"""
+
+import contextlib
+import json
+import math
+import os
+import time
+
+# Number of the slowest files listed in the metrics report
+NUMBER_SLOWEST_FILES = 20
+
+# Whether metrics are recorded in this process
+metrics_enabled = False
+
+# Metrics of the file being processed since start_recording_metrics
+recorded_metrics = None
+
+# Metrics file the main process writes to
+metrics_file = None
+
+
+def enable_metrics():
+    global metrics_enabled
+
+    metrics_enabled = True
+
+
+def start_recording_metrics():
+    global recorded_metrics
+
+    if metrics_enabled:
+        recorded_metrics = {
+            "stages": {},
+            "column_stages": {},
+            "counts": {},
+            "column_counts": {},
+            "datetime_formats": {},
+        }
+
+
+def is_recording_metrics() -> bool:
+    return recorded_metrics is not None
+
+
+def stop_recording_metrics() -> dict | None:
+    """
+    Stop recording metrics and get the metrics recorded since
+    start_recording_metrics, with the process id of the worker
+
+    Returns:
+        dict | None: metrics (None if metrics aren't enabled)
+    """
+
+    global recorded_metrics
+
+    metrics = recorded_metrics
+
+    recorded_metrics = None
+
+    if metrics is not None:
+        metrics["worker_pid"] = os.getpid()
+
+    return metrics
+
+
+@contextlib.contextmanager
+def time_stage(stage: str, column: str | None = None):
+    """
+    Add the time of the code in the with block to a stage of the file
+    being processed, and to the stage of the column if one is given
+    """
+
+    if recorded_metrics is None:
+        yield
+        return
+
+    start_time = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start_time
+
+        # The metrics can be stopped inside the block
+        if recorded_metrics is not None:
+            stages = recorded_metrics["stages"]
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+            if column is not None:
+                column_stages = recorded_metrics["column_stages"].setdefault(
+                    str(column), {}
+                )
+                column_stages[stage] = column_stages.get(stage, 0.0) + seconds
+
+
+def add_count(name: str, count: int):
+    """Add to a count of the file being processed, like rows read"""
+
+    if recorded_metrics is not None:
+        counts = recorded_metrics["counts"]
+        counts[name] = counts.get(name, 0) + count
+
+
+def add_datetime_format_counts(
+    column: str | None, format_attempts: dict, format_matches: dict
+):
+    """
+    Add the strptime attempts and matches of each datetime format for
+    the values of a column to the counts of the column, of the file and
+    of each format of the file
+    """
+
+    if recorded_metrics is None:
+        return
+
+    number_attempts = sum(format_attempts.values())
+    number_matches = sum(format_matches.values())
+
+    counts = {
+        "strptime_attempts": number_attempts,
+        "strptime_matches": number_matches,
+        "strptime_exceptions": number_attempts - number_matches,
+    }
+
+    column_counts = recorded_metrics["column_counts"].setdefault(str(column), {})
+
+    for name, count in counts.items():
+        column_counts[name] = column_counts.get(name, 0) + count
+        add_count(name, count)
+
+    datetime_formats = recorded_metrics["datetime_formats"]
+
+    for datetime_format, attempts in format_attempts.items():
+        format_counts = datetime_formats.setdefault(datetime_format, [0, 0])
+        format_counts[0] += attempts
+        format_counts[1] += format_matches.get(datetime_format, 0)
+
+
+def write_metrics(metrics_filename: str, record: dict):
+    """
+    Add the metrics record of a file or part of a file to the metrics
+    file, which is kept open until close_metrics
+    """
+
+    global metrics_file
+
+    if metrics_file is None:
+        metrics_file = open(metrics_filename, "a")
+
+    metrics_file.write(json.dumps(record) + "\n")
+
+
+def close_metrics():
+    global metrics_file
+
+    if metrics_file is not None:
+        metrics_file.close()
+        metrics_file = None
+
+
+def get_percentile(sorted_values: list, percentile: float) -> float:
+    """
+    Get a percentile of sorted values with the nearest rank method
+
+    Returns:
+        float: value
+    """
+
+    rank = math.ceil(percentile / 100 * len(sorted_values))
+
+    return sorted_values[max(rank, 1) - 1]
+
+
+def write_metrics_report(metrics_filename: str, report_filename: str) -> str | None:
+    """
+    Write a report of the stage times in the metrics file. The times of
+    the records of a file (its parts and its output) are added up for
+    each file before the percentiles are found.
+
+    Returns:
+        str | None: report (None if there are no metrics)
+    """
+
+    file_stages = {}
+    format_counts = {}
+
+    try:
+        with open(metrics_filename, "r") as f:
+            for line in f:
+                record = json.loads(line)
+
+                stages = file_stages.setdefault(record["file"], {})
+
+                for stage, seconds in record["stages"].items():
+                    stages[stage] = stages.get(stage, 0.0) + seconds
+
+                for datetime_format, (attempts, matches) in record.get(
+                    "datetime_formats", {}
+                ).items():
+                    counts = format_counts.setdefault(datetime_format, [0, 0])
+                    counts[0] += attempts
+                    counts[1] += matches
+    except FileNotFoundError:
+        return None
+
+    if not file_stages:
+        return None
+
+    stage_seconds = {}
+
+    for stages in file_stages.values():
+        for stage, seconds in stages.items():
+            stage_seconds.setdefault(stage, []).append(seconds)
+
+    lines = [
+        f"Stage times of {len(file_stages)} files in seconds",
+        "",
+        f"{'stage':<20} {'files':>7} {'total':>10} {'p50':>9} {'p95':>9} {'max':>9}",
+    ]
+
+    for stage in sorted(stage_seconds):
+        seconds = sorted(stage_seconds[stage])
+
+        lines.append(
+            f"{stage:<20} {len(seconds):>7} {sum(seconds):>10.3f} "
+            f"{get_percentile(seconds, 50):>9.3f} "
+            f"{get_percentile(seconds, 95):>9.3f} {seconds[-1]:>9.3f}"
+        )
+
+    # The process stage covers all the worker stages of a file
+    file_seconds = {
+        csv_file: stages.get("process", 0.0) + stages.get("output", 0.0)
+        for csv_file, stages in file_stages.items()
+    }
+
+    slowest_files = sorted(file_seconds, key=file_seconds.get, reverse=True)
+
+    lines.extend(["", "Slowest files in seconds", ""])
+
+    for csv_file in slowest_files[:NUMBER_SLOWEST_FILES]:
+        lines.append(f"{file_seconds[csv_file]:>10.3f} {csv_file}")
+
+    if format_counts:
+        total_attempts = sum(attempts for attempts, _ in format_counts.values())
+        total_matches = sum(matches for _, matches in format_counts.values())
+
+        lines.extend(
+            [
+                "",
+                f"strptime attempts {total_attempts}, matches {total_matches}, "
+                f"exceptions {total_attempts - total_matches}",
+                "",
+                f"{'attempts':>10} {'matches':>10} {'exceptions':>10}  datetime format",
+            ]
+        )
+
+        # Formats tried the most first, so the ones that never match
+        # and cost the most stand out
+        for datetime_format, (attempts, matches) in sorted(
+            format_counts.items(), key=lambda item: (-item[1][0], item[0])
+        ):
+            lines.append(
+                f"{attempts:>10} {matches:>10} {attempts - matches:>10}  "
+                f"{datetime_format}"
+            )
+
+    report = "\n".join(lines) + "\n"
+
+    with open(report_filename, "w") as f:
+        f.write(report)
+
+    return report
@@ -0,0 +1,175 @@
+"""
+Split a program run into shards that can run on different machines
+sharing the data folder, and merge the outputs of the shards.
+
+Each file goes to the shard given by a hash of its path, so every shard
+of a run selects its files from the same file listing without talking
+to the others, and a file always goes to the same shard for the same
+number of shards. Each shard writes its own summary, overview, log and
+cache files, named with the shard index and number of shards (see
+get_shard_filename).
+
+Once all the shards are done, their outputs are merged into one summary
+and one overview with each file once, in order of the file path.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+# Line before and after the file line of each file in the overview
+OVERVIEW_SEPARATOR_LINE = "**********************\n"
+
+
+def get_file_shard(csv_file: str, shard_count: int) -> int:
+    """
+    Get the shard of a file from a hash of its path
+
+    Returns:
+        int: shard_index
+    """
+
+    path_hash = hashlib.sha256(csv_file.encode()).hexdigest()
+
+    return int(path_hash[:16], 16) % shard_count
+
+
+def get_shard_filename(filename: str, shard_index: int, shard_count: int) -> str:
+    """
+    Get the name of a file or folder of one shard of a run. If the run
+    isn't split into shards, the name doesn't change.
+
+    Returns:
+        str: shard_filename
+    """
+
+    if shard_count == 1:
+        return filename
+
+    path = Path(filename)
+
+    shard_path = path.with_name(
+        f"{path.stem}.shard-{shard_index}-of-{shard_count}{path.suffix}"
+    )
+
+    return shard_path.as_posix()
+
+
+def get_overview_blocks(overview: str) -> dict:
+    """
+    Split an overview into the text of each file
+
+    Returns:
+        dict: overview_blocks
+    """
+
+    overview_blocks = {}
+
+    lines = overview.splitlines(keepends=True)
+
+    csv_file = None
+
+    for i, line in enumerate(lines):
+        if (
+            line == OVERVIEW_SEPARATOR_LINE
+            and i + 2 < len(lines)
+            and lines[i + 1].startswith("file: ")
+            and lines[i + 2] == OVERVIEW_SEPARATOR_LINE
+        ):
+            csv_file = lines[i + 1][len("file: ") : -1]
+            overview_blocks.setdefault(csv_file, [])
+
+        if csv_file is not None:
+            overview_blocks[csv_file].append(line)
+
+    overview_blocks = {
+        csv_file: "".join(block_lines)
+        for csv_file, block_lines in overview_blocks.items()
+    }
+
+    return overview_blocks
+
+
+def merge_shards(
+    shard_count: int, summary_file: str, overview_file: str, log_files: list
+) -> bool:
+    """
+    Merge the summaries, overviews and log files of the shards of a run.
+    A file in more than one shard (from runs with a different number of
+    shards) is only kept from the first shard it's in. Files are ordered
+    by their path and log lines are sorted.
+
+    Returns:
+        bool: has_results
+    """
+
+    summaries = {}
+    overview_blocks = {}
+
+    for shard_index in range(shard_count):
+        shard_summary_file = get_shard_filename(
+            summary_file, shard_index, shard_count
+        )
+        shard_overview_file = get_shard_filename(
+            overview_file, shard_index, shard_count
+        )
+
+        try:
+            with open(shard_summary_file, "r") as f:
+                shard_summaries = json.load(f)
+        except FileNotFoundError:
+            print(f"Shard {shard_index} has no summary file {shard_summary_file}")
+            continue
+
+        for summary_obj in shard_summaries:
+            summaries.setdefault(summary_obj["source"], summary_obj)
+
+        try:
+            with open(shard_overview_file, "r") as f:
+                shard_overview_blocks = get_overview_blocks(f.read())
+        except FileNotFoundError:
+            shard_overview_blocks = {}
+
+        for csv_file, overview_block in shard_overview_blocks.items():
+            overview_blocks.setdefault(csv_file, overview_block)
+
+    for log_file in log_files:
+        log_lines = set()
+
+        for shard_index in range(shard_count):
+            shard_log_file = get_shard_filename(log_file, shard_index, shard_count)
+
+            try:
+                with open(shard_log_file, "r") as f:
+                    log_lines.update(f.read().splitlines())
+            except FileNotFoundError:
+                continue
+
+        Path(log_file).unlink(missing_ok=True)
+
+        if log_lines:
+            with open(log_file, "w") as f:
+                f.writelines(f"{line}\n" for line in sorted(log_lines))
+
+    Path(summary_file).unlink(missing_ok=True)
+    Path(overview_file).unlink(missing_ok=True)
+
+    if not summaries:
+        return False
+
+    # The same layout as the summary written by a run
+    with open(summary_file, "w") as f:
+        f.write(
+            "["
+            + ",".join(
+                json.dumps(summaries[csv_file], indent=4) + "\n"
+                for csv_file in sorted(summaries)
+            )
+            + "]"
+        )
+
+    with open(overview_file, "w") as f:
+        for csv_file in sorted(overview_blocks):
+            f.write(overview_blocks[csv_file])
+
+    return True
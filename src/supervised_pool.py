@@ -0,0 +1,570 @@
+"""
+Run tasks of data files in worker processes that are watched by the
+main process, so one file can't stall a program run.
+
+A multiprocessing.Pool can't stop a task once it has started, so a file
+that takes hours to read or uses all the memory keeps its worker busy
+until the end of the run. Here each worker has its own pipes to the
+main process and reports which file of its task it is working on, when
+the file was started and how many rows of it were read so far (see
+report_progress). The main process checks each worker every
+CHECK_INTERVAL_SECONDS. If a file runs past the time limit or the
+worker's resident memory (RSS) grows past the memory limit, the worker
+is killed and a new one is started. The files of the task after the
+stopped file are handed out again.
+
+Each file result is sent to the main process as soon as the file is
+done, so the files of a task finished before a worker is killed keep
+their results. A file that raises an exception only fails that file:
+the worker sends back the traceback as its result (see ItemError) and
+goes on to the next file, so an error isn't taken for a worker that
+was killed.
+
+The tasks are taken from their iterable by a thread of the main process
+(see TaskProducer), since making them can be slow: the data folder can
+still be being walked and files are checked before they are processed.
+The main process never waits for the next task, so results are read
+and limits are checked while tasks are still being made. The tasks that
+are ready wait in a queue, and when a worker is free, the largest task
+of up to LOOKAHEAD_TASKS waiting tasks is handed out first, so a large
+file found late doesn't start last when the other files are done.
+
+The resident memory of a worker is read from /proc, so the memory limit
+is only checked on Linux.
+"""
+
+import collections
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import queue
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+
+# How often the main process checks the time and memory of the workers
+CHECK_INTERVAL_SECONDS = 1
+
+# Most tasks made but not yet handed out, and the most waiting tasks
+# the largest task is chosen from
+TASK_QUEUE_SIZE = 100
+LOOKAHEAD_TASKS = 100
+
+# Rows of the current file read so far by this worker process
+worker_progress = None
+
+
+@dataclass
+class ItemError:
+    """
+    The result of an item that raised an exception in a worker, with the
+    traceback of the exception
+    """
+
+    traceback: str
+
+
+def report_progress(number_rows: int):
+    """
+    Record how many rows of the current file a worker has read, to log
+    how far a file got if it's stopped
+    """
+
+    if worker_progress is not None:
+        worker_progress.value = number_rows
+
+
+def get_rss_bytes(pid: int) -> int | None:
+    """
+    Get the resident memory of a process
+
+    Returns:
+        int | None: rss_bytes (None if it can't be read)
+    """
+
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def run_worker(
+    function,
+    task_reader,
+    result_writer,
+    current_item,
+    item_start_time,
+    progress,
+    initializer,
+    initargs,
+    finalizer,
+):
+    """
+    Apply the function to each item of the tasks sent to the worker and
+    send back the result of each item as soon as it's done. An item
+    that raises an exception has an ItemError as its result. A task of
+    None stops the worker, after the finalizer is called.
+    """
+
+    global worker_progress
+
+    worker_progress = progress
+
+    if initializer is not None:
+        initializer(*initargs)
+
+    while True:
+        try:
+            items = task_reader.recv()
+        except EOFError:
+            break
+
+        if items is None:
+            break
+
+        for item_index, item in enumerate(items):
+            progress.value = 0
+            item_start_time.value = time.time()
+            current_item.value = item_index
+
+            try:
+                result = function(item)
+            except Exception:
+                result = ItemError(traceback.format_exc())
+
+            current_item.value = -1
+
+            result_writer.send((item_index, result))
+
+        # End of the task
+        result_writer.send((None, None))
+
+    if finalizer is not None:
+        finalizer()
+
+
+class SupervisedWorker:
+    """
+    A worker process with the task it is working on, how many items of
+    the task it has sent results of, and the shared values it reports
+    its current item and progress in
+    """
+
+    def __init__(self, function, initializer=None, initargs=(), finalizer=None):
+        task_reader, self.task_writer = multiprocessing.Pipe(duplex=False)
+        self.result_reader, result_writer = multiprocessing.Pipe(duplex=False)
+
+        self.current_item = multiprocessing.RawValue("i", -1)
+        self.item_start_time = multiprocessing.RawValue("d", 0.0)
+        self.progress = multiprocessing.RawValue("q", 0)
+
+        self.items = None
+        self.number_done = 0
+
+        self.process = multiprocessing.Process(
+            target=run_worker,
+            args=(
+                function,
+                task_reader,
+                result_writer,
+                self.current_item,
+                self.item_start_time,
+                self.progress,
+                initializer,
+                initargs,
+                finalizer,
+            ),
+            daemon=True,
+        )
+
+        self.process.start()
+
+        # Only the worker uses these ends, so closing them here lets the
+        # main process see the pipe close if the worker dies
+        task_reader.close()
+        result_writer.close()
+
+    def assign(self, items: list):
+        self.items = items
+        self.number_done = 0
+
+        self.task_writer.send(items)
+
+    def get_exceeded_limit(
+        self, time_limit_seconds: float | None, memory_limit_bytes: int | None
+    ) -> dict | None:
+        """
+        Check the time and memory of the item the worker is working on
+
+        Returns:
+            dict | None: limit_info (None if no limit was exceeded)
+        """
+
+        item_index = self.current_item.value
+
+        if item_index < 0:
+            return None
+
+        seconds = time.time() - self.item_start_time.value
+        rss_bytes = get_rss_bytes(self.process.pid)
+
+        if time_limit_seconds and seconds > time_limit_seconds:
+            limit = f"time limit of {time_limit_seconds} seconds"
+        elif memory_limit_bytes and rss_bytes and rss_bytes > memory_limit_bytes:
+            limit = f"memory limit of {memory_limit_bytes // (1024 * 1024)} MB"
+        else:
+            return None
+
+        limit_info = {
+            "item_index": item_index,
+            "limit": limit,
+            "seconds": seconds,
+            "rss_bytes": rss_bytes,
+            "rows_read": self.progress.value,
+        }
+
+        return limit_info
+
+    def receive(self) -> tuple | None:
+        """
+        Get the next result sent by the worker
+
+        Returns:
+            tuple | None: item_index, result (None if the worker died)
+        """
+
+        try:
+            return self.result_reader.recv()
+        except (EOFError, OSError, pickle.UnpicklingError):
+            return None
+
+    def stop(self):
+        try:
+            self.task_writer.send(None)
+        except OSError:
+            pass
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+
+    def close(self):
+        self.task_writer.close()
+        self.result_reader.close()
+
+
+def take_next_task(waiting: list, task_size=None):
+    """
+    Take the largest waiting task, or the first if there's no task_size
+
+    Returns:
+        task
+    """
+
+    if task_size is None:
+        return waiting.pop(0)
+
+    largest_index = max(range(len(waiting)), key=lambda i: task_size(waiting[i]))
+
+    return waiting.pop(largest_index)
+
+
+class TaskProducer:
+    """
+    Tasks taken from an iterable by a thread and put in a queue, so the
+    main process can take the tasks that are ready without waiting for
+    the iterable. Each task put in the queue also wakes up the main
+    process through a pipe, in case it's waiting for results.
+    """
+
+    def __init__(self, tasks, queue_size: int = TASK_QUEUE_SIZE):
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.wakeup_reader, self.wakeup_writer = multiprocessing.Pipe(duplex=False)
+        self.is_finished = False
+        self.error = None
+        self.stopping = threading.Event()
+
+        self.thread = threading.Thread(target=self.produce, args=(tasks,), daemon=True)
+        self.thread.start()
+
+    def produce(self, tasks):
+        try:
+            for task in tasks:
+                # Wait for room in the queue, unless the pool is stopped
+                while not self.stopping.is_set():
+                    try:
+                        self.tasks.put(task, timeout=CHECK_INTERVAL_SECONDS)
+                        break
+                    except queue.Full:
+                        continue
+                else:
+                    return
+
+                self.wakeup_writer.send_bytes(b"")
+        except Exception as e:
+            self.error = e
+        finally:
+            # Set after the last task is put in the queue
+            self.is_finished = True
+            self.wakeup_writer.send_bytes(b"")
+
+    def take(self, waiting: list, number_tasks: int) -> bool:
+        """
+        Move the tasks that are ready into waiting until it has
+        number_tasks tasks. Raises the error of the iterable if it
+        had one.
+
+        Returns:
+            bool: has_more_tasks (False once every task was taken)
+        """
+
+        # Read before the queue is emptied, so no task can be put in
+        # the queue after it's found to be empty
+        is_finished = self.is_finished
+
+        while self.wakeup_reader.poll():
+            self.wakeup_reader.recv_bytes()
+
+        while len(waiting) < number_tasks:
+            try:
+                waiting.append(self.tasks.get_nowait())
+            except queue.Empty:
+                break
+
+        if self.error is not None:
+            raise self.error
+
+        return not is_finished or not self.tasks.empty()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+
+        self.wakeup_reader.close()
+        self.wakeup_writer.close()
+
+
+class SupervisedPool:
+    """
+    A pool of worker processes that applies a function to the items of
+    tasks (lists of items), stopping any item that runs past the time
+    limit or memory limit. The initializer is called when a worker
+    starts and the finalizer when it's stopped, but not when it's
+    killed.
+    """
+
+    def __init__(
+        self,
+        function,
+        number_processes: int,
+        time_limit_seconds: float | None = None,
+        memory_limit_bytes: int | None = None,
+        initializer=None,
+        initargs: tuple = (),
+        finalizer=None,
+    ):
+        self.function = function
+        self.time_limit_seconds = time_limit_seconds
+        self.memory_limit_bytes = memory_limit_bytes
+        self.initializer = initializer
+        self.initargs = initargs
+        self.finalizer = finalizer
+
+        self.workers = [self.start_worker() for _ in range(number_processes)]
+
+        # Tasks handed out before the waiting tasks (see add_task)
+        self.pending = collections.deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def start_worker(self) -> SupervisedWorker:
+        return SupervisedWorker(
+            self.function, self.initializer, self.initargs, self.finalizer
+        )
+
+    def close(self):
+        """Stop the workers once they finish their tasks"""
+
+        for worker in self.workers:
+            worker.stop()
+
+        for worker in self.workers:
+            worker.process.join()
+            worker.close()
+
+    def terminate(self):
+        for worker in self.workers:
+            worker.kill()
+            worker.close()
+
+    def add_task(self, task: list):
+        """
+        Add a task while imap_unordered is running, to be handed out
+        before the waiting tasks. It can be called with the results of
+        imap_unordered, to do an item again in another way.
+        """
+
+        self.pending.append(task)
+
+    def restart_worker(self, worker: SupervisedWorker, limit_info: dict, pending):
+        """
+        Kill a worker and start a new one in its place. The results the
+        worker sent before it was killed are yielded, then the stopped
+        item with its limit_info. The items of its task after the
+        stopped item are handed out again.
+
+        Returns:
+            generator: (item, result, limit_info)
+        """
+
+        worker.kill()
+
+        while worker.result_reader.poll():
+            message = worker.receive()
+
+            if message is None:
+                break
+
+            item_index, result = message
+
+            if item_index is not None:
+                worker.number_done = item_index + 1
+                yield worker.items[item_index], result, None
+
+        worker.close()
+
+        items = worker.items
+        stopped_index = limit_info["item_index"]
+
+        if worker.number_done <= stopped_index < len(items):
+            yield items[stopped_index], None, limit_info
+            remaining_items = items[stopped_index + 1 :]
+        else:
+            # The item finished just before the worker was killed
+            remaining_items = items[worker.number_done :]
+
+        if remaining_items:
+            pending.appendleft(remaining_items)
+
+        self.workers[self.workers.index(worker)] = self.start_worker()
+
+    def imap_unordered(self, tasks, task_size=None):
+        """
+        Hand out the tasks to the workers and yield the result of each
+        item as it's done. tasks can be a generator that is still
+        finding tasks, and it's iterated in a thread (see TaskProducer).
+        An item stopped by a limit, or whose worker died, has no result
+        and the limit it hit in limit_info. An item that raised an
+        exception has an ItemError as its result.
+
+        If task_size is given, it's called with a task to get its size,
+        and the largest of the waiting tasks is handed out first.
+        Otherwise the tasks are handed out in order. Tasks added with
+        add_task go before all of them.
+
+        Returns:
+            generator: (item, result, limit_info)
+        """
+
+        # Items handed out again after a worker is stopped and added
+        # tasks go first
+        producer = TaskProducer(tasks)
+        pending = self.pending
+        waiting = []
+        has_more_tasks = True
+
+        try:
+            while True:
+                free_workers = [
+                    worker for worker in self.workers if worker.items is None
+                ]
+
+                if free_workers and has_more_tasks:
+                    has_more_tasks = producer.take(waiting, LOOKAHEAD_TASKS)
+
+                for worker in free_workers:
+                    if pending:
+                        worker.assign(pending.popleft())
+                    elif waiting:
+                        worker.assign(list(take_next_task(waiting, task_size)))
+
+                busy_workers = [worker for worker in self.workers if worker.items]
+
+                if not busy_workers and not has_more_tasks:
+                    break
+
+                # Also wake up when a task is ready if a worker is free
+                wait_for = [worker.result_reader for worker in busy_workers]
+
+                if has_more_tasks and len(busy_workers) < len(self.workers):
+                    wait_for.append(producer.wakeup_reader)
+
+                ready = multiprocessing.connection.wait(
+                    wait_for, timeout=CHECK_INTERVAL_SECONDS
+                )
+
+                yield from self.read_results(busy_workers, ready, pending)
+        finally:
+            producer.stop()
+
+    def read_results(self, busy_workers: list, ready: list, pending):
+        """
+        Yield the results the busy workers sent and check the limits of
+        the workers that didn't send any
+
+        Returns:
+            generator: (item, result, limit_info)
+        """
+
+        for worker in busy_workers:
+            if worker.result_reader in ready:
+                message = worker.receive()
+
+                if message is None:
+                    # The worker died, so wait for its exit code
+                    worker.process.join(CHECK_INTERVAL_SECONDS)
+
+                    exitcode = worker.process.exitcode
+
+                    limit_info = {
+                        "item_index": max(
+                            worker.current_item.value, worker.number_done
+                        ),
+                        "limit": f"worker exiting with code {exitcode}",
+                        "seconds": time.time() - worker.item_start_time.value,
+                        "rss_bytes": None,
+                        "rows_read": worker.progress.value,
+                    }
+
+                    yield from self.restart_worker(worker, limit_info, pending)
+                    continue
+
+                item_index, result = message
+
+                if item_index is None:
+                    worker.items = None
+                    continue
+
+                worker.number_done = item_index + 1
+
+                yield worker.items[item_index], result, None
+
+            else:
+                limit_info = worker.get_exceeded_limit(
+                    self.time_limit_seconds, self.memory_limit_bytes
+                )
+
+                if limit_info is not None:
+                    yield from self.restart_worker(worker, limit_info, pending)
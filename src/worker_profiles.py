@@ -0,0 +1,153 @@
+"""
+Profile the worker processes of a run with cProfile, for runs with
+--profile.
+
+Each worker process profiles only the files it processes (see
+profile_file) and writes its profile to its own file in the profiles
+folder, named with its process id. The profile is written when the
+worker stops (see stop_profiling), and also every
+PROFILE_DUMP_INTERVAL_SECONDS by a timer signal, even in the middle of
+a file. So a worker killed for going past a limit only loses the
+profile of its last interval, and the file it was killed on is in the
+profile up to then. A worker started again in its place gets a new
+process id and file.
+
+The timer signal is SIGALRM, so profiling only works on Unix, and a
+profile is only written between Python bytecodes, so a long call into
+C code like a pandas read holds it up until the call returns.
+
+At the end of the run, the profiles of all the workers are merged into
+one profile and a report of the functions ranked by the time spent in
+them (see write_profile_report).
+"""
+
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import signal
+from pathlib import Path
+
+# How often a worker writes its profile while it's processing files
+PROFILE_DUMP_INTERVAL_SECONDS = 60
+
+# Number of functions listed in each ranking of the report
+NUMBER_REPORT_FUNCTIONS = 50
+
+# Profiler of this worker process and the folder its profile goes in
+profiler = None
+profiles_folder = None
+
+# Whether a file is being profiled, so the profiler is enabled again
+# after the timer writes the profile in the middle of a file
+is_profiling_file = False
+
+
+def start_profiling(folder: str):
+    """
+    Start profiling the files processed by this worker process and
+    writing its profile every PROFILE_DUMP_INTERVAL_SECONDS
+    """
+
+    global profiler, profiles_folder
+
+    profiler = cProfile.Profile()
+    profiles_folder = Path(folder)
+
+    signal.signal(signal.SIGALRM, dump_profile_on_timer)
+    interval = PROFILE_DUMP_INTERVAL_SECONDS
+    signal.setitimer(signal.ITIMER_REAL, interval, interval)
+
+
+def stop_profiling():
+    """Stop the timer and write the profile of this worker process"""
+
+    if profiler is None:
+        return
+
+    signal.setitimer(signal.ITIMER_REAL, 0)
+
+    dump_profile()
+
+
+@contextlib.contextmanager
+def profile_file():
+    """Profile the code in the with block if profiling is started"""
+
+    global is_profiling_file
+
+    if profiler is None:
+        yield
+        return
+
+    # The flag is set before the profiler is enabled and cleared before
+    # it's disabled, so the timer never leaves it enabled between files
+    is_profiling_file = True
+    profiler.enable()
+
+    try:
+        yield
+    finally:
+        is_profiling_file = False
+        profiler.disable()
+
+
+def dump_profile_on_timer(signal_number, frame):
+    dump_profile()
+
+    # Writing the profile disables the profiler
+    if is_profiling_file:
+        profiler.enable()
+
+
+def dump_profile():
+    """Write the profile of this worker process to its file"""
+
+    worker_profile_file = profiles_folder / f"worker-{os.getpid()}.prof"
+
+    # Write to a temporary file first so a worker killed while writing
+    # doesn't leave a partial profile
+    temporary_profile_file = worker_profile_file.with_suffix(".tmp")
+
+    profiler.dump_stats(temporary_profile_file)
+    os.replace(temporary_profile_file, worker_profile_file)
+
+
+def write_profile_report(
+    folder: str, report_filename: str, merged_filename: str
+) -> int:
+    """
+    Merge the profiles of the workers into one profile and write a
+    report of the functions ranked by the time spent in the function
+    itself and by the time including the functions it calls
+
+    Returns:
+        int: number_profiles
+    """
+
+    worker_profile_files = sorted(Path(folder).glob("worker-*.prof"))
+
+    if not worker_profile_files:
+        return 0
+
+    report = io.StringIO()
+
+    stats = pstats.Stats(str(worker_profile_files[0]), stream=report)
+
+    for worker_profile_file in worker_profile_files[1:]:
+        stats.add(str(worker_profile_file))
+
+    stats.dump_stats(merged_filename)
+
+    report.write(
+        f"Profiles of {len(worker_profile_files)} worker processes merged\n\n"
+    )
+
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(NUMBER_REPORT_FUNCTIONS)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(NUMBER_REPORT_FUNCTIONS)
+
+    with open(report_filename, "w") as f:
+        f.write(report.getvalue())
+
+    return len(worker_profile_files)